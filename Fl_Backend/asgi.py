@@ -13,4 +13,17 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Fl_Backend.settings')
 
-application = get_asgi_application()
+# Set Django up before importing anything that touches models
+django_asgi_application = get_asgi_application()
+
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
+
+from back_api.consumers import TokenAuthMiddleware  # noqa: E402
+from back_api.routing import websocket_urlpatterns  # noqa: E402
+
+# WebSockets authenticate with a token rather than cookies, so they need no
+# origin check against cross-site use
+application = ProtocolTypeRouter({
+    'http': django_asgi_application,
+    'websocket': TokenAuthMiddleware(URLRouter(websocket_urlpatterns)),
+})
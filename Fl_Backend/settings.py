@@ -48,7 +48,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its total covers every other middleware
+    'back_api.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'back_api.db_routers.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -67,12 +70,71 @@ CORS_ALLOW_ALL_ORIGINS = True
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'back_api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
-    ]
+    ],
+    'DEFAULT_PAGINATION_CLASS': 'back_api.pagination.IdCursorPagination',
+    'PAGE_SIZE': 100,
+}
+
+# Token -> user cache used by CachedTokenAuthentication. Switch BACKEND to
+# 'back_api.authentication.SharedTokenCache' (OPTIONS: alias, ttl) to share
+# it between worker processes through Django's cache framework.
+TOKEN_AUTH_CACHE = {
+    'BACKEND': 'back_api.authentication.LocalTokenCache',
+    'OPTIONS': {'max_size': 10000, 'ttl': 300},
+}
+
+# Seconds a teacher's cached premium status and download counts may be reused
+ENTITLEMENT_CACHE_TTL = 60
+
+# Set to e.g. {'flush_every': 50, 'flush_interval': 5.0} to count downloads
+# in memory and write them to the database in batches.
+DOWNLOAD_QUOTA_BUFFER = None
+
+# Seconds a rendered class, subject, student or class-performance response
+# may be served from the cache; writes retire entries sooner (see
+# back_api.caching). None turns the response cache off.
+RESPONSE_CACHE_TTL = 300
+
+# Live leaderboards (back_api.consumers) need a channel layer. The in-memory
+# layer only reaches consumers in the same process; use channels_redis when
+# running more than one.
+CHANNEL_LAYERS = {
+    'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'},
 }
+# Seconds a leaderboard collects score changes before pushing one update
+LEADERBOARD_UPDATE_INTERVAL = 1.0
+
+# Lower bound (in percent) of each grade, best first, used by schools without
+# a grading scheme when no default scheme has been set up either
+EXAM_GRADE_BOUNDARIES = [('A', 80), ('B', 65), ('C', 50), ('D', 40), ('E', 0)]
+
+# Seconds a user's compiled grading scheme may be reused (scheme edits retire it at once)
+GRADING_SCHEME_CACHE_TTL = 300
+
+# Send each response's SQL, authentication, serializer and total time to the
+# client in a Server-Timing header. Per-route histograms are kept either way
+# and served to staff at /metrics (see back_api.metrics).
+SERVER_TIMING = True
+# Upper bounds, in seconds, of the /metrics request duration histograms
+METRICS_DURATION_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+# Largest page a client may request with ?page_size=
+API_MAX_PAGE_SIZE = 500
+
+# Seconds a class term must go without score edits before its reports are
+# recomputed in-process. None leaves it to `manage.py refresh_reports`.
+REPORT_REFRESH_DELAY = 10
+
+# Rendered PDF report cards, named by a hash of their contents
+REPORT_CARD_CACHE_DIR = BASE_DIR / 'report_cards'
+# Processes used to render report cards; None uses every CPU
+REPORT_CARD_WORKERS = None
+# Processes used to hash passwords during bulk teacher provisioning
+PASSWORD_HASH_WORKERS = None
 
 
 ROOT_URLCONF = 'Fl_Backend.urls'
@@ -94,6 +156,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'Fl_Backend.wsgi.application'
+ASGI_APPLICATION = 'Fl_Backend.asgi.application'
 
 
 # Database
@@ -103,9 +166,20 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    },
+    # Read-only actions and analytics read from here (see back_api.db_routers).
+    # In development it is the primary file itself; production points it at
+    # a copy kept current by `manage.py sync_replica`.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+        'TEST': {'MIRROR': 'default'},
+    },
 }
 
+DATABASE_ROUTERS = ['back_api.db_routers.PrimaryReplicaRouter']
+REPLICA_DATABASE = 'replica'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
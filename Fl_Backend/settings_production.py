@@ -0,0 +1,55 @@
+"""
+Production settings for Fl_Backend.
+
+Run with DJANGO_SETTINGS_MODULE=Fl_Backend.settings_production. Everything
+not overridden here comes from settings.py.
+"""
+import os
+
+from .settings import *  # noqa: F401,F403
+
+
+SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY', SECRET_KEY)
+
+# DEBUG also keeps every executed query in connection.queries
+DEBUG = False
+
+
+# Database
+# WAL lets readers run alongside the single writer. synchronous=NORMAL is
+# durable under WAL except for the last commits on power loss. Writers wait
+# up to `timeout` seconds for the lock, and BEGIN IMMEDIATE makes them take
+# it before reading instead of failing when they try to upgrade.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,  # KiB
+    'temp_store': 'memory',
+}
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'back_api.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': 20,
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': ';'.join(
+                f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()
+            ),
+        },
+    },
+    'replica': {
+        'ENGINE': 'back_api.backends.sqlite3',
+        'NAME': BASE_DIR / 'db-replica.sqlite3',
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': 20,
+            'init_command': 'PRAGMA query_only=1',
+        },
+    },
+}
@@ -2,7 +2,7 @@ from django.contrib import admin
 from .models import (
     Teacher, Profile, Class, Subject, Exam, ExamSubject,
     Student, Score, Result, StudentReport, ClassPerformance,
-    Subscription, PaymentRecord
+    Subscription, PaymentRecord, GradingScheme, GradeBand
 )
 
 # Registering models with the admin site
@@ -19,3 +19,5 @@ admin.site.register(StudentReport)
 admin.site.register(ClassPerformance)
 admin.site.register(Subscription)
 admin.site.register(PaymentRecord)
+admin.site.register(GradingScheme)
+admin.site.register(GradeBand)
@@ -0,0 +1,108 @@
+"""
+Async read endpoints, served under ``/api/async/``.
+
+Each view mirrors the ``list`` and ``retrieve`` actions of a ViewSet. It
+reuses the ViewSet's ``get_queryset``, query plan and serializer, so rows
+and payloads match the sync endpoints, but runs the queries through the
+async ORM (``aget``, ``aiterator``). Under an ASGI server a request that
+waits on the database does not hold a worker thread.
+
+Lists are keyset paginated like ``IdCursorPagination``, but with plain
+``?after=<id>&page_size=<n>`` parameters. Responses are not cached: the
+ETag cache of ``ResponseCacheMixin`` is built on DRF's sync views.
+"""
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.views import View
+from rest_framework import exceptions
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from .authentication import CachedTokenAuthentication
+from .db_routers import ReplicaReadMixin, replica_reads
+from .pagination import IdCursorPagination
+
+
+class AsyncReadView(View):
+    """List (``pk`` absent) or retrieve rows of ``viewset_class`` asynchronously."""
+    viewset_class = None
+    # Rows fetched (and prefetched for) per round trip to the database
+    chunk_size = 100
+
+    async def get(self, request, pk=None):
+        try:
+            return await self.read(request, pk)
+        except exceptions.APIException as exc:
+            return self.handle_exception(exc)
+
+    async def read(self, request, pk):
+        user_auth = await CachedTokenAuthentication().aauthenticate(request)
+        if user_auth is None:
+            raise exceptions.NotAuthenticated()
+        # The ViewSet only needs query parameters and the user from the request
+        drf_request = Request(request)
+        drf_request.user, drf_request.auth = user_auth
+        viewset = self.viewset_class(
+            request=drf_request, args=(), kwargs={} if pk is None else {'pk': pk},
+            format_kwarg=None, action='list' if pk is None else 'retrieve',
+        )
+        viewset.check_permissions(drf_request)
+
+        if isinstance(viewset, ReplicaReadMixin) and viewset.action in viewset.replica_actions:
+            with replica_reads():
+                data = await self.read_rows(viewset, request, pk)
+        else:
+            data = await self.read_rows(viewset, request, pk)
+        return HttpResponse(JSONRenderer().render(data), content_type='application/json')
+
+    async def read_rows(self, viewset, request, pk):
+        queryset = viewset.filter_queryset(viewset.get_queryset())
+        # Building the serializer context may query (e.g. the grading scheme)
+        get_serializer = sync_to_async(viewset.get_serializer)
+        if pk is not None:
+            try:
+                instance = await queryset.aget(pk=pk)
+            except queryset.model.DoesNotExist:
+                raise exceptions.NotFound(f'No {queryset.model._meta.object_name} matches the given query.')
+            return (await get_serializer()).to_representation(instance)
+
+        page_size = self.get_page_size(request)
+        after = request.GET.get('after')
+        if after is not None:
+            try:
+                queryset = queryset.filter(pk__gt=int(after))
+            except ValueError:
+                raise exceptions.ValidationError({'after': ['A valid integer is required.']})
+
+        # The page is serialized as a whole, so list serializers can work on
+        # every row at once. The extra row only tells whether there is a next page.
+        instances, has_next = [], False
+        rows = queryset.order_by('pk')[:page_size + 1]
+        async for instance in rows.aiterator(chunk_size=min(page_size + 1, self.chunk_size)):
+            if len(instances) == page_size:
+                has_next = True
+                continue
+            instances.append(instance)
+        next_url = None
+        if has_next:
+            next_url = replace_query_param(request.build_absolute_uri(), 'after', instances[-1].pk)
+        return {'next': next_url, 'results': (await get_serializer(many=True)).to_representation(instances)}
+
+    def get_page_size(self, request):
+        paginator = IdCursorPagination
+        try:
+            page_size = int(request.GET[paginator.page_size_query_param])
+        except (KeyError, ValueError):
+            return api_settings.PAGE_SIZE
+        return min(page_size, paginator.max_page_size) if page_size > 0 else api_settings.PAGE_SIZE
+
+    def handle_exception(self, exc):
+        response = HttpResponse(
+            JSONRenderer().render(exc.detail if isinstance(exc.detail, dict) else {'detail': exc.detail}),
+            content_type='application/json', status=exc.status_code,
+        )
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            response['WWW-Authenticate'] = CachedTokenAuthentication.keyword
+        return response
@@ -0,0 +1,226 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db.models import DEFERRED, Subquery
+from django.utils.module_loading import import_string
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication, get_authorization_header
+from rest_framework.authtoken.models import Token
+
+from .metrics import timed
+from .models import Teacher
+
+# The only user fields cached with a token (see CachedTokenAuthentication)
+CACHED_USER_FIELDS = ('id', 'is_active', 'is_staff')
+
+
+class LocalTokenCache:
+    """
+    In-process LRU cache of token key -> (user fields, teacher id) with a TTL.
+
+    Invalidation signals only reach the process that made the change, so
+    with several worker processes the TTL bounds how long a deleted token
+    or deactivated user may still authenticate elsewhere. Use
+    ``SharedTokenCache`` when that window must be closed.
+    """
+
+    def __init__(self, max_size=10000, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    async def aget(self, key):
+        return self.get(key)
+
+    async def aset(self, key, value):
+        self.set(key, value)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SharedTokenCache:
+    """Token cache kept in one of Django's cache backends (e.g. Redis, Memcached)."""
+
+    # Bumped whenever the entry format changes, so older entries are never read
+    version = 2
+
+    def __init__(self, alias='default', ttl=300, prefix='auth-token:'):
+        self.alias = alias
+        self.ttl = ttl
+        self.prefix = prefix
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get(self, key):
+        return self.cache.get(self.prefix + key, version=self.version)
+
+    def set(self, key, value):
+        self.cache.set(self.prefix + key, value, self.ttl, version=self.version)
+
+    def delete(self, key):
+        self.cache.delete(self.prefix + key, version=self.version)
+
+    async def aget(self, key):
+        return await self.cache.aget(self.prefix + key, version=self.version)
+
+    async def aset(self, key, value):
+        await self.cache.aset(self.prefix + key, value, self.ttl, version=self.version)
+
+
+_token_cache = None
+_token_cache_lock = threading.Lock()
+
+
+def get_token_cache():
+    global _token_cache
+    if _token_cache is None:
+        with _token_cache_lock:
+            if _token_cache is None:
+                config = getattr(settings, 'TOKEN_AUTH_CACHE', {})
+                backend = import_string(
+                    config.get('BACKEND', 'back_api.authentication.LocalTokenCache')
+                )
+                _token_cache = backend(**config.get('OPTIONS', {}))
+    return _token_cache
+
+
+def invalidate_tokens(keys):
+    cache = get_token_cache()
+    for key in keys:
+        cache.delete(key)
+
+
+def invalidate_user_tokens(user_id):
+    invalidate_tokens(Token.objects.filter(user_id=user_id).values_list('key', flat=True))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Drop-in replacement for ``TokenAuthentication`` that caches the token's
+    user id, ``is_active``, ``is_staff`` and teacher id, so a warm request
+    authenticates without queries.
+
+    Entries are evicted by signals when a token is deleted or its user or
+    teacher is saved (which covers deactivation).
+    """
+
+    def authenticate(self, request):
+        with timed('auth'):
+            return super().authenticate(request)
+
+    def authenticate_credentials(self, key):
+        cache = get_token_cache()
+        cached = cache.get(key)
+        if cached is None:
+            try:
+                token = Token.objects.select_related('user__teacher_profile').get(key=key)
+            except Token.DoesNotExist:
+                raise exceptions.AuthenticationFailed('Invalid token.')
+            cached = self.get_cache_entry(token)
+            cache.set(key, cached)
+        return self.get_user_and_token(key, cached)
+
+    async def aauthenticate(self, request):
+        """``authenticate`` for async views, which get a plain Django request."""
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed('Invalid token header.')
+        try:
+            key = auth[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed(
+                'Invalid token header. Token string should not contain invalid characters.'
+            )
+        with timed('auth'):
+            return await self.aauthenticate_credentials(key)
+
+    async def aauthenticate_credentials(self, key):
+        cache = get_token_cache()
+        cached = await cache.aget(key)
+        if cached is None:
+            try:
+                token = await Token.objects.select_related('user__teacher_profile').aget(key=key)
+            except Token.DoesNotExist:
+                raise exceptions.AuthenticationFailed('Invalid token.')
+            cached = self.get_cache_entry(token)
+            await cache.aset(key, cached)
+        return self.get_user_and_token(key, cached)
+
+    def get_cache_entry(self, token):
+        # Plain values only: the password hash and the rest of the user stay
+        # out of the cache, which may be shared between processes
+        teacher = getattr(token.user, 'teacher_profile', None)
+        return (
+            {field: getattr(token.user, field) for field in CACHED_USER_FIELDS},
+            teacher.id if teacher is not None else None,
+        )
+
+    def get_user_and_token(self, key, cached):
+        fields, teacher_id = cached
+        # Any other field is fetched when first read, and saving the user
+        # writes only the fields that were loaded
+        model = get_user_model()
+        user = model.from_db(None, list(fields), [
+            fields.get(field.attname, DEFERRED) for field in model._meta.concrete_fields
+        ])
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+        user.cached_teacher_id = teacher_id
+        return user, Token(key=key, user=user)
+
+
+def get_request_teacher_id(request):
+    """
+    The requesting user's teacher id, for filtering owned rows without
+    joining through ``teacher__user``.
+
+    Users authenticated by ``CachedTokenAuthentication`` carry the id; for
+    any other user a subquery is returned, which still avoids a round trip.
+    """
+    user = request.user
+    teacher_id = getattr(user, 'cached_teacher_id', None)
+    if teacher_id is not None:
+        return teacher_id
+    return Subquery(Teacher.objects.filter(user_id=user.id).values('id')[:1])
+
+
+def fetch_request_teacher_id(request):
+    """The requesting user's teacher id as a value, querying only if not cached."""
+    teacher_id = getattr(request.user, 'cached_teacher_id', None)
+    if teacher_id is not None:
+        return teacher_id
+    return Teacher.objects.filter(user_id=request.user.id).values_list('id', flat=True).first()
@@ -0,0 +1,31 @@
+"""
+SQLite backend with the ``init_command`` and ``transaction_mode`` options
+that Django 5.1 adds to its own, so that production can tune connections
+on Django 5.0. Once on 5.1, point ENGINE back at
+``django.db.backends.sqlite3``; the OPTIONS keep working unchanged.
+"""
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        self.init_command = kwargs.pop('init_command', None)
+        self.transaction_mode = kwargs.pop('transaction_mode', None)
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for statement in (self.init_command or '').split(';'):
+            if statement.strip():
+                conn.execute(statement)
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so a transaction that
+        # reads before it writes waits on busy_timeout instead of failing with
+        # "database is locked" when it tries to upgrade its lock.
+        if self.transaction_mode is None:
+            super()._start_transaction_under_autocommit()
+        else:
+            self.cursor().execute(f'BEGIN {self.transaction_mode}')
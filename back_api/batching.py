@@ -0,0 +1,59 @@
+"""
+Work deferred until the transaction commits, merged across its writes.
+
+``transaction.on_commit`` runs each callback it is given, so a signal
+handler that defers a refresh for each saved row repeats it for every row
+of a burst. ``on_commit_batch`` registers a callback per call as usual, but
+the first of them to run handles the keys of every later call as well, and
+those callbacks then have nothing left to do.
+"""
+from django.db import transaction
+
+
+def on_commit_batch(func, keys, using=None):
+    """
+    Call ``func`` with the set of every key passed for it in the current
+    transaction, once that commits. Outside a transaction it runs at once.
+
+    Keys added inside a savepoint that was later rolled back can still reach
+    ``func`` along with the others, so it should recompute from the database
+    rather than apply changes.
+    """
+    keys = set(keys)
+    if not keys:
+        return
+    connection = transaction.get_connection(using)
+    if not hasattr(connection, 'commit_batches'):
+        connection.commit_batches = {}
+    batch = connection.commit_batches.get(func)
+    # Django replaces the callback list when a transaction ends
+    if batch is None or batch.callbacks is not connection.run_on_commit:
+        batch = connection.commit_batches[func] = _Batch(func, connection.run_on_commit)
+    call = _BatchCall(batch, keys)
+    batch.calls.append(call)
+    transaction.on_commit(call, using=using)
+
+
+class _Batch:
+    def __init__(self, func, callbacks):
+        self.func = func
+        self.callbacks = callbacks
+        self.calls = []
+
+
+class _BatchCall:
+    def __init__(self, batch, keys):
+        self.batch = batch
+        self.keys = keys
+
+    def __call__(self):
+        calls = self.batch.calls
+        for index, call in enumerate(calls):
+            if call is self:
+                break
+        else:
+            return  # run along with an earlier call
+        # Later calls' callbacks run after this one, so they are taken too
+        keys = set().union(*(call.keys for call in calls[index:]))
+        del calls[index:]
+        self.batch.func(keys)
@@ -0,0 +1,163 @@
+from contextlib import contextmanager
+
+from django.db import transaction
+
+from .caching import invalidate_exam_results
+from .dashboard import refresh_teacher_summaries_on_commit
+from .leaderboard import publish_score_changes
+from .models import ExamSubject, Score, Student
+from .reports import mark_exams_stale, mark_stale
+from .serializers import BulkScoreRowSerializer
+
+
+BULK_BATCH_SIZE = 500
+
+
+def bulk_upsert_scores(exam, rows):
+    """
+    Insert or update a whole exam's marks in one transaction.
+
+    ``rows`` is a list of ``{"student", "exam_subject", "marks_obtained"}``
+    dicts, one per cell of the exam's marks matrix. Every row is validated
+    in memory against data fetched up front (the exam's subjects, the
+    class's students and the existing scores), so the number of queries does
+    not depend on the number of rows. Invalid rows are reported and skipped;
+    valid rows are still written.
+    """
+    exam_subjects = {
+        es.id: es for es in ExamSubject.objects.filter(exam=exam)
+    }
+
+    parsed = []
+    student_ids = set()
+    for index, row in enumerate(rows):
+        serializer = BulkScoreRowSerializer(data=row)
+        if serializer.is_valid():
+            parsed.append((index, serializer.validated_data, None))
+            student_ids.add(serializer.validated_data['student'])
+        else:
+            parsed.append((index, None, serializer.errors))
+
+    class_students = set(
+        Student.objects.filter(
+            class_instance_id=exam.class_instance_id, id__in=student_ids
+        ).values_list('id', flat=True)
+    )
+    existing = {
+        (score.student_id, score.exam_subject_id): score
+        for score in Score.objects.filter(
+            exam_subject__exam=exam, student_id__in=class_students
+        )
+    }
+
+    results = []
+    to_create, to_update = [], []
+    seen = set()
+    for index, data, errors in parsed:
+        if errors:
+            results.append({'index': index, 'status': 'error', 'errors': errors})
+            continue
+
+        errors = {}
+        exam_subject = exam_subjects.get(data['exam_subject'])
+        if exam_subject is None:
+            errors['exam_subject'] = ['Exam subject does not belong to this exam.']
+        if data['student'] not in class_students:
+            errors['student'] = ["Student is not in this exam's class."]
+        marks = data.get('marks_obtained')
+        if (
+            exam_subject is not None and marks is not None
+            and exam_subject.max_marks is not None
+            and marks > exam_subject.max_marks
+        ):
+            errors['marks_obtained'] = [
+                f'Ensure this value is less than or equal to {exam_subject.max_marks}.'
+            ]
+        key = (data['student'], data['exam_subject'])
+        if not errors and key in seen:
+            errors['non_field_errors'] = ['Duplicate row for this student and exam subject.']
+        if errors:
+            results.append({'index': index, 'status': 'error', 'errors': errors})
+            continue
+        seen.add(key)
+
+        score = existing.get(key)
+        if score is None:
+            score = Score(
+                student_id=data['student'],
+                exam_subject_id=data['exam_subject'],
+                marks_obtained=marks,
+            )
+            to_create.append(score)
+            results.append({'index': index, 'status': 'created', 'score': score})
+        else:
+            score.marks_obtained = marks
+            to_update.append(score)
+            results.append({'index': index, 'status': 'updated', 'score': score})
+
+    with transaction.atomic():
+        Score.objects.bulk_create(to_create, batch_size=BULK_BATCH_SIZE)
+        Score.objects.bulk_update(
+            to_update, ['marks_obtained'], batch_size=BULK_BATCH_SIZE
+        )
+        # bulk_create/bulk_update bypass the Score signals
+        if to_create or to_update:
+            mark_exams_stale([exam.id])
+            invalidate_exam_results(exam.id)
+            refresh_teacher_summaries_on_commit([exam.teacher_id])
+            publish_score_changes(
+                (score.student_id, score.exam_subject_id, score.marks_obtained)
+                for score in to_create + to_update
+            )
+
+    for result in results:
+        score = result.pop('score', None)
+        if score is not None:
+            result['id'] = score.id
+
+    return {
+        'created': len(to_create),
+        'updated': len(to_update),
+        'errors': len(results) - len(to_create) - len(to_update),
+        'results': results,
+    }
+
+
+def propagate_score_changes(changes, exam_subjects):
+    """
+    Update what is derived from ``(student_id, exam_subject_id, marks)``
+    score changes: the stale reports of their class terms, the cached exam
+    results and the live leaderboards. Dashboard summaries are left to the
+    caller, as most edits do not change them. ``exam_subjects`` maps ids to
+    exam subjects with their exam selected.
+    """
+    exams = {exam_subject.exam_id: exam_subject.exam for exam_subject in exam_subjects.values()}
+    if not exams:
+        return
+    mark_stale((exam.class_instance_id, exam.term, exam.year) for exam in exams.values())
+    invalidate_exam_results(*exams)
+    publish_score_changes(changes, exam_subjects)
+
+
+@contextmanager
+def deleting_scores(scores):
+    """
+    Propagate the deletion of ``scores`` once for the whole set, around a
+    delete that removes them by cascade.
+
+    The Score signals skip cascaded rows, so deleting a student or an exam
+    costs two queries here rather than several per score.
+    """
+    exam_subjects = ExamSubject.objects.select_related('exam').filter(
+        pk__in=scores.values('exam_subject_id')
+    ).in_bulk()
+    changes = [
+        (student_id, exam_subject_id, None)
+        for student_id, exam_subject_id in scores.values_list('student_id', 'exam_subject_id')
+    ]
+    with transaction.atomic():
+        yield
+        propagate_score_changes(changes, exam_subjects)
+        refresh_teacher_summaries_on_commit(
+            {exam_subject.exam.teacher_id for exam_subject in exam_subjects.values()}
+        )
@@ -0,0 +1,158 @@
+"""
+Response cache for data that is read far more often than it changes.
+
+Cached responses are keyed by path, query string, user, renderer and two
+generation counters: one for the requesting user's own data and one for
+data shared by everyone (subjects). A write bumps the counter of the
+teacher whose data it touched, which retires every cached response built
+from the old data at once. The key doubles as the response's ETag, so a
+client revalidating an unchanged response gets ``304 Not Modified``
+before any query or serializer runs.
+
+Download counters are the exception: they change with set-based updates on
+every download, and the entitlement endpoint is where they are read, so a
+teacher nested in a cached response may show them up to RESPONSE_CACHE_TTL
+old.
+
+Generation counters live in Django's default cache. With several worker
+processes it must be a shared backend (Redis, Memcached); with the
+per-process LocMem default, other workers only notice a write after
+RESPONSE_CACHE_TTL.
+"""
+import hashlib
+import time
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from .db_routers import primary_reads
+from .models import Teacher
+
+
+SHARED = 'shared'
+
+
+def _generation_key(scope):
+    return f'response-generation:{scope}'
+
+
+def get_generations(user_id):
+    return _get_generations([SHARED, f'user:{user_id}'])
+
+
+def _get_generations(scopes):
+    keys = [_generation_key(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            # Start from the clock, not 0, so a counter that was evicted
+            # cannot come back at a value some old response was cached under
+            cache.add(key, time.time_ns(), None)
+            found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+
+def _bump(keys):
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+
+def _invalidate(scopes):
+    keys = [_generation_key(scope) for scope in scopes]
+    _bump(keys)
+    # Bump again once the write commits: a response cached in between may
+    # have been built from the data as it was before the transaction
+    transaction.on_commit(partial(_bump, keys))
+
+
+def invalidate_user_responses(*user_ids):
+    _invalidate(f'user:{user_id}' for user_id in set(user_ids))
+
+
+def invalidate_teacher_responses(*teacher_ids):
+    owners = Teacher.objects.filter(pk__in=teacher_ids).values_list('user_id', flat=True)
+    invalidate_user_responses(*owners)
+
+
+def invalidate_class_responses(*class_ids):
+    owners = Teacher.objects.filter(classes__in=class_ids).values_list('user_id', flat=True)
+    invalidate_user_responses(*owners)
+
+
+def invalidate_shared_responses():
+    _invalidate([SHARED])
+
+
+def get_exam_generations(exam_id):
+    """Counters for data derived from one exam's scores (plus shared data)."""
+    return _get_generations([SHARED, f'exam:{exam_id}'])
+
+
+def invalidate_exam_results(*exam_ids):
+    _invalidate(f'exam:{exam_id}' for exam_id in set(exam_ids))
+
+
+class ResponseCacheMixin:
+    """
+    Cache the rendered responses of ``cached_actions`` for non-staff users.
+
+    Staff responses span every teacher's data and are never cached. Cache
+    misses read from the primary even in ``ReplicaReadMixin`` actions.
+    """
+    cached_actions = ('list', 'retrieve')
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def get_response_cache_key(self, request):
+        if not getattr(settings, 'RESPONSE_CACHE_TTL', None) or request.user.is_staff:
+            return None
+        if self.action not in self.cached_actions:
+            return None
+        parts = [
+            request.get_full_path(), request.user.id, request.accepted_renderer.format,
+            *get_generations(request.user.id),
+        ]
+        return hashlib.sha256('|'.join(map(str, parts)).encode()).hexdigest()
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        key = self.get_response_cache_key(request)
+        if key is None:
+            return handler(request, *args, **kwargs)
+        etag = f'"{key}"'
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        cached = cache.get(f'response:{key}')
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type, headers={'ETag': etag})
+        # Built from the primary: a read from a lagging replica would be cached
+        # under the current generations and served as fresh until the TTL
+        with primary_reads():
+            response = handler(request, *args, **kwargs)
+        response['ETag'] = etag
+        self.response_cache_key = key
+        return response
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        key = getattr(self, 'response_cache_key', None)
+        if key is not None and response.status_code == status.HTTP_200_OK:
+            response.render()
+            cache.set(
+                f'response:{key}', (response.content, response['Content-Type']),
+                settings.RESPONSE_CACHE_TTL,
+            )
+        return response
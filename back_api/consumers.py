@@ -0,0 +1,113 @@
+import asyncio
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from channels.middleware import BaseMiddleware
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from rest_framework import exceptions
+
+from .authentication import CachedTokenAuthentication
+from .leaderboard import Leaderboard, class_term_group, exam_group
+from .models import Class, Exam
+from .serializers import TermSerializer
+
+
+def get_query_params(scope):
+    return {name: values[-1] for name, values in parse_qs(scope['query_string'].decode()).items()}
+
+
+class TokenAuthMiddleware(BaseMiddleware):
+    """
+    Authenticate WebSocket connections by their ``?token=`` parameter;
+    clients cannot set an Authorization header on them.
+    """
+
+    async def __call__(self, scope, receive, send):
+        scope = dict(scope, user=AnonymousUser())
+        key = get_query_params(scope).get('token')
+        if key:
+            try:
+                scope['user'], _ = await CachedTokenAuthentication().aauthenticate_credentials(key)
+            except exceptions.AuthenticationFailed:
+                pass
+        return await super().__call__(scope, receive, send)
+
+
+# Leaderboard Consumer
+class LeaderboardConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Push the rankings of an exam (``ws/exams/<id>/leaderboard/``) or a class
+    term (``ws/classes/<id>/leaderboard/?term=&year=``).
+
+    A ``snapshot`` of every ranking is sent on connect. After that, score
+    changes are collected for LEADERBOARD_UPDATE_INTERVAL seconds and sent as
+    a single ``update`` carrying the latest marks and only the rankings that
+    changed, however many writes the window saw.
+    """
+    groups = []
+
+    async def connect(self):
+        user = self.scope['user']
+        if not user.is_authenticated:
+            await self.close(code=4401)
+            return
+        self.group = await database_sync_to_async(self.get_group)(user)
+        if self.group is None:
+            await self.close(code=4404)
+            return
+        self.pending, self.flush_task = {}, None
+        # Join before loading, so no change can fall between the two
+        self.groups = [self.group]
+        await self.channel_layer.group_add(self.group, self.channel_name)
+        self.leaderboard = await database_sync_to_async(self.load_leaderboard)()
+        await self.accept()
+        await self.send_json({'type': 'snapshot', 'rankings': self.leaderboard.rankings()})
+
+    def get_group(self, user):
+        kwargs = self.scope['url_route']['kwargs']
+        if 'exam_id' in kwargs:
+            exams = Exam.objects.filter(pk=kwargs['exam_id'])
+            if not user.is_staff:
+                exams = exams.filter(teacher_id=user.cached_teacher_id)
+            return exam_group(kwargs['exam_id']) if exams.exists() else None
+
+        serializer = TermSerializer(data=get_query_params(self.scope))
+        if not serializer.is_valid():
+            return None
+        self.term, self.year = serializer.validated_data['term'], serializer.validated_data['year']
+        classes = Class.objects.filter(pk=kwargs['class_id'])
+        if not user.is_staff:
+            classes = classes.filter(teacher_id=user.cached_teacher_id)
+        return class_term_group(kwargs['class_id'], self.term, self.year) if classes.exists() else None
+
+    def load_leaderboard(self):
+        kwargs = self.scope['url_route']['kwargs']
+        if 'exam_id' in kwargs:
+            return Leaderboard.for_exam(kwargs['exam_id'])
+        return Leaderboard.for_class_term(kwargs['class_id'], self.term, self.year)
+
+    async def disconnect(self, code):
+        if getattr(self, 'flush_task', None) is not None:
+            self.flush_task.cancel()
+
+    async def scores_changed(self, event):
+        for student_id, exam_subject_id, marks, max_marks in event['scores']:
+            self.pending[student_id, exam_subject_id] = [student_id, exam_subject_id, marks, max_marks]
+        if self.flush_task is None:
+            self.flush_task = asyncio.create_task(self.flush_later())
+
+    async def flush_later(self):
+        await asyncio.sleep(getattr(settings, 'LEADERBOARD_UPDATE_INTERVAL', 1.0))
+        scores, self.pending, self.flush_task = list(self.pending.values()), {}, None
+        rankings, removed = self.leaderboard.update(scores)
+        await self.send_json({
+            'type': 'update',
+            'scores': [
+                {'student': student_id, 'exam_subject': exam_subject_id, 'marks_obtained': marks}
+                for student_id, exam_subject_id, marks, _ in scores
+            ],
+            'rankings': sorted(rankings, key=lambda row: (row['rank'], row['student'])),
+            'removed': removed,
+        })
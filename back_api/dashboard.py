@@ -0,0 +1,121 @@
+"""
+Per-teacher dashboard summaries (see models.TeacherSummary).
+
+Each summary is recomputed from scratch rather than adjusted by deltas: a
+single aggregate query counts a teacher's classes, students, exams and
+missing marks, a second reads their latest payments, and the row is
+upserted. The signals in signals.py run this once their transaction
+commits, for every teacher its writes touched at once, so the dashboard
+itself is a single row lookup.
+"""
+from collections import defaultdict
+
+from django.db.models import Count, F, OuterRef, Q, Subquery, Value, Window
+from django.db.models.functions import Coalesce, RowNumber
+
+from .batching import on_commit_batch
+from .models import Class, Exam, ExamSubject, PaymentRecord, Score, Student, Teacher, TeacherSummary
+
+
+RECENT_PAYMENTS = 5
+
+SUMMARY_FIELDS = [
+    'class_count', 'student_count', 'exam_count', 'pending_score_count',
+    'is_premium', 'subscription_end_date', 'recent_payments',
+]
+
+
+def _count(queryset, teacher_field, counted='pk'):
+    """A correlated ``COUNT`` of ``queryset`` rows belonging to the outer teacher."""
+    return Coalesce(Subquery(
+        queryset.filter(**{teacher_field: OuterRef('pk')}).order_by().values(teacher_field).annotate(
+            count=Count(counted)
+        ).values('count')
+    ), Value(0))
+
+
+def refresh_teacher_summaries(teacher_ids):
+    """
+    Recompute the summaries of ``teacher_ids``, a list of ids or a
+    ``values()`` queryset of them. Unknown teachers are ignored.
+    """
+    teachers = Teacher.objects.filter(pk__in=teacher_ids).annotate(
+        class_count=_count(Class.objects.all(), 'teacher'),
+        student_count=_count(Student.objects.all(), 'class_instance__teacher'),
+        exam_count=_count(Exam.objects.all(), 'teacher'),
+        # One cell per exam subject and student of the exam's class
+        cell_count=_count(ExamSubject.objects.all(), 'exam__teacher', 'exam__class_instance__students'),
+        marked_count=_count(
+            Score.objects.filter(
+                marks_obtained__isnull=False,
+                student__class_instance=F('exam_subject__exam__class_instance'),
+            ),
+            'exam_subject__exam__teacher',
+        ),
+    ).values_list(
+        'id', 'user_id', 'is_premium', 'subscription_end_date',
+        'class_count', 'student_count', 'exam_count', 'cell_count', 'marked_count',
+    )
+    teachers = list(teachers)
+    if not teachers:
+        return
+
+    payments = {}
+    for row in PaymentRecord.objects.filter(teacher_id__in=[row[1] for row in teachers]).annotate(
+        position=Window(RowNumber(), partition_by=F('teacher_id'), order_by=[F('timestamp').desc(), F('id').desc()]),
+    ).filter(position__lte=RECENT_PAYMENTS).order_by('teacher_id', 'position').values(
+        'teacher_id', 'id', 'amount', 'transaction_id', 'status', 'timestamp',
+    ):
+        payments.setdefault(row.pop('teacher_id'), []).append(row)
+
+    TeacherSummary.objects.bulk_create(
+        [
+            TeacherSummary(
+                teacher_id=teacher_id, class_count=classes, student_count=students, exam_count=exams,
+                pending_score_count=max(cells - marked, 0), is_premium=is_premium,
+                subscription_end_date=end_date, recent_payments=payments.get(user_id, []),
+            )
+            for teacher_id, user_id, is_premium, end_date, classes, students, exams, cells, marked in teachers
+        ],
+        update_conflicts=True,
+        unique_fields=['teacher'],
+        update_fields=SUMMARY_FIELDS + ['updated'],
+    )
+
+
+def refresh_teacher_summaries_on_commit(teacher_ids=(), *, class_ids=(), exam_ids=(), user_ids=()):
+    """
+    Refresh summaries once the transaction commits, together with every
+    other refresh requested in it. Teachers are given by id or through their
+    classes, exams or users, which are resolved at commit in one query.
+    """
+    on_commit_batch(_refresh_owners, [
+        *(('teacher', pk) for pk in teacher_ids),
+        *(('class', pk) for pk in class_ids),
+        *(('exam', pk) for pk in exam_ids),
+        *(('user', pk) for pk in user_ids),
+    ])
+
+
+def _refresh_owners(owners):
+    ids = defaultdict(set)
+    for kind, pk in owners:
+        ids[kind].add(pk)
+    teachers = Q(pk__in=ids['teacher']) | Q(user_id__in=ids['user'])
+    if ids['class']:
+        teachers |= Q(pk__in=Class.objects.filter(pk__in=ids['class']).values('teacher_id'))
+    if ids['exam']:
+        teachers |= Q(pk__in=Exam.objects.filter(pk__in=ids['exam']).values('teacher_id'))
+    refresh_teacher_summaries(Teacher.objects.filter(teachers).values('pk'))
+
+
+def get_teacher_summary(teacher_id):
+    """
+    A teacher's summary row, built on first read for teachers that have none
+    yet (those provisioned in bulk, or created before summaries existed).
+    """
+    summary = TeacherSummary.objects.filter(teacher_id=teacher_id).first()
+    if summary is None:
+        refresh_teacher_summaries([teacher_id])
+        summary = TeacherSummary.objects.filter(teacher_id=teacher_id).first()
+    return summary
@@ -0,0 +1,155 @@
+"""
+Primary/replica routing.
+
+Writes always go to the default database. Reads go to the replica only
+inside ``replica_reads()`` (entered by ``ReplicaReadMixin`` for read-only
+ViewSet actions), and only until the first write of the request, after
+which the request reads its own writes from the primary. Without a
+separate ``REPLICA_DATABASE`` every read stays on the primary.
+"""
+import sqlite3
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.permissions import SAFE_METHODS
+
+
+_use_replica = ContextVar('use_replica', default=False)
+_pinned_to_primary = ContextVar('pinned_to_primary', default=False)
+
+
+def get_replica_alias():
+    alias = getattr(settings, 'REPLICA_DATABASE', 'replica')
+    if alias not in connections.settings:
+        return None
+    # A replica on the primary's own file (development, test mirrors) buys nothing
+    name = str(connections[alias].settings_dict['NAME'])
+    if name == str(connections[DEFAULT_DB_ALIAS].settings_dict['NAME']):
+        return None
+    return alias
+
+
+@contextmanager
+def replica_reads():
+    """Route reads in this block to the replica, e.g. for analytics jobs."""
+    token = _use_replica.set(True)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+@contextmanager
+def primary_reads():
+    """Route reads in this block to the primary, e.g. for results that get cached."""
+    token = _use_replica.set(False)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+@contextmanager
+def routing_scope():
+    """Start from a clean routing state, restored on exit."""
+    replica, pinned = _use_replica.set(False), _pinned_to_primary.set(False)
+    try:
+        yield
+    finally:
+        _use_replica.reset(replica)
+        _pinned_to_primary.reset(pinned)
+
+
+def copy_sqlite_database(source_path, target_path):
+    """Copy a live SQLite database with the online backup API."""
+    source = sqlite3.connect(source_path, uri=str(source_path).startswith('file:'))
+    target = sqlite3.connect(target_path, uri=str(target_path).startswith('file:'))
+    try:
+        source.backup(target)
+    finally:
+        source.close()
+        target.close()
+
+
+def sync_replica():
+    """
+    Bring the replica file up to date with the primary.
+
+    Stands in for real replication on SQLite deployments. Returns False when
+    the replica is the primary file itself (as in development).
+    """
+    alias = getattr(settings, 'REPLICA_DATABASE', 'replica')
+    if alias not in connections.settings:
+        raise ImproperlyConfigured(f'No {alias!r} database is configured.')
+    replica = get_replica_alias()
+    if replica is None:
+        return False
+    copy_sqlite_database(
+        connections[DEFAULT_DB_ALIAS].settings_dict['NAME'],
+        connections[replica].settings_dict['NAME'],
+    )
+    return True
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replica = get_replica_alias()
+        if replica and _use_replica.get() and not _pinned_to_primary.get():
+            return replica
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        _pinned_to_primary.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, get_replica_alias()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        # The replica is a copy of the primary, schema included
+        if db == get_replica_alias():
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """Keep one request's routing state from leaking into the next."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with routing_scope():
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        with routing_scope():
+            return await self.get_response(request)
+
+
+class ReplicaReadMixin:
+    """
+    Serve ``replica_actions`` from the replica for safe methods.
+
+    Authentication and permission checks run first and stay on the primary,
+    so a token created moments ago is found before the replica catches up.
+    """
+    replica_actions = ('list', 'retrieve')
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS and self.action in self.replica_actions:
+            _use_replica.set(True)
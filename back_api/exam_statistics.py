@@ -0,0 +1,99 @@
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from .caching import get_exam_generations
+from .db_routers import primary_reads
+from .grading import to_percentages
+from .models import ExamSubject
+
+
+PERCENTILES = (10, 25, 75, 90)
+
+
+def load_exam_marks(exam_id):
+    """
+    Every subject of an exam with its marks as percentages, in one query.
+
+    Returns the subject rows ``(exam_subject_id, subject_id, name,
+    max_marks)`` in id order and, aligned with them, an array of percentages
+    per subject. Subjects without a maximum are taken to be out of 100.
+    """
+    rows = ExamSubject.objects.filter(exam_id=exam_id).order_by('id').values_list(
+        'id', 'subject_id', 'subject__name', 'max_marks', 'scores__marks_obtained',
+    )
+    subjects = {}
+    ids, marks, max_marks = [], [], []
+    for exam_subject_id, subject_id, name, maximum, mark in rows:
+        subjects.setdefault(exam_subject_id, (exam_subject_id, subject_id, name, maximum))
+        if mark is not None:
+            ids.append(exam_subject_id)
+            marks.append(mark)
+            max_marks.append(maximum if maximum else np.nan)
+
+    ids = np.array(ids, dtype=np.int64)
+    percent = to_percentages(marks, max_marks)
+    # Sort by subject, then mark, and cut the array at each subject
+    order = np.lexsort((percent, ids))
+    ids, percent = ids[order], percent[order]
+    starts = np.searchsorted(ids, list(subjects), side='left')
+    ends = np.searchsorted(ids, list(subjects), side='right')
+    return list(subjects.values()), [percent[start:end] for start, end in zip(starts, ends)]
+
+
+def describe(percent, scheme):
+    """Summary statistics of one subject's sorted percentages."""
+    labels = [label for label, _ in scheme.boundaries]
+    if not len(percent):
+        return {'count': 0, 'grades': dict.fromkeys(labels, 0)}
+    # Bands ascend; grades are listed best first. Marks below the lowest band go uncounted
+    bands = scheme.band_indexes(percent)
+    counts = np.bincount(bands[bands >= 0], minlength=len(labels))[::-1]
+    quantiles = np.percentile(percent, PERCENTILES)
+    return {
+        'count': len(percent),
+        'mean': round(float(percent.mean()), 2),
+        'median': round(float(np.median(percent)), 2),
+        'std': round(float(percent.std()), 2),
+        'min': round(float(percent[0]), 2),
+        'max': round(float(percent[-1]), 2),
+        'percentiles': {f'p{p}': round(float(q), 2) for p, q in zip(PERCENTILES, quantiles)},
+        'grades': dict(zip(labels, counts.tolist())),
+    }
+
+
+def compute_exam_statistics(exam_id, scheme):
+    subjects, marks = load_exam_marks(exam_id)
+    return {
+        'exam': exam_id,
+        'grade_boundaries': dict(scheme.boundaries),
+        'subjects': [
+            {
+                'exam_subject': exam_subject_id, 'subject': subject_id, 'name': name,
+                'max_marks': max_marks, **describe(percent, scheme),
+            }
+            for (exam_subject_id, subject_id, name, max_marks), percent in zip(subjects, marks)
+        ],
+    }
+
+
+def get_exam_statistics(exam_id, scheme):
+    """
+    Per-subject statistics of an exam's marks, normalised to percentages and
+    counted into the grades of ``scheme`` (see grading.py).
+
+    Cached for RESPONSE_CACHE_TTL seconds, or until a score, subject or exam
+    subject of the exam changes (see ``caching.invalidate_exam_results``) or
+    the grading scheme does. Cache misses are computed from the primary.
+    """
+    ttl = getattr(settings, 'RESPONSE_CACHE_TTL', None)
+    if not ttl:
+        return compute_exam_statistics(exam_id, scheme)
+    key = 'exam-statistics:{}:{}:{}:{}'.format(exam_id, *get_exam_generations(exam_id), scheme.key)
+    statistics = cache.get(key)
+    if statistics is None:
+        # A lagging replica's marks would be cached as current
+        with primary_reads():
+            statistics = compute_exam_statistics(exam_id, scheme)
+        cache.set(key, statistics, ttl)
+    return statistics
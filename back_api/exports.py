@@ -0,0 +1,125 @@
+import csv
+import tempfile
+
+from django.db import router
+from django.db.models import F, FilteredRelation, FloatField, IntegerField, Q, Value
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils.text import slugify
+from openpyxl import Workbook
+
+from .models import ExamSubject, Student
+
+
+ITERATOR_CHUNK_SIZE = 2000
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+def marksheet_columns(exam_subjects, with_exam=False):
+    """One column per exam subject, optionally prefixed with the exam name."""
+    return [
+        f'{es.exam.name} - {es.subject.name}' if with_exam else es.subject.name
+        for es in exam_subjects
+    ]
+
+
+def marksheet_rows(exam_subjects, students, with_exam=False):
+    """
+    Yield the header and then one row per student of the ``students``
+    roster, with blanks where they have no mark.
+
+    The roster is read left-joined to its scores with a server-side iterator
+    ordered by student, so only the student currently being assembled is
+    held in memory.
+    """
+    yield ['Assessment No', 'First Name', 'Last Name'] + marksheet_columns(exam_subjects, with_exam)
+
+    positions = {es.id: i for i, es in enumerate(exam_subjects)}
+    if positions:
+        students = students.annotate(
+            marks=FilteredRelation('scores', condition=Q(scores__exam_subject_id__in=positions)),
+            paper=F('marks__exam_subject_id'), mark=F('marks__marks_obtained'),
+        )
+    else:
+        # An empty IN would empty the whole join rather than just the marks
+        students = students.annotate(
+            paper=Value(None, output_field=IntegerField()), mark=Value(None, output_field=FloatField()),
+        )
+    rows = (
+        students.order_by('last_name', 'first_name', 'id')
+        .values_list('id', 'assessment_no', 'first_name', 'last_name', 'paper', 'mark')
+        .iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+    )
+    current, row = None, None
+    for student_id, assessment_no, first_name, last_name, exam_subject_id, marks in rows:
+        if student_id != current:
+            if row is not None:
+                yield row
+            current = student_id
+            row = [assessment_no, first_name, last_name] + [''] * len(positions)
+        if exam_subject_id is not None:
+            row[3 + positions[exam_subject_id]] = '' if marks is None else marks
+    if row is not None:
+        yield row
+
+
+class Echo:
+    """File-like object that hands written lines straight back to csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows, filename):
+    writer = csv.writer(Echo())
+    response = StreamingHttpResponse(
+        (writer.writerow(row) for row in rows), content_type='text/csv'
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+    return response
+
+
+def stream_xlsx(rows, filename):
+    # Write-only workbooks flush each row as it is appended; the finished
+    # file is spooled to disk and streamed back in chunks.
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Marksheet')
+    for row in rows:
+        sheet.append(row)
+    output = tempfile.TemporaryFile()
+    workbook.save(output)
+    output.seek(0)
+    return FileResponse(
+        output, as_attachment=True, filename=f'{filename}.xlsx',
+        content_type=XLSX_CONTENT_TYPE,
+    )
+
+
+def export_marksheet(exam_subjects, class_id, name, file_format, with_exam=False):
+    exam_subjects = list(exam_subjects.select_related('exam', 'subject').order_by('exam_id', 'id'))
+    # A streamed CSV is read after the view has returned and left its routing
+    # scope (see db_routers), so the database is chosen here
+    students = Student.objects.using(router.db_for_read(Student)).filter(class_instance_id=class_id)
+    rows = marksheet_rows(exam_subjects, students, with_exam)
+    filename = slugify(name) or 'marksheet'
+    if file_format == 'xlsx':
+        return stream_xlsx(rows, filename)
+    return stream_csv(rows, filename)
+
+
+def export_exam(exam, file_format):
+    return export_marksheet(
+        ExamSubject.objects.filter(exam=exam), exam.class_instance_id, f'{exam.name}-{exam.id}',
+        file_format,
+    )
+
+
+def export_class(school_class, file_format, term=None, year=None):
+    exam_subjects = ExamSubject.objects.filter(exam__class_instance=school_class)
+    if term is not None:
+        exam_subjects = exam_subjects.filter(exam__term=term)
+    if year is not None:
+        exam_subjects = exam_subjects.filter(exam__year=year)
+    return export_marksheet(
+        exam_subjects, school_class.id, f'{school_class.name}-{school_class.id}', file_format,
+        with_exam=True,
+    )
@@ -0,0 +1,146 @@
+"""
+Letter grades and points for marks, from configurable grade bands.
+
+A ``GradingScheme`` is compiled into a sorted array of band lower bounds, so
+grading any number of percentages is a single ``numpy.searchsorted`` call.
+Each school (``Teacher.school_name``) may have a scheme of its own; the
+scheme with a blank school name is the default, and EXAM_GRADE_BOUNDARIES
+is used when there is neither.
+
+Compiled schemes are cached per user until a scheme or the teacher's school
+changes, so grading a response costs no query once the cache is warm.
+"""
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q, Subquery
+
+from .models import GradeBand, Teacher
+
+
+GENERATION_KEY = 'grading-scheme-generation'
+
+
+class CompiledScheme:
+    """Grade bands as arrays sorted by lower bound, ready for ``searchsorted``."""
+
+    def __init__(self, bands, key='default'):
+        # ``bands`` are ``(grade, min_percent, points)``; ``points`` may be None
+        bands = sorted(bands, key=lambda band: band[1])
+        self.key = key
+        self.lower_bounds = np.array([float(bound) for _, bound, _ in bands], dtype=float)
+        self.labels = np.array([grade for grade, _, _ in bands], dtype=object)
+        self.points = np.array([np.nan if points is None else float(points) for _, _, points in bands])
+
+    @property
+    def boundaries(self):
+        """``[(grade, min_percent), ...]``, best grade first."""
+        return [(label, float(bound)) for label, bound in zip(self.labels[::-1], self.lower_bounds[::-1])]
+
+    def band_indexes(self, percent):
+        """Index of each percentage's band, or -1 below the lowest band or for NaN."""
+        percent = np.asarray(percent, dtype=float)
+        indexes = np.searchsorted(self.lower_bounds, percent, side='right') - 1
+        indexes[np.isnan(percent)] = -1
+        return indexes
+
+    def grade(self, percent):
+        """The grades (``None`` where ungraded) and points (NaN) of an array of percentages."""
+        indexes = self.band_indexes(percent)
+        ungraded = indexes < 0
+        grades, points = self.labels[indexes], self.points[indexes]
+        grades[ungraded], points[ungraded] = None, np.nan
+        return grades, points
+
+
+def get_default_scheme(key='default'):
+    return CompiledScheme([(grade, bound, None) for grade, bound in settings.EXAM_GRADE_BOUNDARIES], key=key)
+
+
+def to_percentages(marks, max_marks=None):
+    """Marks as percentages of ``max_marks``; a missing or non-positive maximum means out of 100."""
+    marks = np.array(marks, dtype=float)
+    if max_marks is None:
+        return marks
+    max_marks = np.array(max_marks, dtype=float)
+    has_max = np.nan_to_num(max_marks) > 0
+    return np.where(has_max, marks / np.where(has_max, max_marks, 1) * 100, marks)
+
+
+def load_grading_scheme(user_id, version=''):
+    """
+    Compile the scheme of the user's school, or the default one, in one
+    query. ``version`` is appended to the scheme's ``key``, which tells
+    cached results graded under other bands apart.
+    """
+    school = Subquery(Teacher.objects.filter(user_id=user_id).values('school_name')[:1])
+    rows = GradeBand.objects.filter(
+        Q(scheme__school_name='') | Q(scheme__school_name=school)
+    ).order_by().values_list('scheme_id', 'scheme__school_name', 'grade', 'min_percent', 'points')
+    schemes = {}
+    for scheme_id, school_name, grade, min_percent, points in rows:
+        schemes.setdefault((school_name != '', scheme_id), []).append((grade, min_percent, points))
+    if not schemes:
+        return get_default_scheme(f'default:{version}')
+    # A school's own scheme sorts after the default
+    (_, scheme_id), bands = max(schemes.items())
+    return CompiledScheme(bands, key=f'{scheme_id}:{version}')
+
+
+def _scheme_key(user_id, generation):
+    return f'grading-scheme:{user_id}:{generation}'
+
+
+def get_grading_scheme(user_id):
+    """The compiled grading scheme of a user's school, from the cache."""
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, time.time_ns(), None)
+        generation = cache.get(GENERATION_KEY)
+    key = _scheme_key(user_id, generation)
+    scheme = cache.get(key)
+    if scheme is None:
+        scheme = load_grading_scheme(user_id, generation)
+        cache.set(key, scheme, getattr(settings, 'GRADING_SCHEME_CACHE_TTL', 300))
+    return scheme
+
+
+def _bump_generation():
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, time.time_ns(), None)
+
+
+def invalidate_grading_schemes():
+    """Retire every cached scheme, after any scheme or band changes."""
+    _bump_generation()
+    # Again once the write commits: bands are saved after their scheme, and a
+    # scheme compiled in between would have missed them
+    transaction.on_commit(_bump_generation)
+
+
+def invalidate_user_grading_scheme(user_id):
+    generation = cache.get(GENERATION_KEY)
+    if generation is not None:
+        cache.delete(_scheme_key(user_id, generation))
+
+
+def grade_instances(instances, percent, scheme):
+    """Set ``grade`` and ``points`` on each instance from its aligned percentage."""
+    grades, points = scheme.grade(percent)
+    points = np.where(np.isnan(points), None, points).tolist()
+    for instance, grade, point in zip(instances, grades.tolist(), points):
+        instance.grade, instance.points = grade, point
+
+
+class GradingSchemeMixin:
+    """Give the serializer the requesting user's compiled grading scheme."""
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['grading_scheme'] = get_grading_scheme(self.request.user.id)
+        return context
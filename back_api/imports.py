@@ -0,0 +1,206 @@
+import csv
+import io
+import re
+
+from django.db import IntegrityError, transaction
+from openpyxl import load_workbook
+
+from .caching import invalidate_class_responses, invalidate_exam_results
+from .dashboard import refresh_teacher_summaries_on_commit
+from .leaderboard import publish_score_changes
+from .models import ExamSubject, Score, Student, Subject
+from .reports import mark_exams_stale
+
+
+IMPORT_BATCH_SIZE = 1000
+STUDENT_COLUMNS = (
+    'first_name', 'last_name', 'assessment_no', 'registration_no', 'age', 'gender', 'subjects'
+)
+REQUIRED_COLUMNS = ('first_name', 'last_name', 'assessment_no')
+GENDERS = {'m': 'M', 'male': 'M', 'f': 'F', 'female': 'F'}
+DUPLICATE_ASSESSMENT_NO = 'A student with this assessment number already exists.'
+
+
+def read_rows(upload):
+    """Yield the rows of an uploaded XLSX or CSV file without loading it whole."""
+    if upload.name.lower().endswith('.xlsx'):
+        workbook = load_workbook(upload, read_only=True, data_only=True)
+        try:
+            yield from workbook.active.iter_rows(values_only=True)
+        finally:
+            workbook.close()
+    else:
+        yield from csv.reader(io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline=''))
+
+
+def normalise(value):
+    return re.sub(r'[\s_]+', '_', str(value or '').strip().lower())
+
+
+def cell(value):
+    return '' if value is None else str(value).strip()
+
+
+class RegisterImport:
+    """
+    Validate and insert a class register, one batch at a time.
+
+    Every assessment number already in the database is fetched once up
+    front, so uniqueness is checked in memory. Valid rows are inserted with
+    ``bulk_create`` for students, their subject through-rows and, when an
+    exam is given, any score columns named after the exam's subjects.
+    """
+
+    def __init__(self, school_class, exam=None):
+        self.school_class = school_class
+        self.exam = exam
+        self.assessment_nos = set(Student.objects.values_list('assessment_no', flat=True))
+        self.subjects = {normalise(name): pk for pk, name in Subject.objects.values_list('id', 'name')}
+        self.exam_subjects = {}
+        if exam is not None:
+            self.exam_subjects = {
+                normalise(es.subject.name): es
+                for es in ExamSubject.objects.filter(exam=exam).select_related('subject')
+            }
+        self.created = 0
+        self.scores_created = 0
+        self.errors = []
+        self.batch = []
+
+    def run(self, rows):
+        rows = iter(rows)
+        header = [normalise(value) for value in next(rows, ())]
+        missing = [name for name in REQUIRED_COLUMNS if name not in header]
+        if missing:
+            self.errors.append({'row': 1, 'errors': {name: ['Missing column.'] for name in missing}})
+            return self.report(0)
+
+        columns = [(i, name) for i, name in enumerate(header) if name in STUDENT_COLUMNS]
+        score_columns = [
+            (i, self.exam_subjects[name]) for i, name in enumerate(header)
+            if name in self.exam_subjects and name not in STUDENT_COLUMNS
+        ]
+        total = 0
+        for number, row in enumerate(rows, start=2):
+            if not any(cell(value) for value in row):
+                continue
+            total += 1
+            values = {name: cell(row[i]) if i < len(row) else '' for i, name in columns}
+            marks = {es: cell(row[i]) if i < len(row) else '' for i, es in score_columns}
+            self.add_row(number, values, marks)
+            if len(self.batch) >= IMPORT_BATCH_SIZE:
+                self.flush()
+        self.flush()
+        return self.report(total)
+
+    def add_row(self, number, values, marks):
+        errors = {}
+        for name in REQUIRED_COLUMNS:
+            if not values.get(name):
+                errors[name] = ['This field is required.']
+        assessment_no = values.get('assessment_no')
+        if assessment_no in self.assessment_nos:
+            errors['assessment_no'] = [DUPLICATE_ASSESSMENT_NO]
+
+        gender = GENDERS.get(values.get('gender', '').lower())
+        if gender is None:
+            errors['gender'] = ['Gender must be M or F.']
+
+        age = values.get('age') or None
+        if age is not None:
+            try:
+                age = int(float(age))
+            except ValueError:
+                errors['age'] = ['A valid integer is required.']
+
+        subject_ids = []
+        for name in filter(None, re.split(r'[,;]', values.get('subjects', ''))):
+            subject_id = self.subjects.get(normalise(name))
+            if subject_id is None:
+                errors.setdefault('subjects', []).append(f'Unknown subject "{name.strip()}".')
+            subject_ids.append(subject_id)
+
+        scores = {}
+        for exam_subject, value in marks.items():
+            if value == '':
+                continue
+            try:
+                scores[exam_subject.id] = float(value)
+            except ValueError:
+                errors[exam_subject.subject.name] = ['A valid number is required.']
+                continue
+            if scores[exam_subject.id] < 0 or (
+                exam_subject.max_marks is not None and scores[exam_subject.id] > exam_subject.max_marks
+            ):
+                errors[exam_subject.subject.name] = [f'Marks must be between 0 and {exam_subject.max_marks}.']
+
+        if errors:
+            self.errors.append({'row': number, 'errors': errors})
+            return
+        self.assessment_nos.add(assessment_no)
+        student = Student(
+            first_name=values['first_name'], last_name=values['last_name'],
+            assessment_no=assessment_no, registration_no=values.get('registration_no', ''),
+            age=age, gender=gender, class_instance=self.school_class,
+        )
+        self.batch.append((number, student, subject_ids, scores))
+
+    def flush(self):
+        if not self.batch:
+            return
+        try:
+            with transaction.atomic():
+                students, scores = self.insert()
+        except IntegrityError:
+            # Another import took some of these assessment numbers after they were fetched
+            taken = set(Student.objects.filter(
+                assessment_no__in=[student.assessment_no for _, student, _, _ in self.batch]
+            ).values_list('assessment_no', flat=True))
+            if not taken:
+                raise
+            for number, student, _, _ in self.batch:
+                if student.assessment_no in taken:
+                    self.errors.append({
+                        'row': number, 'errors': {'assessment_no': [DUPLICATE_ASSESSMENT_NO]},
+                    })
+            self.batch = [entry for entry in self.batch if entry[1].assessment_no not in taken]
+            return self.flush()
+        self.created += len(students)
+        self.scores_created += len(scores)
+        self.batch = []
+
+    def insert(self):
+        students = Student.objects.bulk_create([student for _, student, _, _ in self.batch])
+        Student.subjects.through.objects.bulk_create([
+            Student.subjects.through(student_id=student.id, subject_id=subject_id)
+            for student, (_, _, subject_ids, _) in zip(students, self.batch)
+            for subject_id in set(subject_ids)
+        ])
+        scores = Score.objects.bulk_create([
+            Score(student_id=student.id, exam_subject_id=exam_subject_id, marks_obtained=marks)
+            for student, (_, _, _, marks_by_subject) in zip(students, self.batch)
+            for exam_subject_id, marks in marks_by_subject.items()
+        ])
+        # bulk_create bypasses the Student and Score signals
+        invalidate_class_responses(self.school_class.id)
+        refresh_teacher_summaries_on_commit([self.school_class.teacher_id])
+        if scores:
+            mark_exams_stale([self.exam.id])
+            invalidate_exam_results(self.exam.id)
+            publish_score_changes(
+                (score.student_id, score.exam_subject_id, score.marks_obtained)
+                for score in scores
+            )
+        return students, scores
+
+    def report(self, total):
+        return {
+            'rows': total,
+            'created': self.created,
+            'scores_created': self.scores_created,
+            'errors': sorted(self.errors, key=lambda error: error['row']),
+        }
+
+
+def import_register(upload, school_class, exam=None):
+    return RegisterImport(school_class, exam).run(read_rows(upload))
@@ -0,0 +1,120 @@
+"""
+Live exam and class-term leaderboards (see consumers.LeaderboardConsumer).
+
+Committed score writes are published to the channel layer groups of their
+exam and class term, one message per write batch. Each connected
+leaderboard holds its marks in memory, so applying a change and re-ranking
+takes no queries; the consumer applies the changes of a whole window at
+once and pushes only the rankings that moved.
+"""
+from functools import partial
+
+import pandas as pd
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+from .models import ExamSubject, Score
+from .ranking import rank_students
+
+
+def exam_group(exam_id):
+    return f'leaderboard-exam-{exam_id}'
+
+
+def class_term_group(class_id, term, year):
+    return f'leaderboard-class-{class_id}-{term}-{year}'
+
+
+def publish_score_changes(changes, exam_subjects=None):
+    """
+    Announce ``(student_id, exam_subject_id, marks)`` changes once the
+    current transaction commits. ``None`` marks mean the score was cleared
+    or deleted. ``exam_subjects`` maps ids to exam subjects with their exam
+    selected, for callers that have already fetched them.
+    """
+    changes = list(changes)
+    if not changes or get_channel_layer() is None:
+        return
+    if exam_subjects is None:
+        exam_subjects = ExamSubject.objects.select_related('exam').in_bulk(
+            {exam_subject_id for _, exam_subject_id, _ in changes}
+        )
+    groups = {}
+    for student_id, exam_subject_id, marks in changes:
+        exam_subject = exam_subjects.get(exam_subject_id)
+        if exam_subject is None:
+            continue
+        exam = exam_subject.exam
+        row = [student_id, exam_subject_id, marks, exam_subject.max_marks]
+        groups.setdefault(exam_group(exam.id), []).append(row)
+        groups.setdefault(class_term_group(exam.class_instance_id, exam.term, exam.year), []).append(row)
+    transaction.on_commit(partial(_send, groups))
+
+
+def _send(groups):
+    group_send = async_to_sync(get_channel_layer().group_send)
+    for group, scores in groups.items():
+        group_send(group, {'type': 'scores.changed', 'scores': scores})
+
+
+class Leaderboard:
+    """The marks behind one ranking, re-ranked in memory as they change."""
+
+    def __init__(self, scores):
+        self.marks = {}
+        self.apply(scores)
+        self.standings = self.rank()
+
+    @classmethod
+    def for_exam(cls, exam_id):
+        return cls.load(exam_subject__exam_id=exam_id)
+
+    @classmethod
+    def for_class_term(cls, class_id, term, year):
+        return cls.load(
+            exam_subject__exam__class_instance_id=class_id,
+            exam_subject__exam__term=term, exam_subject__exam__year=year,
+        )
+
+    @classmethod
+    def load(cls, **filters):
+        return cls(Score.objects.filter(marks_obtained__isnull=False, **filters).values_list(
+            'student_id', 'exam_subject_id', 'marks_obtained', 'exam_subject__max_marks',
+        ))
+
+    def apply(self, scores):
+        for student_id, exam_subject_id, marks, max_marks in scores:
+            if marks is None:
+                self.marks.pop((student_id, exam_subject_id), None)
+            else:
+                self.marks[student_id, exam_subject_id] = (marks, max_marks)
+
+    def rank(self):
+        scores = pd.DataFrame.from_records(
+            [
+                (0, student_id, marks, max_marks)
+                for (student_id, _), (marks, max_marks) in self.marks.items()
+            ],
+            columns=['class_id', 'student_id', 'marks', 'max_marks'],
+        )
+        students = rank_students(scores)
+        return {
+            student_id: {'student': student_id, 'average': average, 'rank': rank}
+            for student_id, average, rank in zip(
+                students['student_id'].tolist(), students['average'].tolist(),
+                students['rank'].tolist(),
+            )
+        }
+
+    def update(self, scores):
+        """Apply score changes; return the standings that changed and the students that left."""
+        self.apply(scores)
+        standings = self.rank()
+        changed = [row for student_id, row in standings.items() if self.standings.get(student_id) != row]
+        removed = [student_id for student_id in self.standings if student_id not in standings]
+        self.standings = standings
+        return changed, removed
+
+    def rankings(self):
+        return sorted(self.standings.values(), key=lambda row: (row['rank'], row['student']))
@@ -0,0 +1,196 @@
+import json
+import subprocess
+import time
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import URLResolver, reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from back_api import urls
+from back_api.models import Exam
+
+
+# Query strings for routes that cannot be read without one
+TERM_ROUTES = ('class-report-cards', 'student-report-card')
+
+
+def iter_patterns(patterns):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from iter_patterns(pattern.url_patterns)
+        elif pattern.name:
+            yield pattern
+
+
+def allows_get(callback):
+    # ViewSet routes map methods to actions; other views define handlers
+    actions = getattr(callback, 'actions', None)
+    if actions is not None:
+        return 'get' in actions
+    view_class = getattr(callback, 'cls', None) or getattr(callback, 'view_class', None)
+    return view_class is not None and hasattr(view_class, 'get')
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Request every GET route in back_api/urls.py as one user and record '
+        'latency percentiles, SQL query counts and payload sizes as JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='User whose token authenticates the requests.')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed requests per route.')
+        parser.add_argument('--warmup', type=int, default=2, help='Untimed requests per route first.')
+        parser.add_argument('--output', default='benchmark-api.json', help="Report path, or '-' for stdout.")
+        parser.add_argument('--compare', help='An earlier report to print the changes against.')
+        parser.add_argument('--route', action='append', dest='routes', help='Only this route name. Repeatable.')
+        parser.add_argument('--host', default='127.0.0.1', help='Host header; must be in ALLOWED_HOSTS.')
+        parser.add_argument(
+            '--response-cache', action='store_true',
+            help='Serve the endpoints that have one from the response cache.',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            self.user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user {options['username']!r}.")
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as file:
+                baseline = json.load(file)
+
+        ttl = settings.RESPONSE_CACHE_TTL if options['response_cache'] else None
+        # Downloads are metered and some routes write: everything is rolled
+        # back, and downloads are charged in the request, not by a buffer
+        with override_settings(RESPONSE_CACHE_TTL=ttl, DOWNLOAD_QUOTA_BUFFER=None), transaction.atomic():
+            routes = self.run(options)
+            transaction.set_rollback(True)
+
+        report = {
+            'commit': get_commit(),
+            'created': timezone.now().isoformat(),
+            'user': self.user.username,
+            'repeat': options['repeat'],
+            'response_cache': options['response_cache'],
+            'routes': routes,
+        }
+        if options['output'] == '-':
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            with open(options['output'], 'w') as file:
+                json.dump(report, file, indent=2)
+            self.stdout.write(f"Report written to {options['output']}.")
+        if baseline is not None:
+            self.compare(baseline, report)
+
+    def run(self, options):
+        token = Token.objects.get_or_create(user=self.user)[0].key
+        self.client = Client(HTTP_AUTHORIZATION=f'Token {token}', HTTP_HOST=options['host'])
+        exam = Exam.objects.filter(teacher__user=self.user).order_by('-year', '-term').first()
+        self.term_query = f'?term={exam.term}&year={exam.year}' if exam else ''
+        basenames = sorted(
+            [basename for _, _, basename in urls.router.registry]
+            + [f'async-{basename}' for basename, _ in urls.async_readers.values()],
+            key=len, reverse=True,
+        )
+
+        routes = {}
+        for pattern in iter_patterns(urls.urlpatterns):
+            name = pattern.name
+            if options['routes'] and name not in options['routes']:
+                continue
+            kwargs = set(pattern.pattern.regex.groupindex)
+            if 'format' in kwargs or name in routes:
+                continue  # ?format= suffix twins of the routes below
+            if not allows_get(pattern.callback):
+                routes[name] = {'skipped': 'no GET handler'}
+            elif kwargs - {'pk'}:
+                routes[name] = {'skipped': f"needs {', '.join(sorted(kwargs - {'pk'}))}"}
+            else:
+                routes[name] = self.measure(pattern, basenames, options)
+            self.report_route(name, routes[name])
+        return routes
+
+    def get_path(self, pattern, basenames):
+        if 'pk' not in pattern.pattern.regex.groupindex:
+            return reverse(pattern.name)
+        # A detail route reads the first row its list route returns
+        basename = next(name for name in basenames if pattern.name.startswith(f'{name}-'))
+        response = self.client.get(reverse(f'{basename}-list'))
+        rows = response.json().get('results') if response.status_code == 200 else None
+        if not rows:
+            return None
+        return reverse(pattern.name, kwargs={'pk': rows[0]['id']})
+
+    def measure(self, pattern, basenames, options):
+        path = self.get_path(pattern, basenames)
+        if path is None:
+            return {'skipped': 'no rows to read'}
+        if pattern.name in TERM_ROUTES:
+            path += self.term_query
+
+        timings, queries, sizes, statuses = [], [], [], set()
+        for i in range(options['warmup'] + options['repeat']):
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = self.client.get(path)
+                body = b''.join(response.streaming_content) if response.streaming else response.content
+                elapsed = time.perf_counter() - started
+            response.close()
+            if i < options['warmup']:
+                continue
+            timings.append(elapsed * 1000)
+            queries.append(len(captured))
+            sizes.append(len(body))
+            statuses.add(response.status_code)
+
+        p50, p90, p99 = np.percentile(timings, [50, 90, 99])
+        return {
+            'path': path,
+            'status': sorted(statuses),
+            'p50_ms': round(float(p50), 2),
+            'p90_ms': round(float(p90), 2),
+            'p99_ms': round(float(p99), 2),
+            'mean_ms': round(float(np.mean(timings)), 2),
+            'queries': max(queries),
+            'bytes': max(sizes),
+        }
+
+    def report_route(self, name, result):
+        if 'skipped' in result:
+            self.stdout.write(f"  {name:<32} skipped: {result['skipped']}")
+            return
+        self.stdout.write(
+            f"  {name:<32} {'/'.join(map(str, result['status'])):>7}  p50 {result['p50_ms']:8.1f} ms  "
+            f"p99 {result['p99_ms']:8.1f} ms  {result['queries']:4d} queries  {result['bytes']:9,d} bytes"
+        )
+
+    def compare(self, baseline, report):
+        self.stdout.write(f"\nChanges since {baseline.get('commit') or baseline['created']}:")
+        for name, result in report['routes'].items():
+            before = baseline['routes'].get(name)
+            if 'skipped' in result or not before or 'skipped' in before:
+                continue
+            change = (result['p50_ms'] - before['p50_ms']) / before['p50_ms'] * 100 if before['p50_ms'] else 0
+            self.stdout.write(
+                f"  {name:<32} p50 {before['p50_ms']:8.1f} -> {result['p50_ms']:8.1f} ms ({change:+5.0f}%)  "
+                f"queries {before['queries']:4d} -> {result['queries']:4d}  "
+                f"bytes {before['bytes']:9,d} -> {result['bytes']:9,d}"
+            )
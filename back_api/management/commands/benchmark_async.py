@@ -0,0 +1,146 @@
+import asyncio
+import io
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from wsgiref.util import setup_testing_defaults
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from rest_framework.authtoken.models import Token
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare concurrent read throughput and latency of the sync endpoints '
+        'under WSGI with their /api/async/ twins under ASGI.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='User whose token authenticates the requests.')
+        parser.add_argument(
+            '--path', action='append', dest='paths',
+            help='Sync endpoint to compare, e.g. /api/scores/?expand=*. Repeatable.',
+        )
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--host', default='127.0.0.1', help='Host header; must be in ALLOWED_HOSTS.')
+        parser.add_argument(
+            '--response-cache', action='store_true',
+            help='Serve the sync endpoints that have one from the response cache.',
+        )
+
+    def handle(self, *args, **options):
+        # Imported here so the applications are built with the command's settings
+        from Fl_Backend.asgi import application as asgi_application
+        from Fl_Backend.wsgi import application as wsgi_application
+
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user {options['username']!r}.")
+        self.token = Token.objects.get_or_create(user=user)[0].key
+        self.host = options['host']
+
+        # The async endpoints have no response cache, so by default neither side does
+        ttl = settings.RESPONSE_CACHE_TTL if options['response_cache'] else None
+        with override_settings(RESPONSE_CACHE_TTL=ttl):
+            self.compare(wsgi_application, asgi_application, options)
+
+    def compare(self, wsgi_application, asgi_application, options):
+        # The servers themselves (gunicorn, uvicorn, ...) are not dependencies
+        # of the project, so each application is called in process: WSGI from
+        # a thread pool, ASGI from coroutines on one event loop
+        for path in options['paths'] or ['/api/classes/', '/api/students/', '/api/scores/']:
+            async_path = path.replace('/api/', '/api/async/', 1)
+            self.stdout.write(path)
+            for label, run, application, url in (
+                ('WSGI  sync ', self.run_wsgi, wsgi_application, path),
+                ('ASGI  sync ', self.run_asgi, asgi_application, path),
+                ('ASGI  async', self.run_asgi, asgi_application, async_path),
+            ):
+                self.report(label, *run(application, url, options))
+
+    def report(self, label, seconds, timings):
+        latencies = sorted(latency for latency, _ in timings)
+        errors = sum(1 for _, status in timings if status != 200)
+        percentiles = statistics.quantiles(latencies, n=100)
+        self.stdout.write(
+            f'  {label}  {len(timings) / seconds:8,.0f} req/s  '
+            f'p50 {percentiles[49] * 1000:7.1f} ms  p99 {percentiles[98] * 1000:7.1f} ms'
+            + (f'  {errors} errors' if errors else '')
+        )
+
+    def run_wsgi(self, application, path, options):
+        def call(_):
+            url = urlsplit(path)
+            environ = {
+                'PATH_INFO': url.path, 'QUERY_STRING': url.query, 'HTTP_HOST': self.host,
+                'HTTP_AUTHORIZATION': f'Token {self.token}', 'wsgi.input': io.BytesIO(),
+                'wsgi.errors': sys.stderr, 'wsgi.multithread': True,
+            }
+            setup_testing_defaults(environ)
+            status = []
+            started = time.perf_counter()
+            body = application(environ, lambda line, headers, exc_info=None: status.append(line))
+            try:
+                b''.join(body)
+            finally:
+                body.close()
+            return time.perf_counter() - started, int(status[0].split()[0])
+
+        with ThreadPoolExecutor(options['concurrency']) as pool:
+            call(None)  # warm the token cache
+            started = time.perf_counter()
+            timings = list(pool.map(call, range(options['requests'])))
+            return time.perf_counter() - started, timings
+
+    def run_asgi(self, application, path, options):
+        async def call():
+            url = urlsplit(path)
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+                'method': 'GET', 'scheme': 'http', 'path': url.path,
+                'query_string': url.query.encode(), 'root_path': '',
+                'headers': [
+                    (b'host', self.host.encode()),
+                    (b'authorization', f'Token {self.token}'.encode()),
+                ],
+                'client': ('127.0.0.1', 0), 'server': (self.host, 80),
+            }
+            status, finished, requested = [], asyncio.Event(), []
+
+            async def receive():
+                if not requested:
+                    requested.append(True)
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                await finished.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    status.append(message['status'])
+                elif not message.get('more_body'):
+                    finished.set()
+
+            started = time.perf_counter()
+            await application(scope, receive, send)
+            return time.perf_counter() - started, status[0]
+
+        async def run():
+            await call()  # warm the token cache
+            remaining, timings = iter(range(options['requests'])), []
+
+            async def client():
+                for _ in remaining:
+                    timings.append(await call())
+
+            started = time.perf_counter()
+            await asyncio.gather(*(client() for _ in range(options['concurrency'])))
+            return time.perf_counter() - started, timings
+
+        return asyncio.run(run())
@@ -0,0 +1,127 @@
+import os
+import random
+import tempfile
+import threading
+import time
+from importlib import import_module
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+
+from back_api.models import Class, Exam, ExamSubject, Score, Student, Subject, Teacher
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare score-entry write throughput between the database settings '
+        'of two settings modules, each on a scratch copy of the schema.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--baseline', default='Fl_Backend.settings')
+        parser.add_argument('--candidate', default='Fl_Backend.settings_production')
+        parser.add_argument('--writers', type=int, default=8)
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--students', type=int, default=200)
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            for label in ('baseline', 'candidate'):
+                module = options[label]
+                alias = f'benchmark_{label}'
+                self.add_database(alias, module, os.path.join(directory, f'{label}.sqlite3'))
+                self.stdout.write(f'{label}: {module}')
+                call_command('migrate', database=alias, verbosity=0)
+                score_ids = self.seed(alias, options['students'])
+                stats = self.run(alias, score_ids, options)
+                connections[alias].close()
+                self.stdout.write(
+                    f"  {stats['writes'] / options['seconds']:,.0f} writes/s, "
+                    f"{stats['reads'] / options['seconds']:,.0f} reads/s, "
+                    f"{stats['locked']} 'database is locked' errors"
+                )
+
+    def add_database(self, alias, module, name):
+        config = dict(import_module(module).DATABASES[DEFAULT_DB_ALIAS], NAME=name)
+        configured = connections.configure_settings({
+            DEFAULT_DB_ALIAS: dict(connections.settings[DEFAULT_DB_ALIAS]), alias: config,
+        })
+        connections.settings[alias] = configured[alias]
+
+    def seed(self, alias, students):
+        # bulk_create throughout: model signals would write to the default database
+        user = User.objects.using(alias).create(username='benchmark')
+        teacher = Teacher.objects.using(alias).bulk_create([Teacher(user=user)])[0]
+        school_class = Class.objects.using(alias).create(name='Benchmark', teacher=teacher)
+        exam = Exam.objects.using(alias).bulk_create([
+            Exam(class_instance=school_class, name='Benchmark', teacher=teacher, term=1, year=2024)
+        ])[0]
+        subjects = Subject.objects.using(alias).bulk_create([
+            Subject(name=name) for name in ('Maths', 'English', 'Science')
+        ])
+        exam_subjects = ExamSubject.objects.using(alias).bulk_create([
+            ExamSubject(exam=exam, subject=subject, max_marks=100) for subject in subjects
+        ])
+        pupils = Student.objects.using(alias).bulk_create([
+            Student(
+                first_name='Pupil', last_name=str(i), assessment_no=f'B{i}', gender='F',
+                class_instance=school_class,
+            )
+            for i in range(students)
+        ])
+        scores = Score.objects.using(alias).bulk_create([
+            Score(student=pupil, exam_subject=exam_subject, marks_obtained=0)
+            for pupil in pupils for exam_subject in exam_subjects
+        ])
+        return [score.id for score in scores]
+
+    def run(self, alias, score_ids, options):
+        stats = {'writes': 0, 'reads': 0, 'locked': 0}
+        lock = threading.Lock()
+        deadline = time.monotonic() + options['seconds']
+
+        def count(key):
+            with lock:
+                stats[key] += 1
+
+        def write():
+            # Score entry reads the row before it writes, inside one transaction
+            scores = Score.objects.using(alias)
+            while time.monotonic() < deadline:
+                score_id = random.choice(score_ids)
+                try:
+                    with transaction.atomic(using=alias):
+                        marks = scores.get(pk=score_id).marks_obtained
+                        scores.filter(pk=score_id).update(marks_obtained=(marks + 1) % 100)
+                    count('writes')
+                except OperationalError:
+                    count('locked')
+
+        def read():
+            scores = Score.objects.using(alias).order_by('id')
+            while time.monotonic() < deadline:
+                try:
+                    list(scores.filter(id__gt=random.choice(score_ids))[:100])
+                    count('reads')
+                except OperationalError:
+                    count('locked')
+
+        def worker(target):
+            try:
+                target()
+            finally:
+                connections.close_all()
+
+        threads = [
+            threading.Thread(target=worker, args=(write,)) for _ in range(options['writers'])
+        ] + [
+            threading.Thread(target=worker, args=(read,)) for _ in range(options['readers'])
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return stats
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from back_api.ranking import RANK_METHODS, compute_term_rankings
+
+
+class Command(BaseCommand):
+    help = 'Compute student ranks and class averages for a term.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--term', type=int, required=True, choices=[1, 2, 3])
+        parser.add_argument('--year', type=int, required=True)
+        parser.add_argument(
+            '--class', dest='class_ids', type=int, action='append',
+            help='Limit to a class id (repeatable). Defaults to every class.',
+        )
+        parser.add_argument('--method', choices=sorted(RANK_METHODS), default='competition')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        summary = compute_term_rankings(
+            options['term'], options['year'],
+            class_ids=options['class_ids'], method=options['method'],
+        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Ranked {summary['students']} students in {summary['classes']} classes "
+            f"in {elapsed:.2f}s ({summary['reports_created']} reports created, "
+            f"{summary['reports_updated']} updated)."
+        ))
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from back_api.subscriptions import expire_lapsed_subscriptions
+
+
+class Command(BaseCommand):
+    help = 'Expire lapsed premium teachers and subscriptions.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--every', type=float, metavar='SECONDS',
+            help='Keep running and sweep again every SECONDS.',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            teachers, subscriptions = expire_lapsed_subscriptions()
+            self.stdout.write(
+                f'Expired {teachers} premium teachers and {subscriptions} subscriptions.'
+            )
+            if not options['every']:
+                break
+            close_old_connections()
+            time.sleep(options['every'])
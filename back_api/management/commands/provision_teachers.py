@@ -0,0 +1,33 @@
+import csv
+
+from django.core.management.base import BaseCommand
+
+from back_api.provisioning import provision_teachers
+
+
+class Command(BaseCommand):
+    help = (
+        'Create teacher accounts from a CSV with username, email, password, '
+        'school_name and mobile_phone columns. Writes each row\'s result to stdout.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file')
+        parser.add_argument('--workers', type=int, help='Password hashing processes.')
+
+    def handle(self, *args, **options):
+        with open(options['csv_file'], newline='', encoding='utf-8-sig') as handle:
+            rows = [
+                {key: value for key, value in row.items() if value not in (None, '')}
+                for row in csv.DictReader(handle)
+            ]
+        report = provision_teachers(rows, workers=options['workers'])
+
+        writer = csv.writer(self.stdout)
+        writer.writerow(['row', 'status', 'username', 'token', 'errors'])
+        for result in report['results']:
+            writer.writerow([
+                result['index'] + 2, result['status'], result.get('username', ''),
+                result.get('token', ''), result.get('errors', ''),
+            ])
+        self.stderr.write(f"{report['created']} created, {report['errors']} failed.")
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from back_api.reports import refresh_stale_reports
+
+
+class Command(BaseCommand):
+    help = 'Recompute reports for class terms whose scores changed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--settle', type=float, default=0,
+            help='Skip class terms edited within this many seconds.',
+        )
+
+    def handle(self, *args, **options):
+        remaining = refresh_stale_reports(settle=options['settle'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Reports refreshed; {remaining} class terms still pending.'
+        ))
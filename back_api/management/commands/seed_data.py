@@ -0,0 +1,238 @@
+import time
+from datetime import date
+
+import numpy as np
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.authtoken.models import Token
+
+from back_api.bulk import BULK_BATCH_SIZE
+from back_api.caching import invalidate_shared_responses
+from back_api.dashboard import refresh_teacher_summaries
+from back_api.models import (
+    Class, Exam, ExamSubject, Profile, Result, Score, Student, Subject, Teacher, term_for_date,
+)
+from back_api.progress import refresh_progress_series
+from back_api.ranking import compute_term_rankings
+
+
+SUBJECTS = [
+    'Mathematics', 'English', 'Kiswahili', 'Science and Technology', 'Social Studies',
+    'Religious Education', 'Creative Arts', 'Agriculture', 'Home Science', 'Physical Education',
+]
+EXAMS = ['Opener', 'Mid Term', 'End Term']
+FIRST_NAMES = [
+    'Achieng', 'Amani', 'Baraka', 'Chebet', 'Faith', 'Imani', 'Jabari', 'Kamau', 'Kipchoge',
+    'Makena', 'Mercy', 'Njeri', 'Otieno', 'Wanjiru', 'Wekesa', 'Zawadi',
+]
+LAST_NAMES = [
+    'Akinyi', 'Barasa', 'Kariuki', 'Kiprono', 'Mutua', 'Mwangi', 'Njoroge', 'Ochieng',
+    'Odhiambo', 'Omondi', 'Too', 'Wafula',
+]
+TOWNS = ['Eldoret', 'Kisumu', 'Machakos', 'Meru', 'Mombasa', 'Nakuru', 'Nyeri', 'Thika']
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate synthetic schools (teachers, classes, students, subjects, '
+        'exams, scores and results) with bulk inserts, for benchmarking.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--teachers', type=int, default=5)
+        parser.add_argument('--classes', type=int, default=4, help='Classes per teacher.')
+        parser.add_argument('--students', type=int, default=40, help='Students per class.')
+        parser.add_argument('--subjects', type=int, default=8, help=f'At most {len(SUBJECTS)}.')
+        parser.add_argument('--terms', type=int, default=3, help='Most recent terms with exams.')
+        parser.add_argument('--exams', type=int, default=2, help='Exams per class per term.')
+        parser.add_argument('--missing', type=float, default=0.02, help='Share of marks left blank.')
+        parser.add_argument('--prefix', default='seed', help='Username prefix of the generated teachers.')
+        parser.add_argument('--password', default='seed-pass-1234')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed, for repeatable data.')
+
+    def handle(self, *args, **options):
+        if not 1 <= options['subjects'] <= len(SUBJECTS):
+            raise CommandError(f'--subjects must be between 1 and {len(SUBJECTS)}.')
+        self.rng = np.random.default_rng(options['seed'])
+        started = time.perf_counter()
+        # Bulk inserts skip the model signals, so derived rows are built below
+        with transaction.atomic():
+            counts, teacher_ids, terms, class_ids = self.seed(options)
+            for term, year in terms:
+                compute_term_rankings(term, year, class_ids=class_ids)
+            # In batches, to stay under SQLite's limit on query parameters
+            keys = sorted(self.result_keys)
+            for i in range(0, len(keys), BULK_BATCH_SIZE):
+                refresh_progress_series(keys[i:i + BULK_BATCH_SIZE])
+            refresh_teacher_summaries(teacher_ids)
+        self.stdout.write(self.style.SUCCESS(
+            ', '.join(f'{count:,} {name}' for name, count in counts.items())
+            + f' in {time.perf_counter() - started:.1f}s.'
+        ))
+        self.stdout.write(f"Log in as {self.usernames[0]} / {options['password']}.")
+
+    def get_terms(self, count):
+        """The ``count`` most recent ``(term, year)`` pairs, oldest first."""
+        today = date.today()
+        term, year = term_for_date(today), today.year
+        terms = []
+        for _ in range(count):
+            terms.append((term, year))
+            term, year = (term - 1, year) if term > 1 else (3, year - 1)
+        return terms[::-1]
+
+    def get_subjects(self, count):
+        names = SUBJECTS[:count]
+        existing = {}
+        for subject in Subject.objects.filter(name__in=names).order_by('id'):
+            existing.setdefault(subject.name, subject)
+        missing = [Subject(name=name) for name in names if name not in existing]
+        if missing:
+            Subject.objects.bulk_create(missing)
+            invalidate_shared_responses()
+            existing.update((subject.name, subject) for subject in missing)
+        return [existing[name] for name in names]
+
+    def seed(self, options):
+        rng = self.rng
+        prefix = options['prefix']
+        start = User.objects.filter(username__startswith=f'{prefix}-').count()
+        self.usernames = [f'{prefix}-{start + i}' for i in range(options['teachers'])]
+        if User.objects.filter(username__in=self.usernames).exists():
+            raise CommandError(f'Users named {prefix}-<n> already exist; choose another --prefix.')
+
+        subjects = self.get_subjects(options['subjects'])
+        terms = self.get_terms(options['terms'])
+        exam_names = EXAMS + [f'Exam {n}' for n in range(len(EXAMS) + 1, options['exams'] + 1)]
+        exam_names = exam_names[:options['exams']]
+
+        password = make_password(options['password'])
+        users = User.objects.bulk_create(
+            [
+                User(username=username, email=f'{username}@example.com', password=password)
+                for username in self.usernames
+            ],
+            batch_size=BULK_BATCH_SIZE,
+        )
+        teachers = Teacher.objects.bulk_create(
+            [
+                Teacher(
+                    user_id=user.id, email=user.email,
+                    mobile_phone=f'07{rng.integers(10 ** 7, 10 ** 8)}',
+                    school_name=f'{TOWNS[i % len(TOWNS)]} Primary School {start + i}',
+                )
+                for i, user in enumerate(users)
+            ],
+            batch_size=BULK_BATCH_SIZE,
+        )
+        Profile.objects.bulk_create([Profile(user_id=user.id) for user in users], batch_size=BULK_BATCH_SIZE)
+        Token.objects.bulk_create(
+            [Token(key=Token.generate_key(), user_id=user.id) for user in users], batch_size=BULK_BATCH_SIZE
+        )
+
+        classes = Class.objects.bulk_create(
+            [
+                Class(name=f'Grade {4 + c // 2} {"East" if c % 2 == 0 else "West"}', teacher_id=teacher.id)
+                for teacher in teachers for c in range(options['classes'])
+            ],
+            batch_size=BULK_BATCH_SIZE,
+        )
+        students = Student.objects.bulk_create(
+            [
+                Student(
+                    first_name=FIRST_NAMES[rng.integers(len(FIRST_NAMES))],
+                    last_name=LAST_NAMES[rng.integers(len(LAST_NAMES))],
+                    assessment_no=f'{prefix}-{school_class.id}-{i + 1:03d}',
+                    registration_no=f'REG-{school_class.id}-{i + 1:03d}',
+                    age=int(rng.integers(9, 14)), gender='F' if rng.random() < 0.5 else 'M',
+                    class_instance_id=school_class.id,
+                )
+                for school_class in classes for i in range(options['students'])
+            ],
+            batch_size=BULK_BATCH_SIZE,
+        )
+        Student.subjects.through.objects.bulk_create(
+            [
+                Student.subjects.through(student_id=student.id, subject_id=subject.id)
+                for student in students for subject in subjects
+            ],
+            batch_size=BULK_BATCH_SIZE,
+        )
+        exams = Exam.objects.bulk_create(
+            [
+                Exam(class_instance_id=school_class.id, teacher_id=school_class.teacher_id, name=name,
+                     term=term, year=year)
+                for school_class in classes for term, year in terms for name in exam_names
+            ],
+            batch_size=BULK_BATCH_SIZE,
+        )
+        # Alternate papers out of 100 and out of 50
+        max_marks = [100.0 if i % 2 == 0 else 50.0 for i in range(len(subjects))]
+        exam_subjects = ExamSubject.objects.bulk_create(
+            [
+                ExamSubject(exam_id=exam.id, subject_id=subject.id, max_marks=maximum)
+                for exam in exams for subject, maximum in zip(subjects, max_marks)
+            ],
+            batch_size=BULK_BATCH_SIZE,
+        )
+
+        scores, results = self.generate_marks(
+            classes, students, subjects, max_marks, exam_subjects, terms, options
+        )
+        Score.objects.bulk_create(scores, batch_size=BULK_BATCH_SIZE)
+        Result.objects.bulk_create(results, batch_size=BULK_BATCH_SIZE)
+        self.result_keys = {(result.student_id, result.subject_id) for result in results}
+
+        counts = {
+            'teachers': len(teachers), 'classes': len(classes), 'students': len(students),
+            'exams': len(exams), 'scores': len(scores), 'results': len(results),
+        }
+        teacher_ids = [teacher.id for teacher in teachers]
+        return counts, teacher_ids, terms, [school_class.id for school_class in classes]
+
+    def generate_marks(self, classes, students, subjects, max_marks, exam_subjects, terms, options):
+        """
+        Marks drawn per student ability and subject difficulty, with noise per
+        exam; a term's result is the student's mean percentage over its exams.
+        """
+        rng = self.rng
+        per_class, per_term = options['students'], options['exams']
+        difficulty = rng.normal(0, 6, len(subjects))
+        max_marks = np.array(max_marks)
+        # One row of exam subjects per exam, in the order the exams were created
+        exam_subjects = np.array(exam_subjects, dtype=object).reshape(-1, len(subjects))
+        scores, results = [], []
+        for c in range(len(classes)):
+            pupils = students[c * per_class:(c + 1) * per_class]
+            ability = rng.normal(58, 12, len(pupils))
+            class_exams = c * len(terms) * per_term
+            for t, (term, year) in enumerate(terms):
+                percent = np.clip(
+                    ability[None, :, None] + difficulty[None, None, :]
+                    + rng.normal(0, 8, (per_term, len(pupils), len(subjects))),
+                    0, 100,
+                )
+                percent[rng.random(percent.shape) < options['missing']] = np.nan
+                marks = np.round(percent * max_marks / 100)
+                for e in range(per_term):
+                    row = exam_subjects[class_exams + t * per_term + e]
+                    for s, student in enumerate(pupils):
+                        scores.extend(
+                            Score(student_id=student.id, exam_subject_id=exam_subject.id,
+                                  marks_obtained=None if np.isnan(mark) else float(mark))
+                            for exam_subject, mark in zip(row, marks[e, s])
+                        )
+                # From the rounded marks, as a teacher would; NaN where all are blank
+                entered = ~np.isnan(marks)
+                totals = np.where(entered, marks / max_marks * 100, 0).sum(axis=0)
+                counts = entered.sum(axis=0)
+                means = np.where(counts > 0, totals / np.maximum(counts, 1), np.nan)
+                for s, student in enumerate(pupils):
+                    results.extend(
+                        Result(student_id=student.id, subject_id=subject.id, term=term, year=year,
+                               score=round(float(mean), 2))
+                        for subject, mean in zip(subjects, means[s]) if not np.isnan(mean)
+                    )
+        return scores, results
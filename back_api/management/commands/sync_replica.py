@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from back_api.db_routers import sync_replica
+
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database over the read replica.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--every', type=float, metavar='SECONDS',
+            help='Keep running and copy again every SECONDS.',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            if sync_replica():
+                self.stdout.write('Replica synced.')
+            else:
+                self.stdout.write('The replica is the primary database; nothing to copy.')
+            if not options['every']:
+                break
+            time.sleep(options['every'])
@@ -0,0 +1,224 @@
+"""
+Per-request timings: SQL, authentication, serialization and total.
+
+``record_query`` is installed as an ``execute_wrapper`` on every database
+connection as it is opened (see signals.py), so queries are counted and
+timed without DEBUG query logging. ``RequestMetricsMiddleware`` starts a
+``RequestMetrics`` for each request, sends it back in a ``Server-Timing``
+header and adds it to the per-route histograms served at ``/metrics`` in the
+Prometheus text format.
+
+Authentication and serializer times exclude the SQL run inside them, so
+``sql + auth + serialize`` never exceeds the total. Histograms live in the
+worker process that served the request; each worker is a separate scrape
+target.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+
+# Upper bounds of the duration histograms, in seconds
+DEFAULT_DURATION_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+# Upper bounds of the query count histogram
+QUERY_COUNT_BUCKETS = [0, 1, 2, 5, 10, 20, 50, 100, 200, 500]
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    __slots__ = ('started', 'sql_count', 'sql_time', 'auth_time', 'serialize_time', 'active')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.auth_time = 0.0
+        self.serialize_time = 0.0
+        # Phases being timed, so nested serializers are counted once
+        self.active = set()
+
+    def server_timing(self, total):
+        return ', '.join([
+            f'sql;dur={self.sql_time * 1000:.1f};desc="{self.sql_count} queries"',
+            f'auth;dur={self.auth_time * 1000:.1f}',
+            f'serialize;dur={self.serialize_time * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ])
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.sql_count += 1
+        metrics.sql_time += time.perf_counter() - started
+
+
+def install_query_recorder(connection):
+    # The wrapper list outlives reconnections, which signal again
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def timed(phase):
+    """Add the time spent in the block, less its SQL, to ``<phase>_time``."""
+    metrics = _current.get()
+    if metrics is None or phase in metrics.active:
+        yield
+        return
+    metrics.active.add(phase)
+    started, sql_time = time.perf_counter(), metrics.sql_time
+    try:
+        yield
+    finally:
+        metrics.active.discard(phase)
+        elapsed = time.perf_counter() - started - (metrics.sql_time - sql_time)
+        setattr(metrics, f'{phase}_time', getattr(metrics, f'{phase}_time') + elapsed)
+
+
+class TimedSerializerMixin:
+    """Count the time spent in ``to_representation`` as serializer time."""
+
+    def to_representation(self, instance):
+        with timed('serialize'):
+            return super().to_representation(instance)
+
+
+class Histogram:
+    __slots__ = ('bounds', 'counts', 'sum')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        # The last count is for values above every bound (+Inf)
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class Registry:
+    """Per-route request counts and histograms of this process."""
+
+    histograms = {
+        'http_request_duration_seconds': 'Time to produce the response.',
+        'http_request_sql_duration_seconds': 'Time spent executing SQL.',
+        'http_request_serializer_duration_seconds': 'Time spent in serializers, less their SQL.',
+        'http_request_auth_duration_seconds': 'Time spent authenticating, less its SQL.',
+        'http_request_sql_queries': 'SQL queries executed.',
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}
+        self.series = {}
+
+    def observe(self, route, method, status, metrics, total):
+        durations = getattr(settings, 'METRICS_DURATION_BUCKETS', DEFAULT_DURATION_BUCKETS)
+        labels = (route, method)
+        with self._lock:
+            key = (route, method, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            for name, value in (
+                ('http_request_duration_seconds', total),
+                ('http_request_sql_duration_seconds', metrics.sql_time),
+                ('http_request_serializer_duration_seconds', metrics.serialize_time),
+                ('http_request_auth_duration_seconds', metrics.auth_time),
+                ('http_request_sql_queries', metrics.sql_count),
+            ):
+                histogram = self.series.get((name, labels))
+                if histogram is None:
+                    bounds = QUERY_COUNT_BUCKETS if name == 'http_request_sql_queries' else durations
+                    histogram = self.series[name, labels] = Histogram(bounds)
+                histogram.observe(value)
+
+    def render(self):
+        """The metrics in the Prometheus text exposition format."""
+        lines = [
+            '# HELP http_requests_total Requests served, by route, method and status.',
+            '# TYPE http_requests_total counter',
+        ]
+        with self._lock:
+            for (route, method, status), count in sorted(self.requests.items()):
+                lines.append(
+                    f'http_requests_total{{route="{route}",method="{method}",status="{status}"}} {count}'
+                )
+            for name, description in self.histograms.items():
+                lines += [f'# HELP {name} {description}', f'# TYPE {name} histogram']
+                for (series, (route, method)), histogram in sorted(self.series.items()):
+                    if series != name:
+                        continue
+                    labels = f'route="{route}",method="{method}"'
+                    cumulative = 0
+                    for bound, count in zip(histogram.bounds + ['+Inf'], histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                    lines.append(f'{name}_sum{{{labels}}} {histogram.sum:.6f}')
+                    lines.append(f'{name}_count{{{labels}}} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        with self._lock:
+            self.requests.clear()
+            self.series.clear()
+
+
+registry = Registry()
+
+
+def get_route(request):
+    # The URL name, so every student's detail page shares one series
+    match = request.resolver_match
+    return match.view_name if match is not None and match.view_name else 'unmatched'
+
+
+class RequestMetricsMiddleware:
+    """Time each request, report it in ``Server-Timing`` and add it to the histograms."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    def finish(self, request, response, metrics):
+        # Streamed bodies are produced after this, and are not included
+        total = time.perf_counter() - metrics.started
+        if getattr(settings, 'SERVER_TIMING', True):
+            response['Server-Timing'] = metrics.server_timing(total)
+        registry.observe(get_route(request), request.method, response.status_code, metrics, total)
+        return response
+
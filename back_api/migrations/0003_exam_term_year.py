@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+
+def backfill_term_and_year(apps, schema_editor):
+    rows = apps.get_model('back_api', 'Exam').objects.using(schema_editor.connection.alias)
+    exams = list(rows)
+    for exam in exams:
+        exam.term = (exam.date.month - 1) // 4 + 1
+        exam.year = exam.date.year
+    rows.bulk_update(exams, ['term', 'year'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('back_api', '0002_alter_teacher_subscription_end_date'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exam',
+            name='term',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='exam',
+            name='year',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_term_and_year, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('back_api', '0003_exam_term_year'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StaleReport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.IntegerField()),
+                ('year', models.IntegerField()),
+                ('marked_at', models.DateTimeField()),
+                ('school_class', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stale_reports', to='back_api.class')),
+            ],
+            options={
+                'unique_together': {('school_class', 'term', 'year')},
+            },
+        ),
+    ]
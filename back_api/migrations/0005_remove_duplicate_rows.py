@@ -0,0 +1,47 @@
+import logging
+
+from django.db import migrations
+from django.db.models import Count, Max
+
+logger = logging.getLogger(__name__)
+
+
+def drop_duplicates(rows, fields):
+    """
+    Keep the newest row of each ``fields`` group so that 0006 can make the
+    group unique, and log every row removed along with the one kept.
+    """
+    groups = rows.order_by().values(*fields).annotate(
+        keep_id=Max('id'), rows=Count('id'),
+    ).filter(rows__gt=1)
+    for group in groups:
+        keep_id = group.pop('keep_id')
+        del group['rows']
+        duplicates = rows.filter(**group).exclude(id=keep_id)
+        logger.warning(
+            'Removing duplicate %s rows %s for %s, keeping row %s',
+            rows.model.__name__, list(duplicates.values_list('id', flat=True)), group, keep_id,
+        )
+        duplicates.delete()
+
+
+def remove_duplicate_rows(apps, schema_editor):
+    alias = schema_editor.connection.alias
+    for model, fields in (
+        ('Score', ['exam_subject', 'student']),
+        ('StudentReport', ['student', 'term', 'year']),
+        ('ClassPerformance', ['school_class', 'term', 'year']),
+    ):
+        drop_duplicates(apps.get_model('back_api', model).objects.using(alias), fields)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('back_api', '0004_stalereport'),
+    ]
+
+    operations = [
+        # The removed rows are in the migration's log; they cannot be restored
+        migrations.RunPython(remove_duplicate_rows, migrations.RunPython.noop),
+    ]
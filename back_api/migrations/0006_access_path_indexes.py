@@ -0,0 +1,39 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('back_api', '0005_remove_duplicate_rows'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='score',
+            unique_together={('exam_subject', 'student')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='studentreport',
+            unique_together={('student', 'term', 'year')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='classperformance',
+            unique_together={('school_class', 'term', 'year')},
+        ),
+        migrations.AddIndex(
+            model_name='exam',
+            index=models.Index(fields=['class_instance', 'term', 'year'], name='back_api_ex_class_i_07b34c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exam',
+            index=models.Index(fields=['term', 'year'], name='back_api_ex_term_6eec0d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studentreport',
+            index=models.Index(fields=['term', 'year'], name='back_api_st_term_771fa2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='classperformance',
+            index=models.Index(fields=['term', 'year'], name='back_api_cl_term_b980ad_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def build_progress_series(apps, schema_editor):
+    alias = schema_editor.connection.alias
+    Result = apps.get_model('back_api', 'Result')
+    ProgressSeries = apps.get_model('back_api', 'ProgressSeries')
+    series = {}
+    for student_id, subject_id, year, term, score in Result.objects.using(alias).order_by(
+        'student_id', 'subject_id', 'year', 'term'
+    ).values_list('student_id', 'subject_id', 'year', 'term', 'score').iterator():
+        series.setdefault((student_id, subject_id), []).append([year, term, float(score)])
+    ProgressSeries.objects.using(alias).bulk_create(
+        [
+            ProgressSeries(student_id=student_id, subject_id=subject_id, points=points)
+            for (student_id, subject_id), points in series.items()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('back_api', '0006_access_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProgressSeries',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('points', models.JSONField(default=list)),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='progress_series', to='back_api.student')),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='back_api.subject')),
+            ],
+            options={
+                'unique_together': {('student', 'subject')},
+            },
+        ),
+        migrations.RunPython(build_progress_series, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+import django.core.serializers.json
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('back_api', '0007_progressseries'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TeacherSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('class_count', models.IntegerField(default=0)),
+                ('student_count', models.IntegerField(default=0)),
+                ('exam_count', models.IntegerField(default=0)),
+                ('pending_score_count', models.IntegerField(default=0)),
+                ('is_premium', models.BooleanField(default=False)),
+                ('subscription_end_date', models.DateField(null=True)),
+                ('recent_payments', models.JSONField(default=list, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('teacher', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='summary', to='back_api.teacher')),
+            ],
+        ),
+    ]
@@ -0,0 +1,34 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('back_api', '0008_teachersummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GradingScheme',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('school_name', models.CharField(blank=True, max_length=100, unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='GradeBand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('grade', models.CharField(max_length=10)),
+                ('min_percent', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('points', models.DecimalField(blank=True, decimal_places=1, max_digits=4, null=True)),
+                ('scheme', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bands', to='back_api.gradingscheme')),
+            ],
+            options={
+                'ordering': ['-min_percent'],
+                'unique_together': {('scheme', 'grade'), ('scheme', 'min_percent')},
+            },
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import RegexValidator
 from datetime import timedelta, date
 from django.conf import settings
@@ -21,8 +22,10 @@ class Teacher(models.Model):
 
     def save(self, *args, **kwargs):
         # Expire premium if the subscription end date has passed
-        if date.today() > self.subscription_end_date:
+        if self.is_premium and date.today() > self.subscription_end_date:
             self.is_premium = False
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'is_premium'}
         super().save(*args, **kwargs)
 
     def start_premium_subscription(self, days=365):
@@ -30,7 +33,8 @@ class Teacher(models.Model):
         self.is_premium = True
         self.subscription_start_date = date.today()
         self.subscription_end_date = date.today() + timedelta(days=days)
-        self.save()
+        # Download counters are only changed with F() updates (see quotas.py)
+        self.save(update_fields=['is_premium', 'subscription_start_date', 'subscription_end_date'])
     
     def is_subscription_active(self):
         """Check if the subscription is currently active."""
@@ -67,12 +71,32 @@ class Subject(models.Model):
     def __str__(self):
         return self.name
 
+def term_for_date(day):
+    """School term (1-3) a date falls in: Jan-Apr, May-Aug, Sep-Dec."""
+    return (day.month - 1) // 4 + 1
+
 # Exam model representing an exam for a specific class
 class Exam(models.Model):
     class_instance = models.ForeignKey(Class, on_delete=models.CASCADE, related_name='exams')
     name = models.CharField(max_length=100)  # e.g., "End Term Exam"
     date = models.DateField(auto_now_add=True)
     teacher = models.ForeignKey(Teacher, on_delete=models.CASCADE)
+    term = models.IntegerField(null=True, blank=True)  # Defaults to the term of the exam date
+    year = models.IntegerField(null=True, blank=True)
+
+    def save(self, *args, **kwargs):
+        day = self.date or date.today()
+        if self.term is None:
+            self.term = term_for_date(day)
+        if self.year is None:
+            self.year = day.year
+        super().save(*args, **kwargs)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['class_instance', 'term', 'year']),
+            models.Index(fields=['term', 'year']),
+        ]
 
     def __str__(self):
         return f"{self.name} - {self.class_instance.name} ({self.date})"
@@ -100,15 +124,38 @@ class Student(models.Model):
     def __str__(self):
         return f'{self.first_name} {self.last_name}'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered so that moving a student refreshes the summary of the
+        # teacher they left as well
+        instance._loaded_class_id = dict(zip(field_names, values)).get('class_instance_id')
+        return instance
+
 # Score model representing scores for individual exam subjects per student
 class Score(models.Model):
     student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='scores')
     exam_subject = models.ForeignKey(ExamSubject, on_delete=models.CASCADE, related_name='scores')
     marks_obtained = models.FloatField(null=True)
 
+    class Meta:
+        unique_together = ('exam_subject', 'student')
+
     def __str__(self):
         return f"{self.student} - {self.exam_subject.subject.name} - {self.marks_obtained}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered so that edits which only change a mark, and so leave the
+        # teacher's count of missing marks alone, skip the summary refresh
+        loaded = dict(zip(field_names, values))
+        if 'marks_obtained' in loaded:
+            instance._loaded_cell = (
+                loaded.get('student_id'), loaded.get('exam_subject_id'), loaded['marks_obtained'] is not None
+            )
+        return instance
+
 # Result model to store final term and year results per student for each subject
 class Result(models.Model):
     student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='results')
@@ -120,6 +167,25 @@ class Result(models.Model):
     class Meta:
         unique_together = ('student', 'subject', 'term', 'year')
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered so that a result moved to another student or subject
+        # can be taken out of its old progress series
+        loaded = dict(zip(field_names, values))
+        instance._loaded_series = (loaded.get('student_id'), loaded.get('subject_id'))
+        return instance
+
+# ProgressSeries model: one student's term results in a subject, oldest first,
+# kept in step with Result so a progress chart is a single row
+class ProgressSeries(models.Model):
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='progress_series')
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE)
+    points = models.JSONField(default=list)  # [[year, term, score], ...]
+
+    class Meta:
+        unique_together = ('student', 'subject')
+
 # StudentReport model for storing term reports per student
 class StudentReport(models.Model):
     student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='reports')
@@ -129,6 +195,10 @@ class StudentReport(models.Model):
     rank = models.IntegerField()  # Calculated based on scores
     average_score = models.DecimalField(max_digits=5, decimal_places=2)
 
+    class Meta:
+        unique_together = ('student', 'term', 'year')
+        indexes = [models.Index(fields=['term', 'year'])]
+
 # ClassPerformance model for overall class performance per term
 class ClassPerformance(models.Model):
     school_class = models.ForeignKey(Class, on_delete=models.CASCADE, related_name='performances')
@@ -137,6 +207,20 @@ class ClassPerformance(models.Model):
     average_score = models.DecimalField(max_digits=5, decimal_places=2)
     top_performer = models.ForeignKey(Student, on_delete=models.SET_NULL, null=True, related_name="top_performer_records")
 
+    class Meta:
+        unique_together = ('school_class', 'term', 'year')
+        indexes = [models.Index(fields=['term', 'year'])]
+
+# StaleReport model marking a class term whose reports need recomputing
+class StaleReport(models.Model):
+    school_class = models.ForeignKey(Class, on_delete=models.CASCADE, related_name='stale_reports')
+    term = models.IntegerField()
+    year = models.IntegerField()
+    marked_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('school_class', 'term', 'year')
+
 # Subscription model for teacher subscriptions
 class Subscription(models.Model):
     PLAN_CHOICES = [
@@ -155,3 +239,36 @@ class PaymentRecord(models.Model):
     transaction_id = models.CharField(max_length=100, unique=True)
     status = models.CharField(max_length=20, choices=[('completed', 'Completed'), ('failed', 'Failed')])
     timestamp = models.DateTimeField(auto_now_add=True)
+
+# TeacherSummary model: the figures on a teacher's dashboard, kept in step
+# with their classes, students, exams, scores and payments (see dashboard.py)
+class TeacherSummary(models.Model):
+    teacher = models.OneToOneField(Teacher, on_delete=models.CASCADE, related_name='summary')
+    class_count = models.IntegerField(default=0)
+    student_count = models.IntegerField(default=0)
+    exam_count = models.IntegerField(default=0)
+    pending_score_count = models.IntegerField(default=0)  # students x exam subjects without marks
+    is_premium = models.BooleanField(default=False)
+    subscription_end_date = models.DateField(null=True)
+    recent_payments = models.JSONField(default=list, encoder=DjangoJSONEncoder)
+    updated = models.DateTimeField(auto_now=True)
+
+# GradingScheme model: the grade bands a school's marks are graded against.
+# The scheme with a blank school name is the default for every other school
+class GradingScheme(models.Model):
+    name = models.CharField(max_length=100)
+    school_name = models.CharField(max_length=100, blank=True, unique=True)  # matches Teacher.school_name
+
+    def __str__(self):
+        return f'{self.name} ({self.school_name or "default"})'
+
+# GradeBand model: the lowest percentage that earns a grade, and its points
+class GradeBand(models.Model):
+    scheme = models.ForeignKey(GradingScheme, on_delete=models.CASCADE, related_name='bands')
+    grade = models.CharField(max_length=10)
+    min_percent = models.DecimalField(max_digits=5, decimal_places=2)
+    points = models.DecimalField(max_digits=4, decimal_places=1, null=True, blank=True)
+
+    class Meta:
+        unique_together = [('scheme', 'grade'), ('scheme', 'min_percent')]
+        ordering = ['-min_percent']  # best grade first
@@ -0,0 +1,16 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class IdCursorPagination(CursorPagination):
+    """
+    Keyset pagination over the primary key.
+
+    Each page is a ``WHERE id > <cursor> ORDER BY id LIMIT n`` range scan on
+    the primary key index, so fetching page 10,000 costs the same as page 1
+    and no ``COUNT(*)`` is ever issued. Clients follow the ``next`` and
+    ``previous`` links and may pick a size with ``?page_size=``.
+    """
+    ordering = 'id'
+    page_size_query_param = 'page_size'
+    max_page_size = getattr(settings, 'API_MAX_PAGE_SIZE', 500)
@@ -0,0 +1,27 @@
+"""
+Password hashing for process pool workers.
+
+Kept free of model imports so that workers started with any
+multiprocessing start method can import it without setting up Django.
+"""
+from concurrent.futures import ProcessPoolExecutor
+
+from django.utils.module_loading import import_string
+
+
+# Below this many passwords, hashing inline beats starting worker processes
+POOL_THRESHOLD = 4
+
+
+def hash_password(hasher_path, password):
+    hasher = import_string(hasher_path)()
+    return hasher.encode(password, hasher.salt())
+
+
+def hash_passwords(hasher_path, passwords, workers=None):
+    """Hash ``passwords`` with the given hasher class, in parallel when worthwhile."""
+    passwords = list(passwords)
+    if len(passwords) < POOL_THRESHOLD:
+        return [hash_password(hasher_path, password) for password in passwords]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(hash_password, [hasher_path] * len(passwords), passwords))
@@ -0,0 +1,91 @@
+"""
+Report card rendering.
+
+Kept free of Django imports so that it can run in pool worker processes
+started with any multiprocessing start method.
+"""
+import os
+import tempfile
+from xml.sax.saxutils import escape
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.units import mm
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+
+TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+    ('ALIGN', (1, 1), (-1, -1), 'RIGHT'),
+])
+
+
+def _number(value):
+    return '' if value is None else f'{value:g}'
+
+
+def render_report_card(card, path):
+    """Render one student's report card to ``path``, replacing it atomically."""
+    styles = getSampleStyleSheet()
+    student = card['student']
+    story = [
+        Paragraph(escape(card['school_name'] or 'Report Card'), styles['Title']),
+        Paragraph(escape(
+            f"{student['first_name']} {student['last_name']} "
+            f"({student['assessment_no']}) - {card['class_name']}"
+        ), styles['Heading2']),
+        Paragraph(f"Term {card['term']}, {card['year']}", styles['Normal']),
+        Spacer(1, 6 * mm),
+    ]
+
+    report = card['report']
+    if report:
+        story += [
+            Paragraph(
+                f"Average: {report['average_score']} &nbsp;&nbsp; "
+                f"Position: {report['rank']} of {card['class_size']}",
+                styles['Heading3'],
+            ),
+            Spacer(1, 4 * mm),
+        ]
+
+    if card['results']:
+        rows = [['Subject', 'Score']] + [
+            [result['subject'], result['score']] for result in card['results']
+        ]
+        story += [
+            Paragraph('Term results', styles['Heading3']),
+            Table(rows, colWidths=[110 * mm, 40 * mm], style=TABLE_STYLE),
+            Spacer(1, 4 * mm),
+        ]
+
+    if card['scores']:
+        rows = [['Exam', 'Subject', 'Marks', 'Out of']] + [
+            [score['exam'], score['subject'], _number(score['marks']), _number(score['max_marks'])]
+            for score in card['scores']
+        ]
+        story += [
+            Paragraph('Exam scores', styles['Heading3']),
+            Table(rows, colWidths=[60 * mm, 50 * mm, 20 * mm, 20 * mm], style=TABLE_STYLE),
+            Spacer(1, 4 * mm),
+        ]
+
+    if report and report['comments']:
+        story += [
+            Paragraph('Comments', styles['Heading3']),
+            Paragraph(escape(report['comments']), styles['Normal']),
+        ]
+
+    directory = os.path.dirname(path)
+    fd, partial = tempfile.mkstemp(dir=directory, suffix='.part')
+    os.close(fd)
+    try:
+        SimpleDocTemplate(partial, pagesize=A4, title='Report Card').build(story)
+        os.replace(partial, path)
+    except BaseException:
+        os.unlink(partial)
+        raise
+    return path
@@ -0,0 +1,96 @@
+from itertools import groupby
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Q
+
+from .batching import on_commit_batch
+from .models import ProgressSeries, Result
+
+
+def refresh_progress_series(keys):
+    """
+    Rebuild the ``(student_id, subject_id)`` progress series from their
+    results: one query to read them and one to write the series back.
+    Series left without results are deleted.
+    """
+    keys = {key for key in keys if None not in key}
+    if not keys:
+        return
+    student_ids = {student_id for student_id, _ in keys}
+    subject_ids = {subject_id for _, subject_id in keys}
+    series = {key: [] for key in keys}
+    rows = Result.objects.filter(student_id__in=student_ids, subject_id__in=subject_ids).order_by(
+        'student_id', 'subject_id', 'year', 'term'
+    ).values_list('student_id', 'subject_id', 'year', 'term', 'score')
+    for student_id, subject_id, year, term, score in rows:
+        if (student_id, subject_id) in series:
+            series[student_id, subject_id].append([year, term, float(score)])
+
+    with transaction.atomic():
+        ProgressSeries.objects.bulk_create(
+            [
+                ProgressSeries(student_id=student_id, subject_id=subject_id, points=points)
+                for (student_id, subject_id), points in series.items() if points
+            ],
+            update_conflicts=True,
+            unique_fields=['student', 'subject'],
+            update_fields=['points'],
+        )
+        empty = Q()
+        for (student_id, subject_id), points in series.items():
+            if not points:
+                empty |= Q(student_id=student_id, subject_id=subject_id)
+        if empty:
+            ProgressSeries.objects.filter(empty).delete()
+
+
+def refresh_progress_series_on_commit(keys):
+    """Rebuild the series once the transaction commits, with every other key written in it."""
+    on_commit_batch(refresh_progress_series, keys)
+
+
+def describe_series(points):
+    """
+    Term-over-term changes of a ``[[year, term, score], ...]`` series, and
+    its trend: the least-squares change in score per term.
+    """
+    scores = np.array([score for _, _, score in points], dtype=float)
+    deltas = np.diff(scores, prepend=np.nan)
+    trend = None
+    if len(scores) > 1:
+        trend = round(float(np.polyfit(np.arange(len(scores)), scores, 1)[0]), 2)
+    return {
+        'points': [
+            {'year': year, 'term': term, 'score': score,
+             'delta': None if np.isnan(delta) else round(float(delta), 2)}
+            for (year, term, score), delta in zip(points, deltas)
+        ],
+        'latest': points[-1][2] if points else None,
+        'trend': trend,
+    }
+
+
+def _subjects(series):
+    return [
+        {'subject': row.subject_id, 'name': row.subject.name, **describe_series(row.points)}
+        for row in series
+    ]
+
+
+def student_progress(student_id):
+    series = ProgressSeries.objects.filter(student_id=student_id).select_related('subject').order_by('subject_id')
+    return {'student': student_id, 'subjects': _subjects(series)}
+
+
+def class_progress(class_id):
+    series = ProgressSeries.objects.filter(student__class_instance_id=class_id).select_related(
+        'subject'
+    ).order_by('student_id', 'subject_id')
+    return {
+        'class': class_id,
+        'students': [
+            {'student': student_id, 'subjects': _subjects(rows)}
+            for student_id, rows in groupby(series, key=lambda row: row.student_id)
+        ],
+    }
@@ -0,0 +1,79 @@
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher
+from django.contrib.auth.models import User
+from django.db import transaction
+from rest_framework.authtoken.models import Token
+
+from .models import Profile, Teacher
+from .passwords import hash_passwords
+from .serializers import TeacherProvisionRowSerializer
+
+
+def provision_teachers(rows, workers=None):
+    """
+    Create a ``User``, ``Teacher``, ``Profile`` and ``Token`` for each row.
+
+    Rows are validated in memory against one lookup of the usernames already
+    taken. Passwords of the valid rows are hashed across a process pool, and
+    all accounts are then inserted with ``bulk_create`` in a single atomic
+    block, so no account is ever left half created. Invalid rows are
+    reported and skipped.
+    """
+    results, valid = [], []
+    for index, row in enumerate(rows):
+        serializer = TeacherProvisionRowSerializer(data=row)
+        if serializer.is_valid():
+            valid.append((index, serializer.validated_data))
+            results.append(None)
+        else:
+            results.append({'index': index, 'status': 'error', 'errors': serializer.errors})
+
+    taken = set(User.objects.filter(
+        username__in=[data['username'] for _, data in valid]
+    ).values_list('username', flat=True))
+    accepted = []
+    for index, data in valid:
+        if data['username'] in taken:
+            results[index] = {
+                'index': index, 'status': 'error',
+                'errors': {'username': ['A user with that username already exists.']},
+            }
+            continue
+        taken.add(data['username'])
+        accepted.append((index, data))
+
+    hasher = get_hasher('default')
+    hashes = hash_passwords(
+        f'{type(hasher).__module__}.{type(hasher).__qualname__}',
+        [data['password'] for _, data in accepted],
+        workers=workers or getattr(settings, 'PASSWORD_HASH_WORKERS', None),
+    )
+
+    with transaction.atomic():
+        users = User.objects.bulk_create([
+            User(username=data['username'], email=data['email'], password=password)
+            for (_, data), password in zip(accepted, hashes)
+        ])
+        # bulk_create skips the post_save signal that creates profiles
+        Teacher.objects.bulk_create([
+            Teacher(
+                user_id=user.id, email=data['email'], school_name=data['school_name'],
+                mobile_phone=data['mobile_phone'],
+            )
+            for user, (_, data) in zip(users, accepted)
+        ])
+        Profile.objects.bulk_create([Profile(user_id=user.id) for user in users])
+        tokens = Token.objects.bulk_create([
+            Token(key=Token.generate_key(), user_id=user.id) for user in users
+        ])
+
+    for user, token, (index, _) in zip(users, tokens, accepted):
+        results[index] = {
+            'index': index, 'status': 'created', 'username': user.username,
+            'token': token.key,
+        }
+    return {
+        'created': len(accepted),
+        'errors': len(results) - len(accepted),
+        'results': results,
+    }
@@ -0,0 +1,133 @@
+import atexit
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Case, F, Q, Value, When
+
+from .models import Teacher
+from .subscriptions import invalidate_entitlement
+
+
+def consume_download(teacher_id):
+    """
+    Charge one download to a teacher: a free one while any remain,
+    otherwise it is counted as a paid download.
+
+    Both paths are single conditional ``UPDATE`` statements, so concurrent
+    downloads cannot lose counts. Returns ``'free'`` or ``'paid'``.
+    """
+    charged_free = Teacher.objects.filter(
+        pk=teacher_id, free_downloads_remaining__gt=0
+    ).update(free_downloads_remaining=F('free_downloads_remaining') - 1)
+    if not charged_free:
+        Teacher.objects.filter(pk=teacher_id).update(paid_downloads=F('paid_downloads') + 1)
+    invalidate_entitlement(teacher_id)
+    return 'free' if charged_free else 'paid'
+
+
+def refund_download(teacher_id, kind):
+    """Give back a download charged by ``consume_download`` (e.g. a failed render)."""
+    if kind == 'free':
+        refunded = Teacher.objects.filter(pk=teacher_id).update(
+            free_downloads_remaining=F('free_downloads_remaining') + 1
+        )
+    else:
+        refunded = Teacher.objects.filter(pk=teacher_id, paid_downloads__gt=0).update(
+            paid_downloads=F('paid_downloads') - 1
+        )
+    invalidate_entitlement(teacher_id)
+    return bool(refunded)
+
+
+def consume_downloads(teacher_id, count):
+    """
+    Charge ``count`` downloads in one ``UPDATE``: free ones first, the rest
+    as paid. Both columns are computed from the row's values before the
+    update; ``paid_downloads`` is assigned first for backends (MySQL) that
+    evaluate assignments left to right.
+    """
+    covered = Q(free_downloads_remaining__gte=count)
+    Teacher.objects.filter(pk=teacher_id).update(
+        paid_downloads=Case(
+            When(covered, then=F('paid_downloads')),
+            default=F('paid_downloads') + count - F('free_downloads_remaining'),
+        ),
+        free_downloads_remaining=Case(
+            When(covered, then=F('free_downloads_remaining') - count),
+            default=Value(0),
+        ),
+    )
+    invalidate_entitlement(teacher_id)
+
+
+class DownloadQuotaBuffer:
+    """
+    Optional in-memory front for download metering.
+
+    Downloads are counted per teacher in memory and written with one
+    ``consume_downloads`` update per teacher when ``flush_every`` downloads
+    are pending, every ``flush_interval`` seconds, and at exit. Counts still
+    pending when the process dies are lost, so this trades exactness for
+    fewer writes under heavy download traffic.
+    """
+
+    def __init__(self, flush_every=50, flush_interval=5.0):
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._pending = Counter()
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def consume(self, teacher_id):
+        with self._lock:
+            self._pending[teacher_id] += 1
+            full = sum(self._pending.values()) >= self.flush_every
+            if not full and self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self._flush_in_thread)
+                self._timer.daemon = True
+                self._timer.start()
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        for teacher_id, count in pending.items():
+            consume_downloads(teacher_id, count)
+
+    def _flush_in_thread(self):
+        try:
+            self.flush()
+        finally:
+            connections.close_all()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_download_buffer():
+    """The process-wide buffer, or ``None`` unless DOWNLOAD_QUOTA_BUFFER is set."""
+    global _buffer
+    options = getattr(settings, 'DOWNLOAD_QUOTA_BUFFER', None)
+    if options is None:
+        return None
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = DownloadQuotaBuffer(**options)
+            atexit.register(_buffer.flush)
+    return _buffer
+
+
+def record_download(teacher_id):
+    """Meter a download, through the in-memory buffer when one is configured."""
+    buffer = get_download_buffer()
+    if buffer is None:
+        return consume_download(teacher_id)
+    buffer.consume(teacher_id)
+    return None
@@ -0,0 +1,174 @@
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+from django.db import transaction
+
+from .caching import invalidate_class_responses
+from .models import Score, StudentReport, ClassPerformance
+
+
+RANK_METHODS = {
+    'competition': 'min',  # 1, 2, 2, 4
+    'dense': 'dense',      # 1, 2, 2, 3
+}
+BATCH_SIZE = 500
+
+
+def load_term_scores(term, year, class_ids=None):
+    """
+    Fetch every recorded mark for a term in one query.
+
+    Returns a frame with ``class_id``, ``student_id``, ``marks`` and
+    ``max_marks`` columns. Scores belong to the class the exam was set for.
+    """
+    scores = Score.objects.filter(
+        exam_subject__exam__term=term,
+        exam_subject__exam__year=year,
+        marks_obtained__isnull=False,
+    )
+    if class_ids is not None:
+        scores = scores.filter(exam_subject__exam__class_instance_id__in=class_ids)
+    rows = scores.values_list(
+        'exam_subject__exam__class_instance_id', 'student_id',
+        'marks_obtained', 'exam_subject__max_marks',
+    )
+    return pd.DataFrame.from_records(
+        list(rows), columns=['class_id', 'student_id', 'marks', 'max_marks']
+    )
+
+
+def rank_students(scores, method='competition'):
+    """
+    Average each student's marks as percentages and rank them within class.
+
+    Marks are normalised by the subject's ``max_marks``; subjects without a
+    maximum are taken to be out of 100. Averages are rounded to the stored
+    precision before ranking so that ties match what is saved.
+    """
+    if scores.empty:
+        return pd.DataFrame(columns=['class_id', 'student_id', 'average', 'rank'])
+
+    marks = scores['marks'].to_numpy(dtype=float)
+    max_marks = scores['max_marks'].to_numpy(dtype=float)
+    has_max = np.nan_to_num(max_marks) > 0
+    percent = np.where(has_max, marks / np.where(has_max, max_marks, 1) * 100, marks)
+
+    students = (
+        scores.assign(percent=percent)
+        .groupby(['class_id', 'student_id'], sort=False)['percent']
+        .mean()
+        .round(2)
+        .rename('average')
+        .reset_index()
+    )
+    students['rank'] = (
+        students.groupby('class_id')['average']
+        .rank(method=RANK_METHODS[method], ascending=False)
+        .astype(int)
+    )
+    return students
+
+
+def summarise_classes(students):
+    """Class average and top performer (lowest student id wins a tie)."""
+    if students.empty:
+        return pd.DataFrame(columns=['class_id', 'average', 'top_performer'])
+    ordered = students.sort_values(
+        ['class_id', 'average', 'student_id'], ascending=[True, False, True]
+    )
+    grouped = ordered.groupby('class_id', sort=False)
+    return pd.DataFrame({
+        'average': grouped['average'].mean().round(2),
+        'top_performer': grouped['student_id'].first(),
+    }).reset_index()
+
+
+def _decimal(value):
+    return Decimal(f'{value:.2f}')
+
+
+def save_rankings(students, classes, term, year):
+    """
+    Write ranks and averages back to ``StudentReport``/``ClassPerformance``.
+
+    Existing rows are fetched once and only rows whose values changed are
+    updated; missing rows are bulk created.
+    """
+    student_ids = students['student_id'].tolist()
+    reports = {
+        report.student_id: report
+        for report in StudentReport.objects.filter(
+            term=term, year=year, student_id__in=student_ids
+        )
+    }
+    new_reports, changed_reports = [], []
+    for student_id, average, rank in zip(
+        student_ids, students['average'].tolist(), students['rank'].tolist()
+    ):
+        average = _decimal(average)
+        report = reports.get(student_id)
+        if report is None:
+            new_reports.append(StudentReport(
+                student_id=student_id, term=term, year=year, comments='',
+                rank=rank, average_score=average,
+            ))
+        elif report.rank != rank or report.average_score != average:
+            report.rank, report.average_score = rank, average
+            changed_reports.append(report)
+
+    class_ids = classes['class_id'].tolist()
+    performances = {
+        performance.school_class_id: performance
+        for performance in ClassPerformance.objects.filter(
+            term=term, year=year, school_class_id__in=class_ids
+        )
+    }
+    new_performances, changed_performances = [], []
+    for class_id, average, top_performer in zip(
+        class_ids, classes['average'].tolist(), classes['top_performer'].tolist()
+    ):
+        average = _decimal(average)
+        performance = performances.get(class_id)
+        if performance is None:
+            new_performances.append(ClassPerformance(
+                school_class_id=class_id, term=term, year=year,
+                average_score=average, top_performer_id=top_performer,
+            ))
+        elif (performance.average_score != average
+              or performance.top_performer_id != top_performer):
+            performance.average_score = average
+            performance.top_performer_id = top_performer
+            changed_performances.append(performance)
+
+    with transaction.atomic():
+        StudentReport.objects.bulk_create(new_reports, batch_size=BATCH_SIZE)
+        StudentReport.objects.bulk_update(
+            changed_reports, ['rank', 'average_score'], batch_size=BATCH_SIZE
+        )
+        ClassPerformance.objects.bulk_create(new_performances, batch_size=BATCH_SIZE)
+        ClassPerformance.objects.bulk_update(
+            changed_performances, ['average_score', 'top_performer'],
+            batch_size=BATCH_SIZE,
+        )
+        if new_performances or changed_performances:
+            # bulk writes bypass the ClassPerformance signals
+            invalidate_class_responses(*(
+                performance.school_class_id
+                for performance in new_performances + changed_performances
+            ))
+
+    return {
+        'students': len(student_ids),
+        'classes': len(class_ids),
+        'reports_created': len(new_reports),
+        'reports_updated': len(changed_reports),
+        'performances_created': len(new_performances),
+        'performances_updated': len(changed_performances),
+    }
+
+
+def compute_term_rankings(term, year, class_ids=None, method='competition'):
+    """Rank every student with marks in ``term``/``year`` and store the results."""
+    students = rank_students(load_term_scores(term, year, class_ids), method)
+    return save_rankings(students, summarise_classes(students), term, year)
@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import tempfile
+import zipfile
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.utils.text import slugify
+
+from .models import Result, Score, Student, StudentReport
+from .pdf import render_report_card
+
+
+# Below this many cards, rendering inline beats starting worker processes
+POOL_THRESHOLD = 8
+# Bump when the PDF layout changes so cached cards are re-rendered
+LAYOUT_VERSION = 1
+
+
+def collect_cards(school_class, term, year, student_ids=None):
+    """
+    Build the plain data behind each student's report card in a fixed number of queries.
+
+    The cards are JSON-serialisable dicts so that they can be hashed for
+    the cache and handed to worker processes.
+    """
+    students = Student.objects.filter(class_instance=school_class).order_by('last_name', 'first_name', 'id')
+    if student_ids is not None:
+        students = students.filter(id__in=student_ids)
+    students = list(students.values('id', 'first_name', 'last_name', 'assessment_no'))
+    ids = [student['id'] for student in students]
+
+    reports = {
+        report['student_id']: report
+        for report in StudentReport.objects.filter(term=term, year=year, student_id__in=ids)
+        .values('student_id', 'rank', 'average_score', 'comments')
+    }
+    results = defaultdict(list)
+    for student_id, subject, score in (
+        Result.objects.filter(term=term, year=year, student_id__in=ids)
+        .order_by('subject__name')
+        .values_list('student_id', 'subject__name', 'score')
+    ):
+        results[student_id].append({'subject': subject, 'score': str(score)})
+    scores = defaultdict(list)
+    for student_id, exam, subject, marks, max_marks in (
+        Score.objects.filter(
+            student_id__in=ids,
+            exam_subject__exam__class_instance=school_class,
+            exam_subject__exam__term=term, exam_subject__exam__year=year,
+        )
+        .order_by('exam_subject__exam__date', 'exam_subject__exam_id', 'exam_subject__subject__name')
+        .values_list(
+            'student_id', 'exam_subject__exam__name', 'exam_subject__subject__name',
+            'marks_obtained', 'exam_subject__max_marks',
+        )
+    ):
+        scores[student_id].append({
+            'exam': exam, 'subject': subject, 'marks': marks, 'max_marks': max_marks,
+        })
+
+    class_size = Student.objects.filter(class_instance=school_class).count() if student_ids else len(ids)
+    cards = []
+    for student in students:
+        report = reports.get(student['id'])
+        if report is not None:
+            report = {
+                'rank': report['rank'], 'average_score': str(report['average_score']),
+                'comments': report['comments'],
+            }
+        cards.append({
+            'layout': LAYOUT_VERSION,
+            'school_name': school_class.teacher.school_name,
+            'class_name': school_class.name,
+            'class_size': class_size,
+            'term': term,
+            'year': year,
+            'student': student,
+            'report': report,
+            'results': results[student['id']],
+            'scores': scores[student['id']],
+        })
+    return cards
+
+
+def card_path(card):
+    """Cache path for a card, named after a hash of everything it shows."""
+    digest = hashlib.sha256(
+        json.dumps(card, sort_keys=True, separators=(',', ':')).encode()
+    ).hexdigest()
+    return os.path.join(settings.REPORT_CARD_CACHE_DIR, digest[:2], f'{digest}.pdf')
+
+
+def render_cards(cards):
+    """
+    Return the cached PDF path of every card, rendering only missing ones.
+
+    A card whose data has not changed hashes to the same file and is served
+    from disk. Larger batches are rendered across a process pool.
+    """
+    paths = [card_path(card) for card in cards]
+    missing = [(card, path) for card, path in zip(cards, paths) if not os.path.exists(path)]
+    for _, path in missing:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    if len(missing) < POOL_THRESHOLD:
+        for card, path in missing:
+            render_report_card(card, path)
+    else:
+        workers = getattr(settings, 'REPORT_CARD_WORKERS', None)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(
+                render_report_card,
+                [card for card, _ in missing], [path for _, path in missing],
+                chunksize=max(1, len(missing) // (4 * (workers or os.cpu_count() or 1))),
+            ))
+    return paths
+
+
+def card_filename(card):
+    student = card['student']
+    return slugify(
+        f"{student['assessment_no']} {student['last_name']} {student['first_name']}"
+    ) + '.pdf'
+
+
+def zip_cards(cards, paths):
+    """Bundle rendered cards into a spooled ZIP file, rewound for reading."""
+    output = tempfile.TemporaryFile()
+    # PDFs are already compressed; storing them keeps zipping cheap
+    with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for card, path in zip(cards, paths):
+            archive.write(path, card_filename(card))
+    output.seek(0)
+    return output
@@ -0,0 +1,118 @@
+import threading
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from .batching import on_commit_batch
+from .models import Class, ClassPerformance, Exam, Score, StaleReport, StudentReport
+from .ranking import load_term_scores, rank_students, save_rankings, summarise_classes
+
+
+def mark_stale(keys):
+    """
+    Flag ``(class_id, term, year)`` keys as needing their reports recomputed.
+
+    Re-marking an already stale key moves its ``marked_at`` forward, which
+    is what debounces the refresh of a class that is still being edited.
+    The flags of a whole transaction are written in one go once it commits,
+    and only for classes that still exist: scores deleted along with their
+    class mark it too.
+    """
+    on_commit_batch(_save_stale, {key for key in keys if None not in key})
+
+
+def _save_stale(keys):
+    class_ids = {class_id for class_id, _, _ in keys}
+    existing = set(Class.objects.filter(id__in=class_ids).values_list('id', flat=True))
+    now = timezone.now()
+    StaleReport.objects.bulk_create(
+        [
+            StaleReport(school_class_id=class_id, term=term, year=year, marked_at=now)
+            for class_id, term, year in keys if class_id in existing
+        ],
+        update_conflicts=True,
+        unique_fields=['school_class', 'term', 'year'],
+        update_fields=['marked_at'],
+    )
+    schedule_refresh()
+
+
+def mark_exams_stale(exam_ids):
+    mark_stale(
+        Exam.objects.filter(id__in=exam_ids).values_list('class_instance_id', 'term', 'year')
+    )
+
+
+def refresh_stale_reports(settle=0):
+    """
+    Recompute the reports of every class term that has been quiet for
+    ``settle`` seconds and clear its stale flag.
+
+    Each term is ranked in one pass over just the stale classes, and only
+    reports whose average or rank changed are written. Reports of students,
+    and performances of classes, left without any marks are deleted. A key
+    re-marked while this runs keeps its flag and is picked up next time.
+    Returns the number of keys still waiting to settle.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settle)
+    stale = StaleReport.objects.filter(marked_at__lte=cutoff)
+    terms = defaultdict(list)
+    for class_id, term, year in stale.values_list('school_class_id', 'term', 'year'):
+        terms[term, year].append(class_id)
+
+    for (term, year), class_ids in terms.items():
+        students = rank_students(load_term_scores(term, year, class_ids))
+        save_rankings(students, summarise_classes(students), term, year)
+        _drop_unmarked(term, year, class_ids, set(students['class_id']))
+        StaleReport.objects.filter(
+            school_class_id__in=class_ids, term=term, year=year, marked_at__lte=cutoff
+        ).delete()
+    return StaleReport.objects.count()
+
+
+def _drop_unmarked(term, year, class_ids, ranked_class_ids):
+    # A student marked in the term by another class's exams keeps their report
+    marked = Score.objects.filter(
+        exam_subject__exam__term=term, exam_subject__exam__year=year, marks_obtained__isnull=False,
+    )
+    StudentReport.objects.filter(
+        term=term, year=year, student__class_instance_id__in=class_ids,
+    ).exclude(student_id__in=marked.values('student_id')).delete()
+    ClassPerformance.objects.filter(
+        term=term, year=year, school_class_id__in=set(class_ids) - ranked_class_ids,
+    ).delete()
+
+
+# Debounced in-process refresh
+# A burst of score edits schedules a single refresh, which only recomputes
+# class terms that have not been edited for REPORT_REFRESH_DELAY seconds.
+_refresh_timer = None
+_refresh_lock = threading.Lock()
+
+
+def schedule_refresh():
+    global _refresh_timer
+    delay = getattr(settings, 'REPORT_REFRESH_DELAY', None)
+    if delay is None:
+        return
+    with _refresh_lock:
+        if _refresh_timer is not None and _refresh_timer.is_alive():
+            return
+        _refresh_timer = threading.Timer(delay, _run_refresh, args=(delay,))
+        _refresh_timer.daemon = True
+        _refresh_timer.start()
+
+
+def _run_refresh(delay):
+    global _refresh_timer
+    try:
+        remaining = refresh_stale_reports(settle=delay)
+    finally:
+        connections.close_all()
+        with _refresh_lock:
+            _refresh_timer = None
+    if remaining:
+        schedule_refresh()
@@ -0,0 +1,8 @@
+from django.urls import path
+
+from .consumers import LeaderboardConsumer
+
+websocket_urlpatterns = [
+    path('ws/exams/<int:exam_id>/leaderboard/', LeaderboardConsumer.as_asgi()),
+    path('ws/classes/<int:class_id>/leaderboard/', LeaderboardConsumer.as_asgi()),
+]
@@ -1,10 +1,19 @@
+from datetime import date
+from decimal import Decimal
+from operator import attrgetter
+
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.core.validators import RegexValidator
+from django.db import models, transaction
 from rest_framework import serializers
 from rest_framework.authtoken.models import Token
 
+from .grading import get_default_scheme, grade_instances, to_percentages
+from .metrics import TimedSerializerMixin
 from .models import (
     Teacher, Profile, Class, Subject, Exam, ExamSubject,
     Student, Score, Result, StudentReport, ClassPerformance,
-    Subscription, PaymentRecord
+    Subscription, PaymentRecord, TeacherSummary, GradingScheme, GradeBand
 )
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
@@ -19,6 +28,7 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         model = User
         fields = ('username', 'email', 'password', 'school_name', 'mobile_phone')
 
+    @transaction.atomic
     def create(self, validated_data):
         # Extract teacher fields from the validated data
         school_name = validated_data.pop('school_name', '')
@@ -83,16 +93,133 @@ class LoginSerializer(serializers.Serializer):
         }
 
 
+# Sparse fieldsets and expandable relations
+# ``?fields=id,name,student.first_name`` narrows a response and
+# ``?expand=student.class_instance`` nests related objects. Relations that
+# are not expanded are rendered as primary keys; ``?expand=*`` nests all.
+EXPAND_ALL = '*'
+
+
+def parse_field_tree(value):
+    """Parse ``a,b.c,b.d`` into ``{'a': {}, 'b': {'c': {}, 'd': {}}}``."""
+    tree = {}
+    for path in (value or '').split(','):
+        node = tree
+        for part in path.strip().split('.'):
+            if part:
+                node = node.setdefault(part, {})
+    return tree
+
+
+def get_field_trees(request):
+    """Return the ``(expand, fields)`` trees requested by ``request``."""
+    if request is None:
+        return {}, None
+    expand = parse_field_tree(request.query_params.get('expand'))
+    fields = request.query_params.get('fields')
+    return expand, parse_field_tree(fields) if fields else None
+
+
+def is_expanded(expand, name, fields=None):
+    # Asking for nested fields of a relation implies expanding it
+    return EXPAND_ALL in expand or name in expand or bool(fields and fields.get(name))
+
+
+def expand_subtree(expand, name):
+    if EXPAND_ALL in expand:
+        return {EXPAND_ALL: {}}
+    return expand.get(name, {})
+
+
+class ExpandableModelSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """
+    Model serializer with sparse fieldsets and expandable relations.
+
+    ``Meta.expandable_fields`` maps a relation name to ``(serializer_class,
+    kwargs)``. Unless the relation is expanded it is rendered as a read-only
+    primary key (or list of keys). The root serializer reads ``fields`` and
+    ``expand`` from the request; nested serializers receive their subtree.
+    """
+
+    def __init__(self, *args, expand=None, fields=None, **kwargs):
+        self._expand = expand
+        self._only = fields
+        super().__init__(*args, **kwargs)
+
+    def get_field_trees(self):
+        if self._expand is None:
+            return get_field_trees(self.context.get('request'))
+        return self._expand, self._only
+
+    def get_fields(self):
+        fields = super().get_fields()
+        expand, only = self.get_field_trees()
+        expandable = getattr(self.Meta, 'expandable_fields', {})
+        for name, (serializer_class, options) in expandable.items():
+            if is_expanded(expand, name, only):
+                fields[name] = serializer_class(
+                    read_only=True,
+                    expand=expand_subtree(expand, name),
+                    fields=(only or {}).get(name) or None,
+                    **options
+                )
+            else:
+                fields[name] = serializers.PrimaryKeyRelatedField(read_only=True, **options)
+        if only is not None:
+            fields = type(fields)((name, field) for name, field in fields.items() if name in only)
+        return fields
+
+
+class GradedListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    """Grade every row of a list in one vectorized lookup, then serialize them."""
+
+    def to_representation(self, data):
+        rows = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        self.child.grade_rows(rows)
+        return super().to_representation(rows)
+
+
+class GradedModelSerializer(ExpandableModelSerializer):
+    """
+    Adds each row's ``grade`` and ``points`` under the ``grading_scheme`` in
+    the context (see grading.py). ``Meta.graded_field`` names the mark to
+    grade and ``Meta.graded_out_of`` the (dotted) path of its maximum, when
+    it is not out of 100. Subclasses set ``GradedListSerializer`` as their
+    ``list_serializer_class``.
+    """
+    grade = serializers.CharField(read_only=True)
+    points = serializers.FloatField(read_only=True)
+
+    def get_percentages(self, rows):
+        marks = [getattr(row, self.Meta.graded_field) for row in rows]
+        out_of = getattr(self.Meta, 'graded_out_of', None)
+        if out_of is None:
+            return to_percentages(marks)
+        # An annotation named after the path's last part spares the join
+        name, get_out_of = out_of.rsplit('.', 1)[-1], attrgetter(out_of)
+        return to_percentages(
+            marks, [getattr(row, name) if hasattr(row, name) else get_out_of(row) for row in rows]
+        )
+
+    def grade_rows(self, rows):
+        scheme = self.context.get('grading_scheme') or get_default_scheme()
+        grade_instances(rows, self.get_percentages(rows), scheme)
+
+    def to_representation(self, instance):
+        # Rows of a list were graded together by GradedListSerializer
+        if not hasattr(instance, 'grade'):
+            self.grade_rows([instance])
+        return super().to_representation(instance)
+
+
 # User Serializer
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(ExpandableModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'email']
 
 # Teacher Serializer
-class TeacherSerializer(serializers.ModelSerializer):
-    user = UserSerializer(read_only=True)
-
+class TeacherSerializer(ExpandableModelSerializer):
     class Meta:
         model = Teacher
         fields = [
@@ -100,112 +227,268 @@ class TeacherSerializer(serializers.ModelSerializer):
             'free_downloads_remaining', 'paid_downloads', 'is_premium',
             'subscription_start_date', 'subscription_end_date'
         ]
+        # Changed only by payments, downloads and the expiry sweep
+        read_only_fields = [
+            'free_downloads_remaining', 'paid_downloads', 'is_premium',
+            'subscription_start_date', 'subscription_end_date',
+        ]
+        expandable_fields = {
+            'user': (UserSerializer, {}),
+        }
 
-# Profile Serializer
-class ProfileSerializer(serializers.ModelSerializer):
-    user = UserSerializer(read_only=True)
+    def update(self, instance, validated_data):
+        for name, value in validated_data.items():
+            setattr(instance, name, value)
+        # Only the edited columns, so downloads counted meanwhile are kept
+        instance.save(update_fields=list(validated_data))
+        return instance
 
+# Profile Serializer
+class ProfileSerializer(ExpandableModelSerializer):
     class Meta:
         model = Profile
         fields = ['id', 'user', 'bio', 'avatar', 'created', 'updated']
+        expandable_fields = {
+            'user': (UserSerializer, {}),
+        }
 
 # Class Serializer
-class ClassSerializer(serializers.ModelSerializer):
-    teacher = TeacherSerializer(read_only=True)
-
+class ClassSerializer(ExpandableModelSerializer):
     class Meta:
         model = Class
         fields = ['id', 'name', 'teacher', 'created', 'updated']
+        expandable_fields = {
+            'teacher': (TeacherSerializer, {}),
+        }
 
 # Subject Serializer
-class SubjectSerializer(serializers.ModelSerializer):
+class SubjectSerializer(ExpandableModelSerializer):
     class Meta:
         model = Subject
         fields = ['id', 'name']
 
 # Exam Serializer
-class ExamSerializer(serializers.ModelSerializer):
-    class_instance = ClassSerializer(read_only=True)
-    teacher = TeacherSerializer(read_only=True)
-
+class ExamSerializer(ExpandableModelSerializer):
     class Meta:
         model = Exam
-        fields = ['id', 'class_instance', 'name', 'date', 'teacher']
+        fields = ['id', 'class_instance', 'name', 'date', 'term', 'year', 'teacher']
+        expandable_fields = {
+            'class_instance': (ClassSerializer, {}),
+            'teacher': (TeacherSerializer, {}),
+        }
 
 # ExamSubject Serializer
-class ExamSubjectSerializer(serializers.ModelSerializer):
-    exam = ExamSerializer(read_only=True)
-    subject = SubjectSerializer(read_only=True)
-
+class ExamSubjectSerializer(ExpandableModelSerializer):
     class Meta:
         model = ExamSubject
         fields = ['id', 'exam', 'subject', 'max_marks']
+        expandable_fields = {
+            'exam': (ExamSerializer, {}),
+            'subject': (SubjectSerializer, {}),
+        }
 
 # Student Serializer
-class StudentSerializer(serializers.ModelSerializer):
-    class_instance = ClassSerializer(read_only=True)
-    subjects = SubjectSerializer(many=True, read_only=True)
-
+class StudentSerializer(ExpandableModelSerializer):
     class Meta:
         model = Student
         fields = [
             'id', 'first_name', 'last_name', 'assessment_no', 'registration_no',
             'age', 'gender', 'class_instance', 'subjects'
         ]
+        expandable_fields = {
+            'class_instance': (ClassSerializer, {}),
+            'subjects': (SubjectSerializer, {'many': True}),
+        }
 
 # Score Serializer
-class ScoreSerializer(serializers.ModelSerializer):
-    student = StudentSerializer(read_only=True)
-    exam_subject = ExamSubjectSerializer(read_only=True)
-
+class ScoreSerializer(GradedModelSerializer):
     class Meta:
         model = Score
-        fields = ['id', 'student', 'exam_subject', 'marks_obtained']
+        fields = ['id', 'student', 'exam_subject', 'marks_obtained', 'grade', 'points']
+        expandable_fields = {
+            'student': (StudentSerializer, {}),
+            'exam_subject': (ExamSubjectSerializer, {}),
+        }
+        list_serializer_class = GradedListSerializer
+        # ScoreViewSet annotates max_marks
+        graded_field = 'marks_obtained'
+        graded_out_of = 'exam_subject.max_marks'
 
 # Result Serializer
-class ResultSerializer(serializers.ModelSerializer):
-    student = StudentSerializer(read_only=True)
-    subject = SubjectSerializer(read_only=True)
-
+class ResultSerializer(GradedModelSerializer):
     class Meta:
         model = Result
-        fields = ['id', 'student', 'subject', 'term', 'year', 'score']
+        fields = ['id', 'student', 'subject', 'term', 'year', 'score', 'grade', 'points']
+        expandable_fields = {
+            'student': (StudentSerializer, {}),
+            'subject': (SubjectSerializer, {}),
+        }
+        list_serializer_class = GradedListSerializer
+        graded_field = 'score'
 
 # StudentReport Serializer
-class StudentReportSerializer(serializers.ModelSerializer):
-    student = StudentSerializer(read_only=True)
+class StudentReportSerializer(GradedModelSerializer):
+    # 'pending' while a score change in this class term awaits recomputation
+    status = serializers.SerializerMethodField()
 
     class Meta:
         model = StudentReport
         fields = [
-            'id', 'student', 'term', 'year', 'comments', 'rank', 'average_score'
+            'id', 'student', 'term', 'year', 'comments', 'rank', 'average_score',
+            'grade', 'points', 'status'
         ]
+        expandable_fields = {
+            'student': (StudentSerializer, {}),
+        }
+        list_serializer_class = GradedListSerializer
+        graded_field = 'average_score'
 
-# ClassPerformance Serializer
-class ClassPerformanceSerializer(serializers.ModelSerializer):
-    school_class = ClassSerializer(read_only=True)
-    top_performer = StudentSerializer(read_only=True)
+    def get_status(self, obj):
+        return 'pending' if getattr(obj, 'is_stale', False) else 'fresh'
 
+# ClassPerformance Serializer
+class ClassPerformanceSerializer(ExpandableModelSerializer):
     class Meta:
         model = ClassPerformance
         fields = [
             'id', 'school_class', 'term', 'year', 'average_score', 'top_performer'
         ]
+        expandable_fields = {
+            'school_class': (ClassSerializer, {}),
+            'top_performer': (StudentSerializer, {}),
+        }
 
 # Subscription Serializer
-class SubscriptionSerializer(serializers.ModelSerializer):
-    teacher = UserSerializer(read_only=True)
-
+class SubscriptionSerializer(ExpandableModelSerializer):
     class Meta:
         model = Subscription
         fields = ['id', 'teacher', 'plan', 'status', 'expiry_date']
+        expandable_fields = {
+            'teacher': (UserSerializer, {}),
+        }
 
 # PaymentRecord Serializer
-class PaymentRecordSerializer(serializers.ModelSerializer):
-    teacher = UserSerializer(read_only=True)
-
+class PaymentRecordSerializer(ExpandableModelSerializer):
     class Meta:
         model = PaymentRecord
         fields = [
             'id', 'teacher', 'amount', 'transaction_id', 'status', 'timestamp'
         ]
+        expandable_fields = {
+            'teacher': (UserSerializer, {}),
+        }
+
+# TeacherSummary Serializer
+class TeacherSummarySerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    is_premium = serializers.SerializerMethodField()
+
+    class Meta:
+        model = TeacherSummary
+        fields = [
+            'class_count', 'student_count', 'exam_count', 'pending_score_count',
+            'is_premium', 'subscription_end_date', 'recent_payments', 'updated'
+        ]
+
+    def get_is_premium(self, obj):
+        # Against today's date, like Teacher.is_subscription_active
+        return bool(
+            obj.is_premium and obj.subscription_end_date
+            and obj.subscription_end_date >= date.today()
+        )
+
+# GradingScheme Serializers
+class GradeBandSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = GradeBand
+        fields = ['grade', 'min_percent', 'points']
+        extra_kwargs = {'min_percent': {'min_value': Decimal(0), 'max_value': Decimal(100)}}
+
+
+class GradingSchemeSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    bands = GradeBandSerializer(many=True)
+
+    class Meta:
+        model = GradingScheme
+        fields = ['id', 'name', 'school_name', 'bands']
+
+    def validate_bands(self, bands):
+        if not bands:
+            raise serializers.ValidationError('A grading scheme needs at least one band.')
+        for field in ('grade', 'min_percent'):
+            values = [band[field] for band in bands]
+            if len(set(values)) != len(values):
+                raise serializers.ValidationError(f'Each band needs a different {field}.')
+        return bands
+
+    @transaction.atomic
+    def create(self, validated_data):
+        bands = validated_data.pop('bands')
+        scheme = GradingScheme.objects.create(**validated_data)
+        GradeBand.objects.bulk_create([GradeBand(scheme=scheme, **band) for band in bands])
+        return scheme
+
+    @transaction.atomic
+    def update(self, instance, validated_data):
+        # Bands are replaced as a whole
+        bands = validated_data.pop('bands', None)
+        instance = super().update(instance, validated_data)
+        if bands is not None:
+            instance.bands.all().delete()
+            GradeBand.objects.bulk_create([GradeBand(scheme=instance, **band) for band in bands])
+        return instance
+
+# Bulk score entry serializers
+class BulkScoreRowSerializer(serializers.Serializer):
+    student = serializers.IntegerField()
+    exam_subject = serializers.IntegerField()
+    marks_obtained = serializers.FloatField(allow_null=True, min_value=0)
+
+
+class BulkScoreSerializer(serializers.Serializer):
+    exam = serializers.IntegerField()
+    scores = serializers.ListField(child=serializers.DictField(), allow_empty=False)
+
+
+# Term request serializers
+class TermSerializer(serializers.Serializer):
+    term = serializers.IntegerField(min_value=1, max_value=3)
+    year = serializers.IntegerField(min_value=2000)
+
+
+class RankingRequestSerializer(TermSerializer):
+    method = serializers.ChoiceField(choices=['competition', 'dense'], default='competition')
+
+
+# Marksheet export request serializer
+class ExportRequestSerializer(serializers.Serializer):
+    type = serializers.ChoiceField(choices=['csv', 'xlsx'], default='csv')
+    term = serializers.IntegerField(min_value=1, max_value=3, required=False)
+    year = serializers.IntegerField(min_value=2000, required=False)
+
+
+# Register import request serializer
+class RegisterImportSerializer(serializers.Serializer):
+    file = serializers.FileField()
+    class_instance = serializers.IntegerField()
+    exam = serializers.IntegerField(required=False)
+
+    def validate_file(self, value):
+        if not value.name.lower().endswith(('.csv', '.xlsx')):
+            raise serializers.ValidationError('Upload a .csv or .xlsx file.')
+        return value
+
+
+# Bulk teacher provisioning serializers
+class TeacherProvisionRowSerializer(serializers.Serializer):
+    username = serializers.CharField(max_length=150, validators=[UnicodeUsernameValidator()])
+    email = serializers.EmailField(required=False, default='')
+    password = serializers.CharField()
+    school_name = serializers.CharField(max_length=100, required=False, default='')
+    mobile_phone = serializers.CharField(
+        max_length=10, required=False, default='',
+        validators=[RegexValidator(regex=r'^\d{10}$', message="Phone number must be 10 digits.")]
+    )
+
+
+class TeacherProvisionSerializer(serializers.Serializer):
+    teachers = serializers.ListField(child=serializers.DictField(), allow_empty=False)
@@ -1,14 +1,195 @@
 # signals.py
 
-from django.db.models.signals import post_save
+from django.contrib.auth.models import User
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_save, post_delete
 from django.dispatch import receiver
-from .models import Teacher, Profile
+from rest_framework.authtoken.models import Token
+from .authentication import invalidate_tokens, invalidate_user_tokens
+from .bulk import propagate_score_changes
+from .caching import (
+    invalidate_class_responses, invalidate_exam_results, invalidate_shared_responses,
+    invalidate_teacher_responses, invalidate_user_responses,
+)
+from .dashboard import refresh_teacher_summaries_on_commit
+from .grading import invalidate_grading_schemes, invalidate_user_grading_scheme
+from .metrics import install_query_recorder
+from .models import (
+    Teacher, Profile, Score, Class, Student, ClassPerformance, Subject, ExamSubject, Result,
+    Exam, PaymentRecord, GradingScheme, GradeBand,
+)
+from .progress import refresh_progress_series_on_commit
+from .subscriptions import invalidate_entitlement
+
+
+@receiver(connection_created)
+def record_connection_queries(sender, connection, **kwargs):
+    # Count and time every query of the request (see back_api.metrics)
+    install_query_recorder(connection)
+
 
 @receiver(post_save, sender=Teacher)
 def create_or_update_profile(sender, instance, created, **kwargs):
     if created:
         # Create a Profile associated with the Teacher's user
-        Profile.objects.create(user=instance.user)
+        Profile.objects.create(user_id=instance.user_id)
+    # Cached premium status and download counts may have changed
+    invalidate_entitlement(instance.id)
+
+
+def is_cascade(sender, origin):
+    # Rows deleted along with a parent are covered by the parent's refresh
+    if origin is None:
+        return False
+    return getattr(origin, 'model', type(origin)) is not sender
+
+
+@receiver(post_save, sender=Score)
+@receiver(post_delete, sender=Score)
+def propagate_score_change(sender, instance, signal, origin=None, **kwargs):
+    # Scores deleted with a student, exam or subject are propagated as a set
+    # by the view deleting them (see bulk.deleting_scores)
+    if is_cascade(sender, origin):
+        return
+    # A deleted score leaves the leaderboard just like a cleared one
+    marks = None if signal is post_delete else instance.marks_obtained
+    exam_subjects = ExamSubject.objects.select_related('exam').filter(pk=instance.exam_subject_id).in_bulk()
+    propagate_score_changes([(instance.student_id, instance.exam_subject_id, marks)], exam_subjects)
+    # The summary counts missing marks, which changing a mark leaves alone
+    cell = (instance.student_id, instance.exam_subject_id, marks is not None)
+    if exam_subjects and (signal is post_delete or cell != getattr(instance, '_loaded_cell', None)):
+        refresh_teacher_summaries_on_commit([exam_subjects[instance.exam_subject_id].exam.teacher_id])
+
+
+@receiver(post_delete, sender=Token)
+def evict_deleted_token(sender, instance, **kwargs):
+    invalidate_tokens([instance.key])
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Teacher)
+@receiver(post_delete, sender=Teacher)
+def evict_user_tokens(sender, instance, **kwargs):
+    # Covers deactivation and changes to the cached user or teacher id
+    invalidate_user_tokens(instance.id if sender is User else instance.user_id)
+
+
+# Cached responses (see caching.py) of the teacher whose data changed
+@receiver(post_save, sender=User)
+def invalidate_own_responses(sender, instance, **kwargs):
+    invalidate_user_responses(instance.id)
+
+
+@receiver(post_save, sender=Teacher)
+@receiver(post_delete, sender=Teacher)
+def invalidate_teacher_owner_responses(sender, instance, **kwargs):
+    invalidate_user_responses(instance.user_id)
+
+
+@receiver(post_save, sender=Class)
+@receiver(post_delete, sender=Class)
+def invalidate_class_owner_responses(sender, instance, **kwargs):
+    invalidate_teacher_responses(instance.teacher_id)
+
+
+@receiver(post_save, sender=Student)
+@receiver(post_delete, sender=Student)
+def invalidate_student_owner_responses(sender, instance, **kwargs):
+    invalidate_class_responses(instance.class_instance_id)
+
+
+@receiver(post_save, sender=ClassPerformance)
+@receiver(post_delete, sender=ClassPerformance)
+def invalidate_performance_owner_responses(sender, instance, **kwargs):
+    invalidate_class_responses(instance.school_class_id)
+
+
+@receiver(m2m_changed, sender=Student.subjects.through)
+def invalidate_student_subject_responses(sender, instance, action, reverse, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        # Edited from the subject's side, which may reach any teacher
+        invalidate_shared_responses()
     else:
-        # Update the existing profile if needed
-        instance.user.profile.save()
+        invalidate_class_responses(instance.class_instance_id)
+
+
+@receiver(post_save, sender=Subject)
+@receiver(post_delete, sender=Subject)
+def invalidate_subject_responses(sender, instance, **kwargs):
+    invalidate_shared_responses()
+
+
+# Results derived from an exam's subjects (see exam_statistics.py)
+@receiver(post_save, sender=ExamSubject)
+@receiver(post_delete, sender=ExamSubject)
+def invalidate_exam_subject_results(sender, instance, **kwargs):
+    invalidate_exam_results(instance.exam_id)
+
+
+@receiver(post_save, sender=Result)
+@receiver(post_delete, sender=Result)
+def refresh_result_progress(sender, instance, origin=None, **kwargs):
+    # Series are deleted along with their student or subject
+    if is_cascade(sender, origin):
+        return
+    # Both the series the result is in now and the one it was loaded from
+    refresh_progress_series_on_commit({
+        (instance.student_id, instance.subject_id),
+        getattr(instance, '_loaded_series', (None, None)),
+    })
+
+
+# Dashboard summaries (see dashboard.py), refreshed once the write commits
+@receiver(post_save, sender=Teacher)
+def refresh_teacher_summary(sender, instance, **kwargs):
+    refresh_teacher_summaries_on_commit([instance.id])
+
+
+@receiver(post_save, sender=Class)
+@receiver(post_delete, sender=Class)
+@receiver(post_save, sender=Exam)
+@receiver(post_delete, sender=Exam)
+def refresh_owner_summary(sender, instance, **kwargs):
+    refresh_teacher_summaries_on_commit([instance.teacher_id])
+
+
+@receiver(post_save, sender=Student)
+@receiver(post_delete, sender=Student)
+def refresh_student_summary(sender, instance, signal, origin=None, **kwargs):
+    if is_cascade(sender, origin):
+        return
+    # The teachers of both the student's class and the one they moved from
+    loaded_class_id = getattr(instance, '_loaded_class_id', None)
+    if signal is post_delete or instance.class_instance_id != loaded_class_id:
+        refresh_teacher_summaries_on_commit(
+            class_ids={instance.class_instance_id, loaded_class_id} - {None}
+        )
+
+
+@receiver(post_save, sender=ExamSubject)
+@receiver(post_delete, sender=ExamSubject)
+def refresh_exam_subject_summary(sender, instance, **kwargs):
+    refresh_teacher_summaries_on_commit(exam_ids=[instance.exam_id])
+
+
+@receiver(post_save, sender=PaymentRecord)
+@receiver(post_delete, sender=PaymentRecord)
+def refresh_payment_summary(sender, instance, **kwargs):
+    refresh_teacher_summaries_on_commit(user_ids=[instance.teacher_id])
+
+
+# Compiled grading schemes (see grading.py)
+@receiver(post_save, sender=GradingScheme)
+@receiver(post_delete, sender=GradingScheme)
+@receiver(post_save, sender=GradeBand)
+@receiver(post_delete, sender=GradeBand)
+def invalidate_compiled_schemes(sender, instance, **kwargs):
+    invalidate_grading_schemes()
+
+
+@receiver(post_save, sender=Teacher)
+def invalidate_teacher_grading_scheme(sender, instance, **kwargs):
+    # The teacher's school, and so their scheme, may have changed
+    invalidate_user_grading_scheme(instance.user_id)
@@ -0,0 +1,62 @@
+from collections import namedtuple
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .caching import invalidate_teacher_responses
+from .models import Subscription, Teacher
+
+
+Entitlement = namedtuple(
+    'Entitlement',
+    'is_premium subscription_end_date free_downloads_remaining paid_downloads',
+)
+
+
+def expire_lapsed_subscriptions(today=None):
+    """
+    Expire every lapsed premium teacher and subscription with one set-based
+    ``UPDATE`` each, instead of waiting for each ``Teacher`` to be saved.
+    Lapsed teacher ids are read first to retire their cached responses.
+    """
+    today = today or date.today()
+    lapsed = list(Teacher.objects.filter(
+        is_premium=True, subscription_end_date__lt=today
+    ).values_list('id', flat=True))
+    teachers = Teacher.objects.filter(id__in=lapsed, is_premium=True).update(is_premium=False)
+    if teachers:
+        invalidate_teacher_responses(*lapsed)
+    subscriptions = Subscription.objects.filter(
+        status='active', expiry_date__lt=today
+    ).update(status='inactive')
+    return teachers, subscriptions
+
+
+def _entitlement_key(teacher_id):
+    return f'entitlement:{teacher_id}'
+
+
+def get_entitlement(teacher_id):
+    """
+    A teacher's premium status and remaining downloads, from the cache.
+
+    Premium status is worked out against today's date on every read, so a
+    cached entry stays correct across an expiry that the sweeper has not
+    applied yet. Returns ``None`` for an unknown teacher.
+    """
+    key = _entitlement_key(teacher_id)
+    row = cache.get(key)
+    if row is None:
+        row = Teacher.objects.filter(pk=teacher_id).values_list(
+            'is_premium', 'subscription_end_date', 'free_downloads_remaining', 'paid_downloads'
+        ).first()
+        if row is None:
+            return None
+        cache.set(key, row, getattr(settings, 'ENTITLEMENT_CACHE_TTL', 60))
+    is_premium, end_date, free_downloads, paid_downloads = row
+    return Entitlement(is_premium and end_date >= date.today(), end_date, free_downloads, paid_downloads)
+
+
+def invalidate_entitlement(teacher_id):
+    cache.delete(_entitlement_key(teacher_id))
@@ -1,3 +1,1734 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import zipfile
+from datetime import date, timedelta
+from io import BytesIO, StringIO
+from importlib import import_module
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+import numpy as np
+from openpyxl import Workbook, load_workbook
+import pandas as pd
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from Fl_Backend.asgi import application as asgi_application
+from .authentication import CachedTokenAuthentication, get_token_cache
+from .bulk import bulk_upsert_scores
+from .backends.sqlite3.base import DatabaseWrapper
+from .dashboard import refresh_teacher_summaries
+from .db_routers import replica_reads, routing_scope, sync_replica
+from .grading import CompiledScheme, get_grading_scheme, to_percentages
+from .imports import DUPLICATE_ASSESSMENT_NO, RegisterImport
+from .progress import refresh_progress_series
+from .ranking import compute_term_rankings, load_term_scores, rank_students, summarise_classes
+from .report_cards import collect_cards, render_cards
+from .serializers import ScoreSerializer
+from .subscriptions import expire_lapsed_subscriptions, get_entitlement
+from .reports import mark_stale, refresh_stale_reports
+from .caching import invalidate_class_responses
+from . import quotas
+from .quotas import DownloadQuotaBuffer, consume_download, record_download, refund_download
+from .metrics import registry
+from .models import (
+    Teacher, Profile, Class, Subject, Exam, ExamSubject, Student, Score, Result,
+    StudentReport, ClassPerformance, Subscription, PaymentRecord, ProgressSeries, TeacherSummary,
+    GradingScheme, StaleReport,
+)
+
+
+# The in-process report refresh (see reports.schedule_refresh) runs on a
+# timer thread that would outlive the test that started it
+no_report_refresh = override_settings(REPORT_REFRESH_DELAY=None)
+
+
+def setUpModule():
+    no_report_refresh.enable()
+
+
+def tearDownModule():
+    no_report_refresh.disable()
+
+
+def create_teacher(username, **kwargs):
+    user = User.objects.create_user(username=username, password='pass1234', **kwargs)
+    teacher = Teacher.objects.create(
+        user=user, email=f'{username}@example.com', mobile_phone='0712345678'
+    )
+    # Query budgets are for a warm grading scheme cache (one query when cold)
+    get_grading_scheme(user.id)
+    return teacher
+
+
+def create_school(teacher, students=3, subjects=None, prefix=''):
+    """Create a class with an exam, scores, results and reports for ``teacher``."""
+    subjects = subjects or [
+        Subject.objects.create(name=name) for name in ('Maths', 'English', 'Science')
+    ]
+    school_class = Class.objects.create(name=f'{prefix}Grade 4', teacher=teacher)
+    exam = Exam.objects.create(class_instance=school_class, name='End Term', teacher=teacher)
+    exam_subjects = [
+        ExamSubject.objects.create(exam=exam, subject=subject, max_marks=50)
+        for subject in subjects
+    ]
+    pupils = []
+    for i in range(students):
+        student = Student.objects.create(
+            first_name=f'Pupil{i}', last_name='Test', gender='F',
+            assessment_no=f'{prefix}{teacher.id}-{school_class.id}-{i}',
+            class_instance=school_class,
+        )
+        student.subjects.set(subjects)
+        pupils.append(student)
+        for j, exam_subject in enumerate(exam_subjects):
+            Score.objects.create(
+                student=student, exam_subject=exam_subject, marks_obtained=20 + i + j
+            )
+            Result.objects.create(
+                student=student, subject=exam_subject.subject, term=1, year=2024,
+                score=40 + i + j,
+            )
+        StudentReport.objects.create(
+            student=student, term=1, year=2024, comments='', rank=i + 1,
+            average_score=50,
+        )
+    ClassPerformance.objects.create(
+        school_class=school_class, term=1, year=2024, average_score=50,
+        top_performer=pupils[0],
+    )
+    return school_class, exam, subjects
+
+
+class SchoolTestCase(TestCase):
+    """``teacher``, a school of ``students`` from ``create_school``, and a client signed in as the teacher."""
+    students = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = create_teacher('teacher')
+        cls.school_class, cls.exam, cls.subjects = create_school(cls.teacher, students=cls.students)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.teacher.user)
+
+
+@override_settings(RESPONSE_CACHE_TTL=None)
+class UncachedTestCase(SchoolTestCase):
+    """Measures the queries behind responses, so nothing may come from the cache."""
+
+
+class BulkScoreTests(SchoolTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other = create_teacher('other')
+        cls.other_class, cls.other_exam, _ = create_school(cls.other, subjects=cls.subjects, prefix='o-')
+        cls.pupils = list(cls.school_class.students.order_by('id'))
+        cls.exam_subjects = list(cls.exam.exam_subjects.order_by('id'))
+
+    def row(self, student, exam_subject, marks):
+        return {'student': student.id, 'exam_subject': exam_subject.id, 'marks_obtained': marks}
+
+    def test_rows_are_upserted_and_errors_reported_per_row(self):
+        maths, english, _ = self.exam_subjects
+        Score.objects.filter(student=self.pupils[2], exam_subject=english).delete()
+        outsider = self.other_class.students.first()
+        rows = [
+            self.row(self.pupils[0], maths, 45),
+            self.row(self.pupils[2], english, 30),
+            self.row(self.pupils[1], maths, 51),
+            self.row(outsider, maths, 10),
+            self.row(self.pupils[1], self.other_exam.exam_subjects.first(), 10),
+            self.row(self.pupils[0], maths, 40),
+            {'student': 'one', 'exam_subject': maths.id},
+            self.row(self.pupils[1], english, None),
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/scores/bulk/', {'exam': self.exam.id, 'scores': rows}, format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            (response.data['created'], response.data['updated'], response.data['errors']), (1, 2, 5)
+        )
+        results = response.data['results']
+        statuses = [(result['status'], sorted(result.get('errors', ()))) for result in results]
+        self.assertEqual(statuses, [
+            ('updated', []),
+            ('created', []),
+            ('error', ['marks_obtained']),
+            ('error', ['student']),
+            ('error', ['exam_subject']),
+            ('error', ['non_field_errors']),
+            ('error', ['marks_obtained', 'student']),
+            ('updated', []),
+        ])
+        marks = dict(Score.objects.values_list('id', 'marks_obtained'))
+        self.assertEqual([marks[results[i]['id']] for i in (0, 1, 7)], [45, 30, None])
+        self.assertEqual(Score.objects.get(student=self.pupils[1], exam_subject=maths).marks_obtained, 21)
+        self.assertFalse(Score.objects.filter(marks_obtained=10).exists())
+        self.assertEqual(
+            list(StaleReport.objects.values_list('school_class_id', flat=True)), [self.school_class.id]
+        )
+
+    def test_queries_do_not_grow_with_rows(self):
+        def count(pupils):
+            rows = [self.row(pupil, es, 25) for pupil in pupils for es in self.exam_subjects]
+            with CaptureQueriesContext(connection) as queries:
+                report = bulk_upsert_scores(self.exam, rows)
+            self.assertEqual(report['updated'], len(rows))
+            return len(queries)
+
+        self.assertEqual(count(self.pupils[:1]), count(self.pupils))
+
+    def test_other_teachers_exams_are_not_found(self):
+        rows = [self.row(self.other_class.students.first(), self.other_exam.exam_subjects.first(), 1)]
+        response = self.client.post(
+            '/api/scores/bulk/', {'exam': self.other_exam.id, 'scores': rows}, format='json'
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Score.objects.filter(marks_obtained=1).exists())
+        response = self.client.post('/api/scores/bulk/', {'exam': self.exam.id, 'scores': []}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class QueryBudgetTests(UncachedTestCase):
+    """
+    Every list endpoint runs a fixed number of queries regardless of how
+    many rows it returns. A regression in a ViewSet's query plan shows up
+    here as a changed query count.
+    """
+    # Relations are collapsed to primary keys by default; only the
+    # many-to-many Student.subjects needs a prefetch.
+    budgets = {
+        '/api/teachers/': 1,
+        '/api/profiles/': 1,
+        '/api/classes/': 1,
+        '/api/subjects/': 1,
+        '/api/exams/': 1,
+        '/api/exam-subjects/': 1,
+        '/api/students/': 2,
+        '/api/scores/': 1,
+        '/api/results/': 1,
+        '/api/student-reports/': 1,
+        '/api/class-performance/': 1,
+        '/api/subscriptions/': 1,
+        '/api/payment-records/': 1,
+    }
+    # Fully nested responses (``?expand=*``)
+    expanded_budgets = {
+        '/api/teachers/': 1,
+        '/api/profiles/': 1,
+        '/api/classes/': 1,
+        '/api/subjects/': 1,
+        '/api/exams/': 1,
+        '/api/exam-subjects/': 1,
+        '/api/students/': 2,
+        '/api/scores/': 3,  # exams are prefetched apart from the scores
+        '/api/results/': 2,
+        '/api/student-reports/': 2,
+        '/api/class-performance/': 2,
+        '/api/subscriptions/': 1,
+        '/api/payment-records/': 1,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other = create_teacher('other')
+        cls.staff = User.objects.create_user('staff', password='pass1234', is_staff=True)
+        get_grading_scheme(cls.staff.id)
+        create_school(cls.other, subjects=cls.subjects)
+        for teacher in (cls.teacher, cls.other):
+            Subscription.objects.create(
+                teacher=teacher.user, status='active',
+                expiry_date=date.today() + timedelta(days=30),
+            )
+            PaymentRecord.objects.create(
+                teacher=teacher.user, amount=100, status='completed',
+                transaction_id=f'TX-{teacher.id}',
+            )
+
+    def assertBudgets(self, user, budgets=None, query=''):
+        client = APIClient()
+        client.force_authenticate(user)
+        for url, budget in (budgets or self.budgets).items():
+            with self.subTest(url=url, query=query):
+                with self.assertNumQueries(budget):
+                    response = client.get(url + query)
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(response.data['results'])
+
+    def test_teacher_list_budgets(self):
+        self.assertBudgets(self.teacher.user)
+        self.assertBudgets(self.teacher.user, self.expanded_budgets, '?expand=*')
+
+    def test_staff_list_budgets(self):
+        self.assertBudgets(self.staff)
+        self.assertBudgets(self.staff, self.expanded_budgets, '?expand=*')
+
+    def test_budgets_do_not_grow_with_rows(self):
+        create_school(self.teacher, students=10, prefix='extra-')
+        self.assertBudgets(self.teacher.user)
+        self.assertBudgets(self.staff)
+        self.assertBudgets(self.teacher.user, self.expanded_budgets, '?expand=*')
+        self.assertBudgets(self.staff, self.expanded_budgets, '?expand=*')
+
+
+class SparseFieldsetTests(UncachedTestCase):
+    students = 2
+
+    def test_relations_collapse_to_primary_keys(self):
+        score = self.client.get('/api/scores/').data['results'][0]
+        self.assertIsInstance(score['student'], int)
+        self.assertIsInstance(score['exam_subject'], int)
+
+    def test_expand_nests_only_requested_relations(self):
+        # One query for the scores and one for the student's subject keys
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/scores/?expand=student.class_instance')
+        score = response.data['results'][0]
+        self.assertIsInstance(score['exam_subject'], int)
+        self.assertEqual(score['student']['class_instance']['name'], 'Grade 4')
+        self.assertIsInstance(score['student']['class_instance']['teacher'], int)
+        self.assertEqual(len(score['student']['subjects']), 3)
+
+    def test_fields_narrow_response_and_skip_joins(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/students/?fields=id,first_name')
+        self.assertEqual(set(response.data['results'][0]), {'id', 'first_name'})
+
+    def test_nested_fields_imply_expansion(self):
+        response = self.client.get('/api/scores/?fields=id,student.first_name')
+        self.assertEqual(response.data['results'][0]['student'], {'first_name': 'Pupil0'})
+
+
+class PaginationTests(SchoolTestCase):
+    students = 5
+
+    def test_cursor_pages_cover_every_row_without_counting(self):
+        url, seen = '/api/scores/?page_size=4', []
+        while url:
+            with self.assertNumQueries(1) as queries:
+                response = self.client.get(url)
+            self.assertNotIn('COUNT(', queries.captured_queries[0]['sql'])
+            self.assertLessEqual(len(response.data['results']), 4)
+            seen.extend(row['id'] for row in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, list(Score.objects.order_by('id').values_list('id', flat=True)))
+
+
+class RankingTests(SchoolTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other = create_teacher('other')
+        create_school(cls.other, subjects=cls.subjects, prefix='o-')
+        # The term create_school's reports are for
+        Exam.objects.update(term=1, year=2024)
+        cls.pupils = list(cls.school_class.students.order_by('id').values_list('id', flat=True))
+
+    def test_ties_and_rank_methods(self):
+        # Marks out of 50, without a maximum (so out of 100) and out of 100
+        scores = pd.DataFrame.from_records([
+            (1, 10, 45, 50), (1, 11, 80, None), (1, 12, 80, 100), (1, 13, 30, 50),
+            (2, 20, 10, 50), (2, 20, 50, 100),
+        ], columns=['class_id', 'student_id', 'marks', 'max_marks'])
+        for method, ranks in (('competition', [1, 2, 2, 4, 1]), ('dense', [1, 2, 2, 3, 1])):
+            with self.subTest(method=method):
+                students = rank_students(scores, method).sort_values('student_id')
+                self.assertEqual(students['average'].tolist(), [90, 80, 80, 60, 35])
+                self.assertEqual(students['rank'].tolist(), ranks)
+
+        classes = summarise_classes(rank_students(scores)).set_index('class_id')
+        self.assertEqual(classes.loc[1].tolist(), [77.5, 10])
+        self.assertEqual(classes.loc[2].tolist(), [35, 20])
+
+    def test_only_changed_reports_are_written(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            summary = compute_term_rankings(1, 2024, class_ids=[self.school_class.id])
+        self.assertEqual(summary, {
+            'students': 3, 'classes': 1, 'reports_created': 0, 'reports_updated': 3,
+            'performances_created': 0, 'performances_updated': 1,
+        })
+        # Pupil i has 20 + i, 21 + i and 22 + i out of 50
+        reports = StudentReport.objects.filter(student_id__in=self.pupils).order_by('student_id')
+        self.assertEqual([(r.rank, float(r.average_score)) for r in reports], [(3, 42), (2, 44), (1, 46)])
+        performance = ClassPerformance.objects.get(school_class=self.school_class)
+        self.assertEqual(float(performance.average_score), 44)
+        self.assertEqual(performance.top_performer_id, self.pupils[2])
+
+        with CaptureQueriesContext(connection) as queries:
+            summary = compute_term_rankings(1, 2024, class_ids=[self.school_class.id])
+        self.assertEqual((summary['reports_updated'], summary['performances_updated']), (0, 0))
+        writes = [query['sql'] for query in queries if query['sql'].startswith(('INSERT', 'UPDATE'))]
+        self.assertEqual(writes, [])
+
+    def test_rankings_action_and_command(self):
+        url = f'/api/classes/{self.school_class.id}/rankings/'
+        response = self.client.post(url, {'term': 1, 'year': 2024, 'method': 'dense'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['students'], response.data['classes']), (3, 1))
+        self.assertEqual(self.client.post(url, {'term': 4, 'year': 2024}, format='json').status_code, 400)
+        other_class = Class.objects.get(teacher=self.other)
+        response = self.client.post(
+            f'/api/classes/{other_class.id}/rankings/', {'term': 1, 'year': 2024}, format='json'
+        )
+        self.assertEqual(response.status_code, 404)
+
+        out = StringIO()
+        call_command('compute_rankings', '--term', '1', '--year', '2024', stdout=out)
+        self.assertIn('Ranked 6 students in 2 classes', out.getvalue())
+        self.assertIn('(0 reports created, 3 updated)', out.getvalue())
+
+
+class ExportTests(SchoolTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.staff = User.objects.create_user('staff', password='pass1234', is_staff=True)
+        Exam.objects.filter(pk=cls.exam.pk).update(term=1, year=2024)
+        # A second term's exam with one paper and one mark left blank
+        opener = Exam.objects.create(
+            class_instance=cls.school_class, name='Opener', teacher=cls.teacher, term=2, year=2024
+        )
+        paper = ExamSubject.objects.create(exam=opener, subject=cls.subjects[0], max_marks=100)
+        for i, student in enumerate(cls.school_class.students.order_by('id')):
+            Score.objects.create(student=student, exam_subject=paper, marks_obtained=None if i else 90)
+
+    def download(self, url, user=None):
+        if user is not None:
+            self.client.force_authenticate(user)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_exam_csv(self):
+        body = self.download(f'/api/exams/{self.exam.id}/export/')
+        rows = list(csv.reader(StringIO(body.decode())))
+        self.assertEqual(rows[0], ['Assessment No', 'First Name', 'Last Name', 'Maths', 'English', 'Science'])
+        self.assertEqual([row[1:] for row in rows[1:]], [
+            ['Pupil0', 'Test', '20.0', '21.0', '22.0'],
+            ['Pupil1', 'Test', '21.0', '22.0', '23.0'],
+            ['Pupil2', 'Test', '22.0', '23.0', '24.0'],
+        ])
+
+    def test_students_without_marks_are_listed(self):
+        Student.objects.create(
+            first_name='New', last_name='Arrival', gender='F', assessment_no='new',
+            class_instance=self.school_class,
+        )
+        body = self.download(f'/api/exams/{self.exam.id}/export/')
+        rows = list(csv.reader(StringIO(body.decode())))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[1], ['new', 'New', 'Arrival', '', '', ''])
+
+    def test_class_xlsx_by_term(self):
+        url = f'/api/classes/{self.school_class.id}/export/?type=xlsx'
+        sheet = load_workbook(BytesIO(self.download(url)), read_only=True)['Marksheet']
+        rows = list(sheet.values)
+        self.assertEqual(rows[0][3:], (
+            'End Term - Maths', 'End Term - English', 'End Term - Science', 'Opener - Maths',
+        ))
+        self.assertEqual(
+            [row[3:] for row in rows[1:]], [(20, 21, 22, 90), (21, 22, 23, None), (22, 23, 24, None)]
+        )
+
+        term = self.download(f'{url}&term=2&year=2024')
+        sheet = load_workbook(BytesIO(term), read_only=True)['Marksheet']
+        self.assertEqual([row[3:] for row in sheet.values], [('Opener - Maths',), (90,), (None,), (None,)])
+
+    def test_downloads_are_charged_to_teachers_only(self):
+        self.assertEqual(self.client.get(f'/api/exams/{self.exam.id}/export/?type=pdf').status_code, 400)
+        self.download(f'/api/exams/{self.exam.id}/export/')
+        self.download(f'/api/classes/{self.school_class.id}/export/')
+        self.download(f'/api/exams/{self.exam.id}/export/', user=self.staff)
+        self.teacher.refresh_from_db()
+        self.assertEqual(self.teacher.free_downloads_remaining, 8)
+
+
+class RegisterImportTests(SchoolTestCase):
+    students = 1
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other = create_teacher('other')
+        cls.other_class, _, _ = create_school(cls.other, students=1, subjects=cls.subjects, prefix='o-')
+
+    def upload(self, name, content, **data):
+        data.setdefault('class_instance', self.school_class.id)
+        data['file'] = SimpleUploadedFile(name, content)
+        return self.client.post('/api/students/import/', data, format='multipart')
+
+    def test_csv_rows_are_validated_and_inserted(self):
+        existing = self.school_class.students.get().assessment_no
+        content = '\n'.join([
+            'First Name,Last Name,Assessment No,Gender,Age,Subjects,Maths,English',
+            'Amani,Otieno,A-1,male,10,"Maths, English",40,45',
+            'Baraka,Mwangi,A-1,M,10,Maths,,',
+            f'Chebet,Too,{existing},F,10,Maths,,',
+            'Imani,Kamau,A-4,X,10,Maths,,',
+            'Jabari,Omondi,A-5,M,10,Art,,',
+            'Makena,Njeri,A-6,F,ten,Maths,51,',
+            ',,,,,,,',
+            'Zawadi,Wafula,A-7,f,11.0,Maths,,30',
+        ]).encode()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.upload('register.csv', content, exam=self.exam.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            (response.data['rows'], response.data['created'], response.data['scores_created']), (7, 2, 3)
+        )
+        self.assertEqual(
+            [(error['row'], sorted(error['errors'])) for error in response.data['errors']],
+            [(3, ['assessment_no']), (4, ['assessment_no']), (5, ['gender']), (6, ['subjects']),
+             (7, ['Maths', 'age'])],
+        )
+        amani = Student.objects.get(assessment_no='A-1')
+        self.assertEqual((amani.first_name, amani.gender, amani.age), ('Amani', 'M', 10))
+        self.assertEqual(sorted(amani.subjects.values_list('name', flat=True)), ['English', 'Maths'])
+        self.assertEqual(
+            sorted(Score.objects.filter(student__assessment_no__in=['A-1', 'A-7'])
+                   .values_list('exam_subject__subject__name', 'marks_obtained')),
+            [('English', 30), ('English', 45), ('Maths', 40)],
+        )
+        self.assertTrue(StaleReport.objects.filter(school_class=self.school_class).exists())
+
+    def test_xlsx_and_missing_columns(self):
+        workbook = Workbook()
+        workbook.active.append(['first_name', 'last_name', 'assessment_no', 'gender'])
+        workbook.active.append(['Faith', 'Barasa', 'X-1', 'F'])
+        output = BytesIO()
+        workbook.save(output)
+        response = self.upload('register.xlsx', output.getvalue())
+        self.assertEqual((response.data['created'], response.data['errors']), (1, []))
+        self.assertEqual(Student.objects.get(assessment_no='X-1').class_instance, self.school_class)
+
+        response = self.upload('register.csv', b'First Name,Last Name\nFaith,Barasa\n')
+        self.assertEqual(
+            response.data['errors'], [{'row': 1, 'errors': {'assessment_no': ['Missing column.']}}]
+        )
+        self.assertEqual(self.upload('register.txt', b'').status_code, 400)
+
+    def test_assessment_numbers_taken_during_the_import_are_reported(self):
+        register = RegisterImport(self.school_class)
+        # Another import inserts X-2 after this one fetched the taken numbers
+        Student.objects.create(
+            first_name='Faith', last_name='Barasa', assessment_no='X-2', gender='F',
+            class_instance=self.other_class,
+        )
+        report = register.run([
+            ['first_name', 'last_name', 'assessment_no', 'gender'],
+            ['Amani', 'Otieno', 'X-1', 'M'],
+            ['Baraka', 'Mwangi', 'X-2', 'M'],
+            ['Chebet', 'Too', 'X-3', 'X'],
+        ])
+        self.assertEqual((report['created'], [error['row'] for error in report['errors']]), (1, [3, 4]))
+        self.assertEqual(report['errors'][0]['errors'], {'assessment_no': [DUPLICATE_ASSESSMENT_NO]})
+        self.assertEqual(Student.objects.get(assessment_no='X-2').first_name, 'Faith')
+        self.assertTrue(Student.objects.filter(assessment_no='X-1', class_instance=self.school_class).exists())
+
+    def test_other_teachers_classes_and_exams_are_not_found(self):
+        content = b'first_name,last_name,assessment_no,gender\nFaith,Barasa,X-1,F\n'
+        response = self.upload('register.csv', content, class_instance=self.other_class.id)
+        self.assertEqual(response.status_code, 404)
+        other_exam = self.other_class.exams.get()
+        self.assertEqual(self.upload('register.csv', content, exam=other_exam.id).status_code, 404)
+        self.assertFalse(Student.objects.filter(assessment_no='X-1').exists())
+
+
+class ReportCardTests(SchoolTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Exam.objects.filter(pk=cls.exam.pk).update(term=1, year=2024)
+        cls.pupils = list(cls.school_class.students.order_by('id'))
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = override_settings(REPORT_CARD_CACHE_DIR=directory.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        super().setUp()
+
+    def test_cards_hold_the_terms_marks_in_fixed_queries(self):
+        def count(school_class):
+            with CaptureQueriesContext(connection) as queries:
+                cards = collect_cards(school_class, 1, 2024)
+            return cards, len(queries)
+
+        cards, queries = count(Class.objects.get(pk=self.school_class.pk))
+        card = cards[0]
+        self.assertEqual((card['class_size'], card['term'], card['year']), (3, 1, 2024))
+        self.assertEqual(card['report'], {'rank': 1, 'average_score': '50.00', 'comments': ''})
+        self.assertEqual([result['subject'] for result in card['results']], ['English', 'Maths', 'Science'])
+        self.assertEqual(
+            [(score['subject'], score['marks'], score['max_marks']) for score in card['scores']],
+            [('English', 21, 50), ('Maths', 20, 50), ('Science', 22, 50)],
+        )
+        subjects = list(Subject.objects.all())
+        extra, _, _ = create_school(self.teacher, students=6, subjects=subjects, prefix='x-')
+        Exam.objects.update(term=1, year=2024)
+        cards, extra_queries = count(Class.objects.get(pk=extra.pk))
+        self.assertEqual((len(cards), len(cards[0]['scores']), extra_queries), (6, 3, queries))
+
+        card, = collect_cards(self.school_class, 1, 2024, student_ids=[self.pupils[1].id])
+        self.assertEqual((card['student']['first_name'], card['class_size']), ('Pupil1', 3))
+
+    def test_unchanged_cards_are_served_from_the_cache(self):
+        cards = collect_cards(self.school_class, 1, 2024)
+        paths = render_cards(cards)
+        self.assertEqual(len(set(paths)), 3)
+        modified = [os.path.getmtime(path) for path in paths]
+        with mock.patch('back_api.report_cards.render_report_card') as render:
+            self.assertEqual(render_cards(cards), paths)
+        render.assert_not_called()
+        self.assertEqual([os.path.getmtime(path) for path in paths], modified)
+
+        Score.objects.filter(student=self.pupils[0]).update(marks_obtained=50)
+        changed = render_cards(collect_cards(self.school_class, 1, 2024))
+        self.assertNotEqual(changed[0], paths[0])
+        self.assertEqual(changed[1:], paths[1:])
+
+    def test_student_and_class_downloads(self):
+        response = self.client.get(f'/api/students/{self.pupils[0].id}/report-card/?term=1&year=2024')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+
+        response = self.client.get(f'/api/classes/{self.school_class.id}/report-cards/?term=1&year=2024')
+        self.assertEqual(response.status_code, 200)
+        with zipfile.ZipFile(BytesIO(b''.join(response.streaming_content))) as archive:
+            self.assertEqual(archive.namelist(), [
+                f'{pupil.assessment_no}-test-pupil{i}.pdf' for i, pupil in enumerate(self.pupils)
+            ])
+        self.teacher.refresh_from_db()
+        self.assertEqual(self.teacher.free_downloads_remaining, 8)
+        response = self.client.get(f'/api/classes/{self.school_class.id}/report-cards/?term=1')
+        self.assertEqual(response.status_code, 400)
+
+
+# Measures the queries behind responses, so nothing may come from the cache
+class QueryPlanTests(UncachedTestCase):
+    """
+    Runs ``EXPLAIN QUERY PLAN`` on every query behind the list and detail
+    endpoints and the term reports, on seeded and analyzed data where the
+    teacher owns a small share of the rows, and fails on any full table scan.
+    """
+    endpoints = [
+        'teachers', 'profiles', 'classes', 'exams', 'exam-subjects', 'students',
+        'scores', 'results', 'student-reports', 'class-performance',
+        'subscriptions', 'payment-records',
+    ]
+    # Shared reference tables that are listed in full by design
+    scannable_tables = {'back_api_subject'}
+    full_scan = re.compile(r'^SCAN (\S+)$')
+    students = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for i in range(8):
+            other = create_teacher(f'other{i}')
+            create_school(other, students=10, subjects=cls.subjects, prefix=f'o{i}-')
+            Subscription.objects.create(
+                teacher=other.user, status='active', expiry_date=date.today(),
+            )
+            PaymentRecord.objects.create(
+                teacher=other.user, amount=100, status='completed', transaction_id=f'TX-{i}',
+            )
+        Subscription.objects.create(
+            teacher=cls.teacher.user, status='active', expiry_date=date.today(),
+        )
+        PaymentRecord.objects.create(
+            teacher=cls.teacher.user, amount=100, status='completed', transaction_id='TX',
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def assertNoFullScans(self, queries):
+        for query in queries:
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                plan = [row[3] for row in cursor.fetchall()]
+            for step in plan:
+                match = self.full_scan.match(step)
+                if match and match.group(1) not in self.scannable_tables:
+                    self.fail(f'Full scan of {match.group(1)}:\n{query["sql"]}\n' + '\n'.join(plan))
+
+    def test_list_and_detail_queries_use_indexes(self):
+        for endpoint in self.endpoints:
+            for query in ('', '?expand=*'):
+                with self.subTest(endpoint=endpoint, query=query):
+                    with CaptureQueriesContext(connection) as queries:
+                        response = self.client.get(f'/api/{endpoint}/{query}')
+                        self.assertEqual(response.status_code, 200)
+                        detail = f"/api/{endpoint}/{response.data['results'][0]['id']}/{query}"
+                        self.assertEqual(self.client.get(detail).status_code, 200)
+                    self.assertNoFullScans(queries.captured_queries)
+
+    def test_term_queries_use_indexes(self):
+        exam = self.school_class.exams.get()
+        with CaptureQueriesContext(connection) as queries:
+            load_term_scores(exam.term, exam.year)
+            load_term_scores(exam.term, exam.year, class_ids=[self.school_class.id])
+            collect_cards(self.school_class, 1, 2024)
+        self.assertNoFullScans(queries.captured_queries)
+
+
+class CachedTokenAuthenticationTests(UncachedTestCase):
+    students = 2
+
+    def setUp(self):
+        get_token_cache().clear()
+        self.token = Token.objects.create(user=self.teacher.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_warm_requests_authenticate_without_queries(self):
+        with self.assertNumQueries(2):  # token lookup + classes
+            self.client.get('/api/classes/')
+        with self.assertNumQueries(1) as queries:
+            response = self.client.get('/api/classes/')
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertNotIn('back_api_teacher', queries.captured_queries[0]['sql'])
+
+    def test_only_authorization_fields_are_cached(self):
+        self.client.get('/api/classes/')
+        self.assertEqual(
+            get_token_cache().get(self.token.key),
+            ({'id': self.teacher.user.id, 'is_active': True, 'is_staff': False}, self.teacher.id),
+        )
+        with self.assertNumQueries(0):
+            user, _ = CachedTokenAuthentication().authenticate_credentials(self.token.key)
+        self.assertIn('password', user.get_deferred_fields())
+        with self.assertNumQueries(1):  # other fields load on first read
+            self.assertEqual(user.username, 'teacher')
+
+    def test_deleted_token_is_rejected(self):
+        self.client.get('/api/classes/')
+        self.token.delete()
+        self.assertEqual(self.client.get('/api/classes/').status_code, 401)
+
+    def test_deactivated_user_is_rejected(self):
+        self.client.get('/api/classes/')
+        self.teacher.user.is_active = False
+        self.teacher.user.save()
+        self.assertEqual(self.client.get('/api/classes/').status_code, 401)
+
+
+# Fast hashing, so provisioning several accounts goes through the process pool quickly
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ProvisioningTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = create_teacher('teacher')
+        cls.staff = User.objects.create_user('staff', password='pass1234', is_staff=True)
+
+    def row(self, username, **kwargs):
+        return dict(username=username, password=f'{username}-pass', email=f'{username}@example.com', **kwargs)
+
+    def test_bulk_endpoint_creates_complete_accounts(self):
+        client = APIClient()
+        client.force_authenticate(self.staff)
+        # Four valid rows are enough to hash in worker processes
+        rows = [self.row(f'new-{i}', school_name='Hill School', mobile_phone='0700000000') for i in range(4)]
+        rows += [self.row('teacher'), self.row('new-0'), self.row('new-9', mobile_phone='12')]
+        rows += [self.row('new/10'), {'username': 'x'}]
+        response = client.post('/api/teachers/bulk/', {'teachers': rows}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['created'], response.data['errors']), (4, 5))
+        results = response.data['results']
+        self.assertEqual(
+            [(result['status'], sorted(result.get('errors', ()))) for result in results],
+            [('created', [])] * 4 + [('error', ['username'])] * 2
+            + [('error', ['mobile_phone']), ('error', ['username']), ('error', ['password'])],
+        )
+        for result in results[:4]:
+            user = User.objects.get(username=result['username'])
+            self.assertTrue(user.check_password(f'{user.username}-pass'))
+            self.assertEqual(user.teacher_profile.school_name, 'Hill School')
+            self.assertEqual(Token.objects.get(user=user).key, result['token'])
+            self.assertTrue(Profile.objects.filter(user=user).exists())
+        self.assertFalse(User.objects.filter(username='new-9').exists())
+
+        client.force_authenticate(self.teacher.user)
+        response = client.post('/api/teachers/bulk/', {'teachers': [self.row('new-5')]}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_command_reads_a_csv(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as handle:
+            handle.write('username,email,password,school_name,mobile_phone\n')
+            handle.write('csv-1,csv-1@example.com,secret-1,Hill School,\n')
+            handle.write('teacher,,secret-2,,\n')
+        self.addCleanup(os.unlink, handle.name)
+        out, err = StringIO(), StringIO()
+        call_command('provision_teachers', handle.name, stdout=out, stderr=err)
+        rows = list(csv.reader(StringIO(out.getvalue())))
+        self.assertEqual([row[:3] for row in rows], [
+            ['row', 'status', 'username'], ['2', 'created', 'csv-1'], ['3', 'error', ''],
+        ])
+        self.assertEqual(rows[1][3], Token.objects.get(user__username='csv-1').key)
+        self.assertIn('1 created, 1 failed.', err.getvalue())
+        self.assertEqual(Teacher.objects.get(user__username='csv-1').mobile_phone, '')
+
+
+class SubscriptionExpiryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        today = date.today()
+        self.teacher = create_teacher('teacher')
+        self.lapsed = create_teacher('lapsed')
+        # update() skips the expiry check in Teacher.save
+        Teacher.objects.filter(pk=self.teacher.pk).update(
+            is_premium=True, subscription_end_date=today + timedelta(days=30)
+        )
+        Teacher.objects.filter(pk=self.lapsed.pk).update(
+            is_premium=True, subscription_end_date=today - timedelta(days=1)
+        )
+        self.current = Subscription.objects.create(
+            teacher=self.teacher.user, status='active', expiry_date=today + timedelta(days=30)
+        )
+        self.expired = Subscription.objects.create(
+            teacher=self.lapsed.user, status='active', expiry_date=today - timedelta(days=1)
+        )
+
+    def test_entitlements_are_cached_and_expire_on_read(self):
+        with self.assertNumQueries(1):
+            entitlement = get_entitlement(self.lapsed.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_entitlement(self.lapsed.id), entitlement)
+        # Not premium even before the sweep has run
+        self.assertEqual((entitlement.is_premium, entitlement.free_downloads_remaining), (False, 10))
+        self.assertTrue(get_entitlement(self.teacher.id).is_premium)
+        self.assertIsNone(get_entitlement(self.lapsed.id + 1000))
+
+        consume_download(self.lapsed.id)
+        self.assertEqual(get_entitlement(self.lapsed.id).free_downloads_remaining, 9)
+
+    def test_sweep_expires_lapsed_rows_in_bulk(self):
+        with mock.patch('back_api.subscriptions.invalidate_teacher_responses') as invalidate:
+            with self.assertNumQueries(3):
+                self.assertEqual(expire_lapsed_subscriptions(), (1, 1))
+        invalidate.assert_called_once_with(self.lapsed.id)
+        self.assertEqual(
+            list(Teacher.objects.order_by('id').values_list('is_premium', flat=True)), [True, False]
+        )
+        self.current.refresh_from_db()
+        self.expired.refresh_from_db()
+        self.assertEqual((self.current.status, self.expired.status), ('active', 'inactive'))
+        self.assertEqual(expire_lapsed_subscriptions(), (0, 0))
+
+        Subscription.objects.filter(pk=self.expired.pk).update(status='active')
+        out = StringIO()
+        call_command('expire_subscriptions', stdout=out)
+        self.assertEqual(out.getvalue().strip(), 'Expired 0 premium teachers and 1 subscriptions.')
+
+    def test_entitlement_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(self.teacher.user)
+        response = client.get('/api/teachers/entitlement/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {
+            'is_premium': True, 'subscription_end_date': date.today() + timedelta(days=30),
+            'free_downloads_remaining': 10, 'paid_downloads': 0,
+        })
+        client.force_authenticate(User.objects.create_user('parent', password='pass1234'))
+        self.assertEqual(client.get('/api/teachers/entitlement/').status_code, 404)
+
+
+class DownloadQuotaTests(TransactionTestCase):
+    threads = 8
+    downloads_per_thread = 25
+
+    def setUp(self):
+        self.teacher = create_teacher('teacher')
+        Teacher.objects.filter(pk=self.teacher.pk).update(free_downloads_remaining=50)
+
+    def hammer(self, consume):
+        errors = []
+
+        def worker():
+            try:
+                for _ in range(self.downloads_per_thread):
+                    consume(self.teacher.id)
+            except Exception as exc:  # surfaced below; threads swallow them
+                errors.append(exc)
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=worker) for _ in range(self.threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def assertCharged(self, free, paid):
+        self.teacher.refresh_from_db()
+        self.assertEqual(self.teacher.free_downloads_remaining, free)
+        self.assertEqual(self.teacher.paid_downloads, paid)
+
+    def test_parallel_downloads_never_lose_counts(self):
+        self.hammer(consume_download)
+        self.assertCharged(free=0, paid=self.threads * self.downloads_per_thread - 50)
+
+    def test_buffered_downloads_flush_exact_totals(self):
+        buffer = DownloadQuotaBuffer(flush_every=7, flush_interval=60)
+        self.hammer(buffer.consume)
+        buffer.flush()
+        self.assertCharged(free=0, paid=self.threads * self.downloads_per_thread - 50)
+
+    @override_settings(DOWNLOAD_QUOTA_BUFFER={'flush_every': 3, 'flush_interval': 60})
+    def test_record_download_goes_through_the_configured_buffer(self):
+        with mock.patch.object(quotas, '_buffer', None), mock.patch.object(quotas, 'atexit') as atexit:
+            record_download(self.teacher.id)
+            record_download(self.teacher.id)
+            self.assertCharged(free=50, paid=0)
+            record_download(self.teacher.id)
+            self.assertCharged(free=47, paid=0)
+            record_download(self.teacher.id)
+            quotas.get_download_buffer().flush()
+        atexit.register.assert_called_once()
+        self.assertCharged(free=46, paid=0)
+
+    def test_refunds(self):
+        self.assertEqual(consume_download(self.teacher.id), 'free')
+        self.assertTrue(refund_download(self.teacher.id, 'free'))
+        self.assertFalse(refund_download(self.teacher.id, 'paid'))
+        self.assertCharged(free=50, paid=0)
+
+    def test_allowance_is_only_changed_by_downloads_and_payments(self):
+        client = APIClient()
+        client.force_authenticate(self.teacher.user)
+        loaded = Teacher.objects.get(pk=self.teacher.pk)
+        consume_download(self.teacher.id)
+        response = client.patch(f'/api/teachers/{self.teacher.id}/', {
+            'free_downloads_remaining': 9999, 'paid_downloads': 0, 'is_premium': True,
+            'subscription_end_date': '2099-01-01', 'school_name': 'Hill School',
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['school_name'], response.data['is_premium']), ('Hill School', False))
+        self.assertCharged(free=49, paid=0)
+
+        # Saves from a copy read before the download keep its count
+        loaded.start_premium_subscription()
+        self.assertCharged(free=49, paid=0)
+        self.assertTrue(self.teacher.is_premium)
+        self.assertEqual(self.teacher.school_name, 'Hill School')
+
+
+class StaleReportTests(TestCase):
+    def setUp(self):
+        self.teacher = create_teacher('teacher')
+        self.school_class, self.exam, _ = create_school(self.teacher, students=2)
+        # The term create_school's reports are for
+        Exam.objects.filter(pk=self.exam.pk).update(term=1, year=2024)
+        self.key = (self.school_class.id, 1, 2024)
+        self.client = APIClient()
+        self.client.force_authenticate(self.teacher.user)
+
+    def statuses(self):
+        return {
+            report['student']: (report['status'], report['rank'])
+            for report in self.client.get('/api/student-reports/').data['results']
+        }
+
+    def test_score_edits_leave_reports_pending_until_refreshed(self):
+        pupils = list(Student.objects.order_by('id').values_list('id', flat=True))
+        self.assertEqual(self.statuses(), {pupils[0]: ('fresh', 1), pupils[1]: ('fresh', 2)})
+        # Pupil 0 had 20, 21 and 22 of 50; pupil 1 one more in each subject
+        score = Score.objects.filter(student_id=pupils[1]).order_by('id').first()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f'/api/scores/{score.id}/', {'marks_obtained': 50}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            list(StaleReport.objects.values_list('school_class_id', 'term', 'year')), [self.key]
+        )
+        self.assertEqual(self.statuses(), {pupils[0]: ('pending', 1), pupils[1]: ('pending', 2)})
+
+        self.assertEqual(refresh_stale_reports(), 0)
+        self.assertFalse(StaleReport.objects.exists())
+        self.assertEqual(self.statuses(), {pupils[0]: ('fresh', 2), pupils[1]: ('fresh', 1)})
+
+    def test_reports_without_marks_are_deleted(self):
+        pupils = list(Student.objects.order_by('id').values_list('id', flat=True))
+        with self.captureOnCommitCallbacks(execute=True):
+            Score.objects.filter(student_id=pupils[1]).delete()
+        refresh_stale_reports()
+        self.assertEqual(self.statuses(), {pupils[0]: ('fresh', 1)})
+        self.assertTrue(ClassPerformance.objects.filter(school_class=self.school_class).exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Score.objects.update(marks_obtained=None)
+            mark_stale([self.key])  # update() bypasses the Score signals
+        refresh_stale_reports()
+        self.assertEqual(self.statuses(), {})
+        self.assertFalse(ClassPerformance.objects.filter(school_class=self.school_class).exists())
+
+    def test_refresh_waits_for_edits_to_settle(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            mark_stale([self.key])
+        marked_at = StaleReport.objects.get().marked_at
+        self.assertEqual(refresh_stale_reports(settle=60), 1)
+
+        # Marking again only moves the flag forward
+        StaleReport.objects.update(marked_at=marked_at - timedelta(minutes=5))
+        with self.captureOnCommitCallbacks(execute=True):
+            mark_stale([self.key])
+        self.assertGreaterEqual(StaleReport.objects.get().marked_at, marked_at)
+        self.assertEqual(refresh_stale_reports(settle=60), 1)
+
+        StaleReport.objects.update(marked_at=marked_at - timedelta(minutes=5))
+        self.assertEqual(refresh_stale_reports(settle=60), 0)
+        self.assertFalse(StaleReport.objects.exists())
+
+    @mock.patch('back_api.reports._refresh_timer', None)
+    def test_refresh_runs_in_process_only_with_a_delay(self):
+        with mock.patch('back_api.reports.threading.Timer') as timer:
+            with self.captureOnCommitCallbacks(execute=True):
+                mark_stale([self.key])
+            timer.assert_not_called()
+            with override_settings(REPORT_REFRESH_DELAY=5), self.captureOnCommitCallbacks(execute=True):
+                mark_stale([self.key])
+        timer.assert_called_once()
+        self.assertEqual(timer.call_args.args[0], 5)
+
+    def test_writes_in_one_transaction_mark_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                for score in Score.objects.order_by('id')[:3]:
+                    score.marks_obtained = 10
+                    score.save()
+        self.assertEqual(sum('stalereport' in query['sql'] for query in queries.captured_queries), 1)
+
+    def test_mark_stale_skips_incomplete_keys_and_missing_classes(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            mark_stale([(None, 1, 2024), (self.school_class.id, None, 2024)])
+            mark_stale([(self.school_class.id + 1000, 1, 2024)])
+        self.assertEqual(len(callbacks), 1)
+        self.assertFalse(StaleReport.objects.exists())
+
+    def test_score_writes_look_their_exam_up_once(self):
+        score = Score.objects.order_by('id').first()
+        score.marks_obtained = 30
+        with self.assertNumQueries(2):
+            score.save()
+
+    def test_deleting_a_student_propagates_its_scores_once(self):
+        student = Student.objects.order_by('id').first()
+        exam_subjects = self.exam.exam_subjects.values_list('id', flat=True)
+        with mock.patch('back_api.bulk.publish_score_changes') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.delete(f'/api/students/{student.id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(
+            list(StaleReport.objects.values_list('school_class_id', 'term', 'year')), [self.key]
+        )
+        changes, _ = publish.call_args.args
+        publish.assert_called_once()
+        self.assertCountEqual(changes, [(student.id, pk, None) for pk in exam_subjects])
+
+    def test_deleting_a_class_or_user_with_scores(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(f'/api/classes/{self.school_class.id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Score.objects.exists())
+        self.assertFalse(StaleReport.objects.exists())
+
+        create_school(self.teacher, students=2, subjects=list(Subject.objects.all()), prefix='b-')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.teacher.user.delete()
+        self.assertFalse(Class.objects.exists())
+        self.assertFalse(StaleReport.objects.exists())
+
+
+class ProductionDatabaseTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'db.sqlite3')
+        config = dict(
+            import_module('Fl_Backend.settings_production').DATABASES[DEFAULT_DB_ALIAS],
+            NAME=self.path,
+        )
+        settings_dict = connections.configure_settings({DEFAULT_DB_ALIAS: config})
+        self.wrapper = DatabaseWrapper(settings_dict[DEFAULT_DB_ALIAS], alias='production')
+        self.addCleanup(self.wrapper.close)
+
+    def test_pragmas_applied_on_connect(self):
+        with self.wrapper.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+
+    def test_transactions_take_the_write_lock_up_front(self):
+        self.wrapper.ensure_connection()
+        self.wrapper._start_transaction_under_autocommit()
+        other = sqlite3.connect(self.path, timeout=0)
+        self.addCleanup(other.close)
+        with self.assertRaisesMessage(sqlite3.OperationalError, 'database is locked'):
+            other.execute('BEGIN IMMEDIATE')
+        self.wrapper.connection.rollback()
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    """Routing against a second SQLite file synced from the primary."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        config = dict(
+            connections.settings[DEFAULT_DB_ALIAS],
+            NAME=os.path.join(directory.name, 'replica.sqlite3'),
+        )
+        connections.settings['synced_replica'] = connections.configure_settings({
+            DEFAULT_DB_ALIAS: dict(connections.settings[DEFAULT_DB_ALIAS]), 'synced_replica': config,
+        })['synced_replica']
+        self.addCleanup(connections.settings.pop, 'synced_replica')
+        self.addCleanup(connections.__delitem__, 'synced_replica')
+        self.addCleanup(connections['synced_replica'].close)
+        override = override_settings(REPLICA_DATABASE='synced_replica')
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.teacher = create_teacher('teacher')
+        create_school(self.teacher, students=2)
+        self.assertTrue(sync_replica())
+        # Written after the sync, so only the primary has it
+        student = Student.objects.create(
+            first_name='Late', last_name='Pupil', gender='M', assessment_no='late',
+            class_instance=Class.objects.get(),
+        )
+        StudentReport.objects.create(
+            student=student, term=1, year=2024, comments='', rank=3, average_score=40,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.teacher.user)
+
+    def test_read_only_actions_read_from_the_replica(self):
+        response = self.client.get('/api/student-reports/')
+        self.assertEqual(len(response.data['results']), 2)
+        # Actions without replica reads stay on the primary
+        self.assertEqual(len(self.client.get('/api/students/').data['results']), 3)
+
+    def test_request_reads_its_own_writes_after_writing(self):
+        with routing_scope(), replica_reads():
+            self.assertEqual(StudentReport.objects.count(), 2)
+            Subject.objects.create(name='History')
+            self.assertEqual(StudentReport.objects.count(), 3)
+        # The next request starts unpinned
+        self.assertEqual(len(self.client.get('/api/student-reports/').data['results']), 2)
+
+    def test_sync_brings_the_replica_up_to_date(self):
+        sync_replica()
+        self.assertEqual(len(self.client.get('/api/student-reports/').data['results']), 3)
+
+    def test_streamed_exports_read_from_the_replica(self):
+        Score.objects.update(marks_obtained=50)  # after the sync, so only on the primary
+        response = self.client.get(f'/api/exams/{Exam.objects.get().id}/export/')
+        rows = list(csv.reader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual([row[1:4] for row in rows[1:]], [['Pupil0', 'Test', '20.0'], ['Pupil1', 'Test', '21.0']])
+
+    def test_cached_responses_are_built_from_the_primary(self):
+        # Changed after the sync, so the replica still has the old values
+        ClassPerformance.objects.update(average_score=75)
+        Score.objects.update(marks_obtained=50)
+        statistics_url = f'/api/exams/{Exam.objects.get().id}/statistics/'
+        with override_settings(RESPONSE_CACHE_TTL=None):
+            performance = self.client.get('/api/class-performance/').json()['results'][0]
+            self.assertEqual(performance['average_score'], '50.00')
+            self.assertLess(self.client.get(statistics_url).json()['subjects'][0]['mean'], 100)
+
+        cache.clear()
+        for _ in range(2):  # built, then served from the cache
+            performance = self.client.get('/api/class-performance/').json()['results'][0]
+            self.assertEqual(performance['average_score'], '75.00')
+            self.assertEqual(self.client.get(statistics_url).json()['subjects'][0]['mean'], 100)
+
+
+class ResponseCacheTests(SchoolTestCase):
+    students = 2
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other = create_teacher('other')
+        cls.other_class, _, _ = create_school(cls.other, students=2, subjects=cls.subjects, prefix='o-')
+
+    def setUp(self):
+        cache.clear()
+        get_token_cache().clear()
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.teacher.user).key}'
+        )
+        self.client.get('/api/exams/')  # warm the token cache
+
+    def test_repeat_requests_run_no_queries(self):
+        for url in ('/api/classes/', '/api/subjects/', '/api/students/?expand=*', '/api/class-performance/'):
+            with self.subTest(url=url):
+                first = self.client.get(url)
+                with self.assertNumQueries(0):
+                    second = self.client.get(url)
+                self.assertEqual(second.content, first.content)
+                self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_unchanged_response_revalidates_with_304(self):
+        etag = self.client.get('/api/students/')['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/students/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(response.content)
+        self.assertEqual(self.client.get('/api/students/?fields=id', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_writes_invalidate_only_the_owning_teacher(self):
+        etag = self.client.get('/api/classes/')['ETag']
+        Class.objects.create(name='Other Grade 5', teacher=self.other)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/classes/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        Class.objects.create(name='Grade 5', teacher=self.teacher)
+        response = self.client.get('/api/classes/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_related_and_shared_writes_invalidate(self):
+        students = self.client.get('/api/students/?expand=subjects')
+        performance = self.client.get('/api/class-performance/')
+        Subject.objects.filter(name='Maths').update(name='Mathematics')
+        invalidate_class_responses(self.school_class.id)  # as bulk writers do
+        self.assertNotEqual(self.client.get('/api/class-performance/')['ETag'], performance['ETag'])
+
+        Subject.objects.create(name='History')
+        response = self.client.get('/api/students/?expand=subjects')
+        self.assertNotEqual(response['ETag'], students['ETag'])
+        self.assertEqual(response.data['results'][0]['subjects'][0]['name'], 'Mathematics')
+
+
+class AsyncReadTests(SchoolTestCase):
+    urls = (
+        '/api/classes/', '/api/students/', '/api/scores/', '/api/results/',
+        '/api/student-reports/', '/api/class-performance/',
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other = create_teacher('other')
+        cls.other_class, _, _ = create_school(cls.other, students=2, subjects=cls.subjects, prefix='o-')
+
+    def setUp(self):
+        get_token_cache().clear()
+        self.token = Token.objects.create(user=self.teacher.user).key
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+
+    def async_get(self, url, token=None):
+        token = self.token if token is None else token
+        headers = {'Authorization': f'Token {token}'} if token else {}
+        return async_to_sync(self.async_client.get)(url, headers=headers)
+
+    def test_pages_match_the_sync_endpoints(self):
+        for url in self.urls:
+            for query in ('', '?expand=*', '?fields=id,student.first_name'):
+                with self.subTest(url=url, query=query):
+                    expected = self.client.get(url + query).json()['results']
+                    page = url.replace('/api/', '/api/async/') + (query + '&' if query else '?')
+                    page, seen = page + 'page_size=2', []
+                    while page:
+                        response = self.async_get(page).json()
+                        self.assertLessEqual(len(response['results']), 2)
+                        seen.extend(response['results'])
+                        page = response['next']
+                    self.assertEqual(seen, expected)
+
+    def test_list_runs_the_query_plan(self):
+        self.async_get('/api/async/classes/')  # warm the token cache
+        for url, budget in QueryBudgetTests.budgets.items():
+            if url in self.urls:
+                with self.subTest(url=url), self.assertNumQueries(budget):
+                    self.async_get(url.replace('/api/', '/api/async/'))
+
+    def test_detail_is_limited_to_the_owner(self):
+        own = self.client.get('/api/classes/').json()['results'][0]
+        self.assertEqual(self.async_get(f"/api/async/classes/{own['id']}/").json(), own)
+        self.assertEqual(self.async_get(f'/api/async/classes/{self.other_class.id}/').status_code, 404)
+
+    def test_requests_need_a_valid_token(self):
+        self.assertEqual(self.async_get('/api/async/classes/', token='').status_code, 401)
+        self.assertEqual(self.async_get('/api/async/classes/', token='invalid').status_code, 401)
+
+
+@override_settings(LEADERBOARD_UPDATE_INTERVAL=0.2)
+class LeaderboardTests(SchoolTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other = create_teacher('other')
+        cls.other_class = Class.objects.create(name='Grade 5', teacher=cls.other)
+        cls.token = Token.objects.create(user=cls.teacher.user).key
+
+    def setUp(self):
+        get_token_cache().clear()
+
+    async def connect(self, path):
+        # channels.testing needs daphne, so talk ASGI to the application directly
+        path, _, query = path.partition('?')
+        communicator = ApplicationCommunicator(asgi_application, {
+            'type': 'websocket', 'path': path, 'query_string': query.encode(), 'headers': [],
+        })
+        await communicator.send_input({'type': 'websocket.connect'})
+        message = await communicator.receive_output(timeout=2)
+        return communicator, message['type'] == 'websocket.accept', message.get('code')
+
+    async def receive_json(self, communicator):
+        return json.loads((await communicator.receive_output(timeout=2))['text'])
+
+    def enter_marks(self, rows):
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_upsert_scores(self.exam, rows)
+        with self.captureOnCommitCallbacks(execute=True):
+            score = Score.objects.filter(exam_subject__exam=self.exam).order_by('id').first()
+            score.marks_obtained = 50
+            score.save()
+
+    async def test_bursts_of_writes_arrive_as_one_update(self):
+        communicator, connected, _ = await self.connect(
+            f'/ws/exams/{self.exam.id}/leaderboard/?token={self.token}'
+        )
+        self.assertTrue(connected)
+        snapshot = await self.receive_json(communicator)
+        self.assertEqual([row['rank'] for row in snapshot['rankings']], [1, 2, 3])
+        self.assertEqual(snapshot['rankings'][0]['student'], max(row['student'] for row in snapshot['rankings']))
+
+        last = min(row['student'] for row in snapshot['rankings'])
+        exam_subjects = await sync_to_async(list)(self.exam.exam_subjects.values_list('id', flat=True))
+        await sync_to_async(self.enter_marks)([
+            {'student': last, 'exam_subject': exam_subject_id, 'marks_obtained': 50}
+            for exam_subject_id in exam_subjects
+        ])
+        update = await self.receive_json(communicator)
+        self.assertEqual(update['type'], 'update')
+        self.assertEqual(len(update['scores']), len(exam_subjects))
+        self.assertEqual(update['rankings'][0], {'student': last, 'average': 100.0, 'rank': 1})
+        self.assertEqual(len(update['rankings']), 3)  # everyone else moved down
+        self.assertTrue(await communicator.receive_nothing(timeout=0.4))
+        await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+
+    async def test_class_term_leaderboard_needs_term_and_ownership(self):
+        path = f'/ws/classes/{self.school_class.id}/leaderboard/'
+        term = f'term={self.exam.term}&year={self.exam.year}'
+        communicator, connected, _ = await self.connect(f'{path}?token={self.token}&{term}')
+        self.assertTrue(connected)
+        self.assertEqual(len((await self.receive_json(communicator))['rankings']), 3)
+        await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+
+        for path, code in (
+            (f'{path}?{term}', 4401),
+            (f'{path}?token={self.token}', 4404),
+            (f'/ws/classes/{self.other_class.id}/leaderboard/?token={self.token}&{term}', 4404),
+        ):
+            with self.subTest(path=path):
+                _, connected, close_code = await self.connect(path)
+                self.assertFalse(connected)
+                self.assertEqual(close_code, code)
+
+
+class ExamStatisticsTests(SchoolTestCase):
+    students = 4
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other = create_teacher('other')
+        _, cls.other_exam, _ = create_school(cls.other, students=1, subjects=cls.subjects, prefix='o-')
+        cls.unmarked = ExamSubject.objects.create(exam=cls.exam, subject=cls.subjects[0], max_marks=100)
+
+    def setUp(self):
+        cache.clear()
+        get_grading_scheme(self.teacher.user_id)
+        super().setUp()
+        self.url = f'/api/exams/{self.exam.id}/statistics/'
+
+    def test_statistics_are_normalised_by_max_marks(self):
+        with self.assertNumQueries(2):  # the exam, then its marks
+            response = self.client.get(self.url)
+        maths, english, science, unmarked = response.data['subjects']
+        # Maths marks are 20-23 out of 50
+        self.assertEqual(maths['name'], 'Maths')
+        self.assertEqual(
+            {key: maths[key] for key in ('count', 'mean', 'median', 'std', 'min', 'max')},
+            {'count': 4, 'mean': 43.0, 'median': 43.0, 'std': 2.24, 'min': 40.0, 'max': 46.0},
+        )
+        self.assertEqual(maths['percentiles']['p25'], 41.5)
+        self.assertEqual(maths['grades'], {'A': 0, 'B': 0, 'C': 0, 'D': 4, 'E': 0})
+        self.assertEqual(science['max'], 50.0)
+        self.assertEqual(unmarked, {
+            'exam_subject': self.unmarked.id, 'subject': self.unmarked.subject_id, 'name': 'Maths',
+            'max_marks': 100.0, 'count': 0, 'grades': {'A': 0, 'B': 0, 'C': 0, 'D': 0, 'E': 0},
+        })
+
+    def test_statistics_are_cached_until_a_score_changes(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(1):
+            self.client.get(self.url)
+
+        score = Score.objects.filter(exam_subject__exam=self.exam).order_by('id').first()
+        score.marks_obtained = 50
+        score.save()
+        self.assertEqual(self.client.get(self.url).data['subjects'][0]['grades']['A'], 1)
+
+    def test_other_teachers_exams_are_not_found(self):
+        self.assertEqual(self.client.get(f'/api/exams/{self.other_exam.id}/statistics/').status_code, 404)
+
+
+class ProgressTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = create_teacher('teacher')
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.school_class, _, subjects = create_school(cls.teacher, students=2)
+        cls.maths = subjects[0]
+        cls.student = cls.school_class.students.order_by('id').first()
+        # Term 1 2024 comes from create_school (score 40 in Maths)
+        with cls.captureOnCommitCallbacks(execute=True):
+            for term, year, score in ((3, 2023, 30), (2, 2024, 47)):
+                Result.objects.create(
+                    student=cls.student, subject=cls.maths, term=term, year=year, score=score
+                )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.teacher.user)
+
+    def test_student_progress_has_deltas_and_trend(self):
+        with self.assertNumQueries(2):  # the student, then its series
+            response = self.client.get(f'/api/students/{self.student.id}/progress/')
+        maths = response.data['subjects'][0]
+        self.assertEqual(maths['name'], 'Maths')
+        self.assertEqual(
+            [(point['year'], point['term'], point['score'], point['delta']) for point in maths['points']],
+            [(2023, 3, 30.0, None), (2024, 1, 40.0, 10.0), (2024, 2, 47.0, 7.0)],
+        )
+        self.assertEqual((maths['latest'], maths['trend']), (47.0, 8.5))
+
+    def test_series_follow_result_writes(self):
+        result = Result.objects.get(student=self.student, subject=self.maths, term=2, year=2024)
+        with self.captureOnCommitCallbacks(execute=True):
+            result.score = 20
+            result.save()
+        series = ProgressSeries.objects.get(student=self.student, subject=self.maths)
+        self.assertEqual(series.points[-1], [2024, 2, 20.0])
+
+        other = self.school_class.students.exclude(pk=self.student.pk).get()
+        with self.captureOnCommitCallbacks(execute=True):
+            result.student = other
+            result.save()
+        self.assertEqual(len(ProgressSeries.objects.get(student=self.student, subject=self.maths).points), 2)
+        self.assertIn([2024, 2, 20.0], ProgressSeries.objects.get(student=other, subject=self.maths).points)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Result.objects.filter(student=self.student, subject=self.maths).delete()
+        self.assertFalse(ProgressSeries.objects.filter(student=self.student, subject=self.maths).exists())
+
+    def test_result_writes_in_one_transaction_rebuild_once(self):
+        results = Result.objects.filter(student=self.student, subject=self.maths).order_by('year', 'term')
+        with mock.patch(
+            'back_api.progress.refresh_progress_series', wraps=refresh_progress_series
+        ) as refresh:
+            with self.captureOnCommitCallbacks(execute=True):
+                for result in results:
+                    result.score += 1
+                    result.save()
+            refresh.assert_called_once_with({(self.student.id, self.maths.id)})
+            series = ProgressSeries.objects.get(student=self.student, subject=self.maths)
+            self.assertEqual([score for _, _, score in series.points], [31.0, 41.0, 48.0])
+
+            # The student's series go with it, so there is nothing to rebuild
+            refresh.reset_mock()
+            student_id = self.student.id
+            with self.captureOnCommitCallbacks(execute=True):
+                self.student.delete()
+            refresh.assert_not_called()
+        self.assertFalse(ProgressSeries.objects.filter(student_id=student_id).exists())
+
+    def test_class_progress_lists_every_student(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/classes/{self.school_class.id}/progress/')
+        self.assertEqual([row['student'] for row in response.data['students']],
+                         list(self.school_class.students.order_by('id').values_list('id', flat=True)))
+        self.assertEqual(len(response.data['students'][1]['subjects']), 3)
+
+
+class DashboardTests(SchoolTestCase):
+
+    def summary(self):
+        return self.client.get('/api/dashboard/').data
+
+    def test_dashboard_reads_one_summary_row(self):
+        # Built on first read: the fixtures' on_commit refreshes never ran
+        self.assertFalse(TeacherSummary.objects.filter(teacher=self.teacher).exists())
+        data = self.summary()
+        self.assertEqual(
+            (data['class_count'], data['student_count'], data['exam_count'], data['pending_score_count']),
+            (1, 3, 1, 0),
+        )
+        with self.assertNumQueries(2):  # the teacher id, then the summary
+            self.client.get('/api/dashboard/')
+
+    def test_summary_follows_writes(self):
+        self.summary()
+        with self.captureOnCommitCallbacks(execute=True):
+            student = Student.objects.create(
+                first_name='New', last_name='Pupil', gender='M', assessment_no='new',
+                class_instance=self.school_class,
+            )
+        data = self.summary()
+        self.assertEqual((data['student_count'], data['pending_score_count']), (4, 3))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Score.objects.filter(exam_subject__exam=self.exam).exclude(student=student).first().delete()
+            Score.objects.create(student=student, exam_subject=self.exam.exam_subjects.first(), marks_obtained=30)
+            PaymentRecord.objects.create(
+                teacher=self.teacher.user, amount=500, transaction_id='tx-1', status='completed',
+            )
+        data = self.summary()
+        self.assertEqual(data['pending_score_count'], 3)
+        self.assertEqual([payment['transaction_id'] for payment in data['recent_payments']], ['tx-1'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            student.delete()
+            self.teacher.start_premium_subscription()
+        data = self.summary()
+        self.assertEqual((data['student_count'], data['pending_score_count']), (3, 1))
+        self.assertTrue(data['is_premium'])
+
+    def test_writes_in_one_transaction_refresh_once(self):
+        scores = list(Score.objects.filter(exam_subject__exam=self.exam).order_by('id')[:3])
+        with mock.patch(
+            'back_api.dashboard.refresh_teacher_summaries', wraps=refresh_teacher_summaries
+        ) as refresh:
+            with self.captureOnCommitCallbacks(execute=True):
+                scores[0].marks_obtained = None
+                scores[0].save()
+                scores[1].delete()
+                PaymentRecord.objects.create(
+                    teacher=self.teacher.user, amount=500, transaction_id='tx-1', status='completed',
+                )
+            refresh.assert_called_once()
+            self.assertEqual(self.summary()['pending_score_count'], 2)
+
+            # Changing a mark leaves the count of missing marks as it was
+            refresh.reset_mock()
+            with self.captureOnCommitCallbacks(execute=True):
+                scores[2].marks_obtained = 45
+                scores[2].save()
+            refresh.assert_not_called()
+
+    def test_moving_a_student_refreshes_both_teachers(self):
+        other = create_teacher('other')
+        other_class = Class.objects.create(name='Grade 5', teacher=other)
+        refresh_teacher_summaries([self.teacher.id, other.id])
+        student = Student.objects.filter(class_instance=self.school_class).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            student.class_instance = other_class
+            student.save()
+        counts = dict(TeacherSummary.objects.values_list('teacher_id', 'student_count'))
+        self.assertEqual(counts, {self.teacher.id: 2, other.id: 1})
+
+    def test_other_users_are_not_teachers(self):
+        self.client.force_authenticate(User.objects.create_user(username='staff', password='pass1234'))
+        self.assertEqual(self.client.get('/api/dashboard/').status_code, 404)
+
+
+class GradingTests(SchoolTestCase):
+    students = 2
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other = create_teacher('other')
+        Teacher.objects.filter(pk=cls.other.pk).update(school_name='Other School')
+        cls.staff = User.objects.create_user(username='staff', password='pass1234', is_staff=True)
+
+    def setUp(self):
+        cache.clear()
+        super().setUp()
+
+    def test_compiled_scheme_grades_arrays(self):
+        scheme = CompiledScheme([('B', 50, 2), ('A', 75, 3), ('C', 20, 1)])
+        grades, points = scheme.grade([0, 20, 49.99, 50, 74.9, 75, 100, float('nan')])
+        self.assertEqual(grades.tolist(), [None, 'C', 'C', 'B', 'B', 'A', 'A', None])
+        self.assertEqual(np.nan_to_num(points).tolist(), [0, 1, 1, 2, 2, 3, 3, 0])
+        self.assertEqual(scheme.boundaries, [('A', 75.0), ('B', 50.0), ('C', 20.0)])
+
+        percent = np.random.default_rng(0).uniform(0, 100, 100_000)
+        grades, _ = scheme.grade(percent)
+        expected = np.select([percent >= 75, percent >= 50, percent >= 20], ['A', 'B', 'C'], None)
+        self.assertTrue((grades == expected).all())
+
+    def test_a_missing_or_non_positive_maximum_means_out_of_100(self):
+        percent = to_percentages([20, 30, 40, 50], [50, float('nan'), 0, -10])
+        self.assertEqual(percent.tolist(), [40, 30, 40, 50])
+        self.assertEqual(to_percentages([20]).tolist(), [20])
+
+    def test_responses_are_graded_with_the_school_scheme(self):
+        # Maths marks start at 20 out of 50, results at 40%, reports average 50%
+        score = self.client.get('/api/scores/').data['results'][0]
+        self.assertEqual((score['marks_obtained'], score['grade'], score['points']), (20.0, 'D', None))
+
+        self.teacher.school_name = 'Hill School'
+        self.teacher.save()
+        self.client.force_authenticate(self.staff)
+        response = self.client.post('/api/grading-schemes/', {
+            'name': 'CBC', 'school_name': 'Hill School',
+            'bands': [
+                {'grade': 'EE', 'min_percent': 75, 'points': 4},
+                {'grade': 'ME', 'min_percent': 50, 'points': 3},
+                {'grade': 'AE', 'min_percent': 25, 'points': 2},
+                {'grade': 'BE', 'min_percent': 0, 'points': 1},
+            ],
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['school_name'], 'Hill School')
+
+        self.client.force_authenticate(self.teacher.user)
+        get_grading_scheme(self.teacher.user_id)
+        with self.assertNumQueries(1):
+            scores = self.client.get('/api/scores/').data['results']
+        self.assertEqual({score['grade'] for score in scores}, {'AE'})
+        self.assertEqual(self.client.get(f"/api/scores/{scores[0]['id']}/").data['points'], 2.0)
+        # Without ScoreViewSet's max_marks annotation, through the exam subject
+        context = {'grading_scheme': get_grading_scheme(self.teacher.user_id)}
+        self.assertEqual(ScoreSerializer(Score.objects.get(pk=scores[0]['id']), context=context).data['grade'], 'AE')
+        self.assertEqual(self.client.get('/api/results/').data['results'][0]['grade'], 'AE')
+        self.assertEqual(self.client.get('/api/student-reports/').data['results'][0]['grade'], 'ME')
+        exam = Score.objects.get(pk=scores[0]['id']).exam_subject.exam_id
+        self.assertEqual(
+            self.client.get(f'/api/exams/{exam}/statistics/').data['subjects'][0]['grades'],
+            {'EE': 0, 'ME': 0, 'AE': 2, 'BE': 0},
+        )
+
+    def test_only_staff_edit_schemes(self):
+        default = GradingScheme.objects.create(name='Default')
+        other = GradingScheme.objects.create(name='Other', school_name='Other School')
+        self.assertEqual(self.client.get(f'/api/grading-schemes/{default.id}/').status_code, 200)
+        self.assertEqual(self.client.get(f'/api/grading-schemes/{other.id}/').status_code, 404)
+
+        # Naming their school after another does not let a teacher edit its scheme
+        self.teacher.school_name = 'Other School'
+        self.teacher.save()
+        url = f'/api/grading-schemes/{other.id}/'
+        self.assertEqual(self.client.get(url).status_code, 200)
+        bands = {'bands': [{'grade': 'A', 'min_percent': 0}]}
+        self.assertEqual(self.client.patch(url, bands, format='json').status_code, 403)
+        self.assertEqual(self.client.delete(url).status_code, 403)
+        response = self.client.post('/api/grading-schemes/', {'name': 'Mine', **bands}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+        self.client.force_authenticate(self.staff)
+        self.assertEqual(self.client.patch(url, bands, format='json').status_code, 200)
+        self.assertEqual(list(other.bands.values_list('grade', flat=True)), ['A'])
+
+
+class BenchmarkCommandTests(TestCase):
+    def test_seed_data_and_benchmark_every_get_route(self):
+        call_command(
+            'seed_data', teachers=2, classes=2, students=5, subjects=3, terms=2, exams=2,
+            stdout=StringIO(),
+        )
+        teacher = Teacher.objects.get(user__username='seed-0')
+        self.assertEqual(Student.objects.filter(class_instance__teacher=teacher).count(), 10)
+        # Two terms of two exams, three subjects each, for ten students
+        self.assertEqual(Score.objects.filter(exam_subject__exam__teacher=teacher).count(), 120)
+        self.assertEqual(TeacherSummary.objects.get(teacher=teacher).student_count, 10)
+        self.assertTrue(ProgressSeries.objects.filter(student__class_instance__teacher=teacher).exists())
+
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'report.json')
+            call_command('benchmark_api', 'seed-0', repeat=2, warmup=0, output=output, stdout=StringIO())
+            with open(output) as file:
+                routes = json.load(file)['routes']
+            call_command(
+                'benchmark_api', 'seed-0', repeat=1, warmup=0, output=output, compare=output,
+                route=['score-list'], stdout=StringIO(),
+            )
+        self.assertEqual(routes['score-list']['status'], [200])
+        self.assertGreater(routes['score-detail']['bytes'], 0)
+        self.assertEqual(routes['student-report-card']['status'], [200])
+        self.assertEqual(routes['user-login'], {'skipped': 'no GET handler'})
+        # Every request was rolled back
+        self.assertEqual(Score.objects.filter(exam_subject__exam__teacher=teacher).count(), 120)
+
+
+class RequestMetricsTests(SchoolTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.staff = User.objects.create_user(username='staff', password='pass1234', is_staff=True)
+
+    def setUp(self):
+        get_token_cache().clear()
+        registry.clear()
+        self.token = Token.objects.create(user=self.teacher.user).key
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+
+    def server_timing(self, response):
+        return {
+            name: (float(duration), description)
+            for name, duration, description in re.findall(
+                r'(\w+);dur=([\d.]+)(?:;desc="([^"]*)")?', response['Server-Timing']
+            )
+        }
+
+    def test_server_timing_counts_the_requests_queries(self):
+        for url in ('/api/scores/?expand=*', '/api/async/scores/?expand=*'):
+            with self.subTest(url=url):
+                get_token_cache().clear()
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url)
+                timing = self.server_timing(response)
+                self.assertEqual(timing['sql'][1], f'{len(queries)} queries')
+                self.assertGreater(timing['serialize'][0], 0)
+                self.assertGreaterEqual(
+                    timing['total'][0], timing['sql'][0] + timing['auth'][0] + timing['serialize'][0] - 0.3
+                )
+
+    @override_settings(SERVER_TIMING=False)
+    def test_metrics_are_histograms_per_route(self):
+        scores = self.client.get('/api/scores/').json()['results']
+        response = self.client.get(f"/api/scores/{scores[0]['id']}/")
+        self.assertNotIn('Server-Timing', response)
+        self.client.get(f"/api/scores/{scores[1]['id']}/")
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+        self.client.force_authenticate(self.staff)
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        self.assertIn('http_requests_total{route="score-detail",method="GET",status="200"} 2', body)
+        self.assertIn('http_requests_total{route="metrics",method="GET",status="403"} 1', body)
+        self.assertIn('http_request_sql_queries_bucket{route="score-detail",method="GET",le="+Inf"} 2', body)
+        self.assertIn('http_request_duration_seconds_count{route="score-list",method="GET"} 1', body)
+        self.assertIn('# TYPE http_request_serializer_duration_seconds histogram', body)
@@ -4,8 +4,10 @@ from .views import (
     LoginView, TeacherViewSet, ProfileViewSet, ClassViewSet, SubjectViewSet,
     ExamViewSet, ExamSubjectViewSet, StudentViewSet, ScoreViewSet,
     ResultViewSet, StudentReportViewSet, ClassPerformanceViewSet,
-    SubscriptionViewSet, PaymentRecordViewSet, UserRegistrationView
+    SubscriptionViewSet, PaymentRecordViewSet, UserRegistrationView, DashboardView,
+    GradingSchemeViewSet
 )
+from .async_views import AsyncReadView
 
 router = DefaultRouter()
 router.register(r'teachers', TeacherViewSet, basename='teacher')
@@ -21,10 +23,29 @@ router.register(r'student-reports', StudentReportViewSet, basename='student-repo
 router.register(r'class-performance', ClassPerformanceViewSet, basename='class-performance')
 router.register(r'subscriptions', SubscriptionViewSet, basename='subscription')
 router.register(r'payment-records', PaymentRecordViewSet, basename='payment-record')
+router.register(r'grading-schemes', GradingSchemeViewSet, basename='grading-scheme')
 
 urlpatterns = [
     path('', include(router.urls)),
     path('register/', UserRegistrationView.as_view(), name='user-register'),
     path('login/', LoginView.as_view(), name='user-login'),
+    path('dashboard/', DashboardView.as_view(), name='dashboard'),
 
 ]
+
+# Async read endpoints, for deployments under ASGI
+async_readers = {
+    'classes': ('class', ClassViewSet),
+    'subjects': ('subject', SubjectViewSet),
+    'students': ('student', StudentViewSet),
+    'scores': ('score', ScoreViewSet),
+    'results': ('result', ResultViewSet),
+    'student-reports': ('student-report', StudentReportViewSet),
+    'class-performance': ('class-performance', ClassPerformanceViewSet),
+}
+for prefix, (basename, viewset) in async_readers.items():
+    view = AsyncReadView.as_view(viewset_class=viewset)
+    urlpatterns += [
+        path(f'async/{prefix}/', view, name=f'async-{basename}-list'),
+        path(f'async/{prefix}/<int:pk>/', view, name=f'async-{basename}-detail'),
+    ]
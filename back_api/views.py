@@ -1,19 +1,44 @@
 from rest_framework import viewsets, generics, permissions, status
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.decorators import action
+from rest_framework.generics import get_object_or_404
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from .models import (
     Teacher, Profile, Class, Subject, Exam, ExamSubject,
     Student, Score, Result, StudentReport, ClassPerformance,
-    Subscription, PaymentRecord
+    Subscription, PaymentRecord, StaleReport, GradingScheme
 )
 from .serializers import (
     LoginSerializer, TeacherSerializer, ProfileSerializer, ClassSerializer, SubjectSerializer,
     ExamSerializer, ExamSubjectSerializer, StudentSerializer, ScoreSerializer,
     ResultSerializer, StudentReportSerializer, ClassPerformanceSerializer,
-    SubscriptionSerializer, PaymentRecordSerializer, UserRegistrationSerializer
+    SubscriptionSerializer, PaymentRecordSerializer, UserRegistrationSerializer,
+    BulkScoreSerializer, TermSerializer, RankingRequestSerializer, ExportRequestSerializer,
+    RegisterImportSerializer, TeacherProvisionSerializer, TeacherSummarySerializer, GradingSchemeSerializer,
+    get_field_trees, is_expanded, expand_subtree
 )
+from .authentication import fetch_request_teacher_id, get_request_teacher_id
+from .bulk import bulk_upsert_scores, deleting_scores
+from .caching import ResponseCacheMixin
+from .dashboard import get_teacher_summary
+from .db_routers import ReplicaReadMixin
+from .exam_statistics import get_exam_statistics
+from .exports import export_class, export_exam
+from .grading import GradingSchemeMixin, get_grading_scheme
+from .imports import import_register
+from .metrics import registry
+from .progress import class_progress, student_progress
+from .provisioning import provision_teachers
+from .subscriptions import get_entitlement
+from .quotas import record_download
+from .ranking import compute_term_rankings
+from .report_cards import card_filename, collect_cards, render_cards, zip_cards
 from django.contrib.auth import authenticate
+from django.db.models import Exists, F, OuterRef, Prefetch, Q, Subquery
+from django.http import FileResponse, HttpResponse
+from django.utils.text import slugify
 from rest_framework.authtoken.models import Token
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework import status
 
 
@@ -44,6 +69,105 @@ class LoginView(generics.GenericAPIView):
             'username': user.username,
         }, status=status.HTTP_200_OK)
  
+# Dashboard View
+class DashboardView(generics.GenericAPIView):
+    """The requesting teacher's home screen figures, from their summary row."""
+    serializer_class = TeacherSummarySerializer
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        teacher_id = fetch_request_teacher_id(request)
+        summary = get_teacher_summary(teacher_id) if teacher_id is not None else None
+        if summary is None:
+            return Response({'detail': 'Not a teacher account.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(self.get_serializer(summary).data, status=status.HTTP_200_OK)
+
+
+# Metrics View
+class MetricsView(APIView):
+    """This process's per-route request metrics, for Prometheus to scrape."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# Query plans
+# Each ViewSet declares the joins its serializer nesting needs, per action.
+class QueryPlanMixin:
+    """
+    Apply ``select_related``/``prefetch_related`` lookups declared per action.
+
+    ``query_plan`` is used for every action that has no entry in
+    ``query_plans``. Plans are applied in ``filter_queryset`` so that they
+    cover both ``list`` and the ``get_object`` based detail actions. Lookups
+    are cut back to the relations the request actually renders (see
+    ``?fields=`` and ``?expand=``), so collapsed relations cost no join.
+    """
+    query_plan = {}
+    query_plans = {'destroy': {}}
+
+    def get_query_plan(self):
+        return self.query_plans.get(self.action, self.query_plan)
+
+    def prune_lookup(self, model, lookup, expand, only):
+        kept = []
+        for part in lookup.split('__'):
+            if only is not None and part not in only:
+                break
+            field = model._meta.get_field(part)
+            nested_only = only.get(part) or None if only else None
+            if is_expanded(expand, part, only):
+                kept.append(part)
+                model = field.related_model
+                expand, only = expand_subtree(expand, part), nested_only
+                continue
+            # Collapsed many-to-many relations still need their keys fetched
+            if field.many_to_many:
+                kept.append(part)
+            break
+        return '__'.join(kept)
+
+    def descend(self, model, lookup, expand, only):
+        """Return the model a lookup leads to and the field trees below it."""
+        for part in lookup.split('__'):
+            model = model._meta.get_field(part).related_model
+            only = only.get(part) or None if only else None
+            expand = expand_subtree(expand, part)
+        return model, expand, only
+
+    def filter_queryset(self, queryset):
+        expand, only = get_field_trees(self.request)
+        return self.apply_query_plan(
+            super().filter_queryset(queryset), self.get_query_plan(), expand, only
+        )
+
+    def apply_query_plan(self, queryset, plan, expand, only):
+        select_related = [
+            lookup for lookup in (
+                self.prune_lookup(queryset.model, lookup, expand, only)
+                for lookup in plan.get('select_related', ())
+            ) if lookup
+        ]
+        # A prefetch may carry a plan of its own for the related queryset
+        prefetch_related = []
+        for lookup in plan.get('prefetch_related', ()):
+            lookup, nested_plan = lookup if isinstance(lookup, tuple) else (lookup, None)
+            if self.prune_lookup(queryset.model, lookup, expand, only) != lookup:
+                continue
+            if nested_plan is not None:
+                model, nested_expand, nested_only = self.descend(queryset.model, lookup, expand, only)
+                lookup = Prefetch(lookup, queryset=self.apply_query_plan(
+                    model._default_manager.all(), nested_plan, nested_expand, nested_only
+                ))
+            prefetch_related.append(lookup)
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        return queryset
+
+
 # Teacher ViewSet
 # Custom permission to allow only admin or the owner to access data
 class IsAdminOrOwner(permissions.BasePermission):
@@ -52,20 +176,43 @@ class IsAdminOrOwner(permissions.BasePermission):
 
 
 # Teacher ViewSet
-class TeacherViewSet(viewsets.ModelViewSet):
+class TeacherViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     serializer_class = TeacherSerializer
     permission_classes = [IsAuthenticated]
+    query_plan = {
+        'select_related': ('user',),
+    }
 
     def get_queryset(self):
         if self.request.user.is_staff:  # Admin access
             return Teacher.objects.all()
         return Teacher.objects.filter(user=self.request.user)
 
+    @action(detail=False, methods=['get'])
+    def entitlement(self, request):
+        """The requesting teacher's premium status and download allowance."""
+        teacher_id = fetch_request_teacher_id(request)
+        entitlement = get_entitlement(teacher_id) if teacher_id is not None else None
+        if entitlement is None:
+            return Response({'detail': 'Not a teacher account.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(entitlement._asdict(), status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post'], url_path='bulk', permission_classes=[IsAdminUser])
+    def bulk(self, request):
+        """Provision many teacher accounts at once (staff only)."""
+        serializer = TeacherProvisionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        report = provision_teachers(serializer.validated_data['teachers'])
+        return Response(report, status=status.HTTP_200_OK)
+
 
 # Profile ViewSet
-class ProfileViewSet(viewsets.ModelViewSet):
+class ProfileViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     serializer_class = ProfileSerializer
     permission_classes = [IsAuthenticated]
+    query_plan = {
+        'select_related': ('user',),
+    }
 
     def get_queryset(self):
         if self.request.user.is_staff:  # Admin access
@@ -74,106 +221,301 @@ class ProfileViewSet(viewsets.ModelViewSet):
 
 
 # Class ViewSet
-class ClassViewSet(viewsets.ModelViewSet):
+class ClassViewSet(ResponseCacheMixin, ReplicaReadMixin, QueryPlanMixin, viewsets.ModelViewSet):
     serializer_class = ClassSerializer
     permission_classes = [IsAuthenticated]
+    replica_actions = ('export', 'report_cards', 'progress')
+    query_plan = {
+        'select_related': ('teacher__user',),
+    }
+    query_plans = {'destroy': {}, 'progress': {}}
 
     def get_queryset(self):
         if self.request.user.is_staff:
             return Class.objects.all()
-        return Class.objects.filter(teacher__user=self.request.user)
+        return Class.objects.filter(teacher_id=get_request_teacher_id(self.request))
+
+    @action(detail=True, methods=['post'])
+    def rankings(self, request, pk=None):
+        """Compute the class's term ranks and store them on its reports."""
+        school_class = self.get_object()
+        serializer = RankingRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        summary = compute_term_rankings(class_ids=[school_class.id], **serializer.validated_data)
+        return Response(summary, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['get'])
+    def export(self, request, pk=None):
+        """Stream a marksheet of every exam in the class (?type=csv|xlsx)."""
+        school_class = self.get_object()
+        serializer = ExportRequestSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+        response = export_class(
+            school_class, params['type'], term=params.get('term'), year=params.get('year')
+        )
+        if not request.user.is_staff:
+            record_download(school_class.teacher_id)
+        return response
+
+    @action(detail=True, methods=['get'], url_path='report-cards')
+    def report_cards(self, request, pk=None):
+        """Download a ZIP of every student's PDF report card for a term."""
+        school_class = self.get_object()
+        serializer = TermSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        term, year = serializer.validated_data['term'], serializer.validated_data['year']
+
+        cards = collect_cards(school_class, term, year)
+        archive = zip_cards(cards, render_cards(cards))
+        if not request.user.is_staff:
+            record_download(school_class.teacher_id)
+        filename = f'{slugify(school_class.name)}-term-{term}-{year}-report-cards.zip'
+        return FileResponse(archive, as_attachment=True, filename=filename)
+
+    @action(detail=True, methods=['get'])
+    def progress(self, request, pk=None):
+        """Every student's term-by-term results per subject, with deltas and trends."""
+        school_class = self.get_object()
+        return Response(class_progress(school_class.id), status=status.HTTP_200_OK)
 
 
 # Subject ViewSet
-class SubjectViewSet(viewsets.ModelViewSet):
+class SubjectViewSet(ResponseCacheMixin, QueryPlanMixin, viewsets.ModelViewSet):
     serializer_class = SubjectSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
         return Subject.objects.all()
 
+    def perform_destroy(self, instance):
+        with deleting_scores(Score.objects.filter(exam_subject__subject=instance)):
+            instance.delete()
+
 
 # Exam ViewSet
-class ExamViewSet(viewsets.ModelViewSet):
+class ExamViewSet(ReplicaReadMixin, QueryPlanMixin, viewsets.ModelViewSet):
     serializer_class = ExamSerializer
     permission_classes = [IsAuthenticated]
+    replica_actions = ('export', 'statistics')
+    query_plan = {
+        'select_related': ('class_instance__teacher__user', 'teacher__user'),
+    }
+    query_plans = {'destroy': {}, 'statistics': {}}
 
     def get_queryset(self):
         if self.request.user.is_staff:
             return Exam.objects.all()
-        return Exam.objects.filter(teacher__user=self.request.user)
+        return Exam.objects.filter(teacher_id=get_request_teacher_id(self.request))
+
+    def perform_destroy(self, instance):
+        with deleting_scores(Score.objects.filter(exam_subject__exam=instance)):
+            instance.delete()
+
+    @action(detail=True, methods=['get'])
+    def export(self, request, pk=None):
+        """Stream the exam's marksheet (?type=csv|xlsx)."""
+        exam = self.get_object()
+        serializer = ExportRequestSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        response = export_exam(exam, serializer.validated_data['type'])
+        if not request.user.is_staff:
+            record_download(exam.teacher_id)
+        return response
+
+    @action(detail=True, methods=['get'])
+    def statistics(self, request, pk=None):
+        """Per-subject mean, median, spread, percentiles and grade counts of the exam's marks."""
+        exam = self.get_object()
+        scheme = get_grading_scheme(request.user.id)
+        return Response(get_exam_statistics(exam.id, scheme), status=status.HTTP_200_OK)
 
 
 # ExamSubject ViewSet
-class ExamSubjectViewSet(viewsets.ModelViewSet):
+class ExamSubjectViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     serializer_class = ExamSubjectSerializer
     permission_classes = [IsAuthenticated]
+    query_plan = {
+        'select_related': (
+            'exam__class_instance__teacher__user',
+            'exam__teacher__user',
+            'subject',
+        ),
+    }
 
     def get_queryset(self):
         if self.request.user.is_staff:
             return ExamSubject.objects.all()
-        return ExamSubject.objects.filter(exam__teacher__user=self.request.user)
+        return ExamSubject.objects.filter(exam__teacher_id=get_request_teacher_id(self.request))
+
+    def perform_destroy(self, instance):
+        with deleting_scores(instance.scores.all()):
+            instance.delete()
 
 
 # Student ViewSet
-class StudentViewSet(viewsets.ModelViewSet):
+class StudentViewSet(ResponseCacheMixin, QueryPlanMixin, viewsets.ModelViewSet):
     serializer_class = StudentSerializer
     permission_classes = [IsAuthenticated]
+    query_plan = {
+        'select_related': ('class_instance__teacher__user',),
+        'prefetch_related': ('subjects',),
+    }
+    query_plans = {'destroy': {}, 'progress': {}}
 
     def get_queryset(self):
         if self.request.user.is_staff:
             return Student.objects.all()
-        return Student.objects.filter(class_instance__teacher__user=self.request.user)
+        return Student.objects.filter(class_instance__teacher_id=get_request_teacher_id(self.request))
+
+    def perform_destroy(self, instance):
+        with deleting_scores(instance.scores.all()):
+            instance.delete()
+
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_register(self, request):
+        """Create students (and optionally their scores) from a CSV/XLSX register."""
+        serializer = RegisterImportSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+
+        classes = Class.objects.all()
+        if not request.user.is_staff:
+            classes = classes.filter(teacher_id=get_request_teacher_id(request))
+        school_class = get_object_or_404(classes, pk=params['class_instance'])
+        exam = None
+        if 'exam' in params:
+            exam = get_object_or_404(Exam, pk=params['exam'], class_instance=school_class)
+
+        report = import_register(params['file'], school_class, exam)
+        return Response(report, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['get'], url_path='report-card')
+    def report_card(self, request, pk=None):
+        """Download one student's PDF report card for a term."""
+        student = self.get_object()
+        serializer = TermSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+
+        card, = collect_cards(
+            student.class_instance, student_ids=[student.id], **serializer.validated_data
+        )
+        path, = render_cards([card])
+        if not request.user.is_staff:
+            record_download(student.class_instance.teacher_id)
+        return FileResponse(
+            open(path, 'rb'), as_attachment=True, filename=card_filename(card),
+            content_type='application/pdf',
+        )
+
+    @action(detail=True, methods=['get'])
+    def progress(self, request, pk=None):
+        """The student's term-by-term results per subject, with deltas and trends."""
+        student = self.get_object()
+        return Response(student_progress(student.id), status=status.HTTP_200_OK)
 
 
 # Score ViewSet
-class ScoreViewSet(viewsets.ModelViewSet):
+class ScoreViewSet(GradingSchemeMixin, QueryPlanMixin, viewsets.ModelViewSet):
     serializer_class = ScoreSerializer
     permission_classes = [IsAuthenticated]
+    query_plan = {
+        'select_related': (
+            'student__class_instance__teacher__user',
+            'exam_subject__subject',
+        ),
+        # Joining the exam side as well takes the query past the join
+        # orders SQLite's planner searches, so exams are fetched apart
+        'prefetch_related': (
+            'student__subjects',
+            ('exam_subject__exam', {
+                'select_related': ('class_instance__teacher__user', 'teacher__user'),
+            }),
+        ),
+    }
 
     def get_queryset(self):
+        # Grades are marks out of the exam subject's maximum
+        scores = Score.objects.annotate(max_marks=F('exam_subject__max_marks'))
         if self.request.user.is_staff:
-            return Score.objects.all()
-        return Score.objects.filter(student__class_instance__teacher__user=self.request.user)
+            return scores
+        return scores.filter(student__class_instance__teacher_id=get_request_teacher_id(self.request))
+
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk(self, request):
+        """Upsert a whole exam's marks matrix in one request."""
+        serializer = BulkScoreSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        exams = Exam.objects.all()
+        if not request.user.is_staff:
+            exams = exams.filter(class_instance__teacher_id=get_request_teacher_id(request))
+        exam = get_object_or_404(exams, pk=serializer.validated_data['exam'])
+
+        report = bulk_upsert_scores(exam, serializer.validated_data['scores'])
+        return Response(report, status=status.HTTP_200_OK)
 
 
 # Result ViewSet
-class ResultViewSet(viewsets.ModelViewSet):
+class ResultViewSet(GradingSchemeMixin, ReplicaReadMixin, QueryPlanMixin, viewsets.ModelViewSet):
     serializer_class = ResultSerializer
     permission_classes = [IsAuthenticated]
+    query_plan = {
+        'select_related': ('student__class_instance__teacher__user', 'subject'),
+        'prefetch_related': ('student__subjects',),
+    }
 
     def get_queryset(self):
         if self.request.user.is_staff:
             return Result.objects.all()
-        return Result.objects.filter(student__class_instance__teacher__user=self.request.user)
+        return Result.objects.filter(student__class_instance__teacher_id=get_request_teacher_id(self.request))
 
 
 # StudentReport ViewSet
-class StudentReportViewSet(viewsets.ModelViewSet):
+class StudentReportViewSet(GradingSchemeMixin, ReplicaReadMixin, QueryPlanMixin, viewsets.ModelViewSet):
     serializer_class = StudentReportSerializer
     permission_classes = [IsAuthenticated]
+    query_plan = {
+        'select_related': ('student__class_instance__teacher__user',),
+        'prefetch_related': ('student__subjects',),
+    }
 
     def get_queryset(self):
+        stale = StaleReport.objects.filter(
+            school_class=OuterRef('student__class_instance'),
+            term=OuterRef('term'), year=OuterRef('year'),
+        )
+        reports = StudentReport.objects.annotate(is_stale=Exists(stale))
         if self.request.user.is_staff:
-            return StudentReport.objects.all()
-        return StudentReport.objects.filter(student__class_instance__teacher__user=self.request.user)
+            return reports
+        return reports.filter(student__class_instance__teacher_id=get_request_teacher_id(self.request))
 
 
 # ClassPerformance ViewSet
-class ClassPerformanceViewSet(viewsets.ModelViewSet):
+class ClassPerformanceViewSet(ResponseCacheMixin, ReplicaReadMixin, QueryPlanMixin, viewsets.ModelViewSet):
     serializer_class = ClassPerformanceSerializer
     permission_classes = [IsAuthenticated]
+    query_plan = {
+        'select_related': (
+            'school_class__teacher__user',
+            'top_performer__class_instance__teacher__user',
+        ),
+        'prefetch_related': ('top_performer__subjects',),
+    }
 
     def get_queryset(self):
         if self.request.user.is_staff:
             return ClassPerformance.objects.all()
-        return ClassPerformance.objects.filter(school_class__teacher__user=self.request.user)
+        return ClassPerformance.objects.filter(school_class__teacher_id=get_request_teacher_id(self.request))
 
 
 # Subscription ViewSet
-class SubscriptionViewSet(viewsets.ModelViewSet):
+class SubscriptionViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     serializer_class = SubscriptionSerializer
     permission_classes = [IsAuthenticated]
+    query_plan = {
+        'select_related': ('teacher',),
+    }
 
     def get_queryset(self):
         if self.request.user.is_staff:
@@ -182,11 +524,35 @@ class SubscriptionViewSet(viewsets.ModelViewSet):
 
 
 # PaymentRecord ViewSet
-class PaymentRecordViewSet(viewsets.ModelViewSet):
+class PaymentRecordViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     serializer_class = PaymentRecordSerializer
     permission_classes = [IsAuthenticated]
+    query_plan = {
+        'select_related': ('teacher',),
+    }
 
     def get_queryset(self):
         if self.request.user.is_staff:
             return PaymentRecord.objects.all()
-        return PaymentRecord.objects.filter(teacher=self.request.user)
\ No newline at end of file
+        return PaymentRecord.objects.filter(teacher=self.request.user)
+
+
+# GradingScheme ViewSet
+# Teachers read their school's scheme and the default. Only staff edit them:
+# a teacher's school name is their own free text, so it cannot grant access.
+class IsAdminOrReadOnly(permissions.BasePermission):
+    def has_permission(self, request, view):
+        return request.method in permissions.SAFE_METHODS or request.user.is_staff
+
+
+class GradingSchemeViewSet(QueryPlanMixin, viewsets.ModelViewSet):
+    serializer_class = GradingSchemeSerializer
+    permission_classes = [IsAuthenticated, IsAdminOrReadOnly]
+
+    def get_queryset(self):
+        schemes = GradingScheme.objects.prefetch_related('bands')
+        if self.request.user.is_staff:
+            return schemes
+        # The teacher's own school's scheme and the default
+        school = Subquery(Teacher.objects.filter(user=self.request.user).values('school_name')[:1])
+        return schemes.filter(Q(school_name='') | Q(school_name=school))